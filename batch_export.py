@@ -0,0 +1,189 @@
+""" Headless show export
+
+    blender -b show.blend --python batch_export.py -- --output /path/to/show [options]
+
+Samples every drone of the scene in windows of --window position ticks, validates
+speeds and distances and writes <output>_<N>.bin files. Exits with 1 if the show
+has violations, 2 on errors.
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+
+import bpy
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sampler import ShowSampler, WINDOW_TICKS
+from separation import WindowedSeparation, GRID_DRONE_THRESHOLD
+from kinematics import KinematicsAccumulator, limits_from_params, load_config, NAV_SYSTEMS
+from export_pool import default_workers
+from show_bin import HEADER_FORMATS, MAX_POINTS, ShowStreamWriter, select_show_version, show_path, v3_firmware
+
+EXIT_OK = 0
+EXIT_VIOLATIONS = 1
+EXIT_ERROR = 2
+
+
+def parse_args(argv):
+    # Blender passes its own arguments before "--"
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="blender -b show.blend --python batch_export.py --",
+                                     description="Export GeoScan show binaries without the Blender UI")
+    parser.add_argument("--output", required=True,
+                        help="output path prefix, files are written as <output>_<N>.bin")
+    parser.add_argument("--blend", help="open this .blend instead of the one loaded by blender")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"),
+                        help="config.json with navigation system params")
+    parser.add_argument("--nav-system", choices=NAV_SYSTEMS, default="lps")
+    parser.add_argument("--position-freq", type=int, default=2)
+    parser.add_argument("--color-freq", type=int, default=5)
+    parser.add_argument("--x-offset", type=float, default=0.0)
+    parser.add_argument("--y-offset", type=float, default=0.0)
+    parser.add_argument("--z-offset", type=float, default=0.0)
+    parser.add_argument("--lat", type=float, default=60.010663, help="start point latitude (gps)")
+    parser.add_argument("--lon", type=float, default=30.347196, help="start point longitude (gps)")
+    parser.add_argument("--name", default="Pioneer", help="drone name filter, empty string disables it")
+    parser.add_argument("--min-distance", type=float, default=3.0)
+    parser.add_argument("--speed-limit", type=float, default=None, help="cap for the horizontal speed limit")
+    parser.add_argument("--grid-threshold", type=int, default=GRID_DRONE_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None, help="threads writing binaries")
+    parser.add_argument("--window", type=int, default=WINDOW_TICKS,
+                        help="position ticks sampled, checked and written at once, bounds the memory used")
+    parser.add_argument("--format-version", type=int, choices=sorted(HEADER_FORMATS), default=None,
+                        help="show binary format, by default 2 or 3 for shows longer than the version 2 layout, "
+                             "3 only while the config names a firmware reading it")
+    parser.add_argument("--compact", action="store_true",
+                        help="centimetre delta positions and run-length colors, implies format version 3")
+    parser.add_argument("--skip-validation", action="store_true")
+    parser.add_argument("--force", action="store_true", help="write binaries even if validation fails")
+    args = parser.parse_args(argv)
+    if args.window < 1:
+        parser.error("--window must be positive")
+    return args
+
+
+def get_pioneers(view_layer, name):
+    pioneers = []
+    for obj in view_layer.objects:
+        if not obj.visible_get():
+            continue
+        if name and name.lower() not in obj.name.lower():
+            continue
+        pioneers.append(obj)
+    return pioneers
+
+
+def report_violations(names, frames, kinematics, separation):
+    print(kinematics.format_table(names))
+    violations = 0
+    for (drone, kind, tick, value, limit) in kinematics.violations():
+        print("Speed %s %.2f m/s > %.2f m/s on frame %d on drone %s" % (kind, value, limit, frames[tick],
+                                                                        names[drone]))
+        violations += 1
+
+    sampled = separation.sampled
+    for (first, second, tick, distance) in sampled.pairs():
+        print("Distance %.2f m on frame %d on drones %s & %s" % (distance, frames[tick], names[first],
+                                                                 names[second]))
+        violations += 1
+    sampled_pairs = set((first, second) for (first, second, _, _) in sampled.pairs())
+    for (first, second, tick, distance) in separation.swept.pairs():
+        if (first, second) in sampled_pairs:
+            continue
+        print("Distance %.2f m between frames %d and %d on drones %s & %s" % (
+            distance, frames[tick], frames[tick + 1], names[first], names[second]))
+        violations += 1
+    return violations
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.blend:
+        bpy.ops.wm.open_mainfile(filepath=args.blend)
+    scene = bpy.context.scene
+    gps = args.nav_system == "gps"
+    offset = (0.0, 0.0, 0.0) if gps else (args.x_offset, args.y_offset, args.z_offset)
+    origin = [args.lat, args.lon] if gps else [args.x_offset, args.y_offset]
+
+    pioneers = get_pioneers(bpy.context.view_layer, args.name)
+    if not pioneers:
+        print("No drones found in %s" % bpy.data.filepath)
+        return EXIT_ERROR
+    names = [pioneer.name for pioneer in pioneers]
+    sampler = ShowSampler(scene, pioneers, args.position_freq, args.color_freq, offset)
+    position_frames, color_frames = sampler.frames()
+    v3_fw = v3_firmware(load_config(args.config))
+    if (args.compact or args.format_version == 3) and v3_fw is None:
+        print("Format version 3 is not read by any firmware yet")
+        return EXIT_ERROR
+    try:
+        version = 3 if args.compact else args.format_version or select_show_version(None, len(position_frames),
+                                                                                     v3_fw)
+    except ValueError as e:
+        print(e)
+        return EXIT_ERROR
+    # Colors of versions 1 and 2 are read at a fixed offset after MAX_POINTS points
+    if version in MAX_POINTS and len(position_frames) > MAX_POINTS[version]:
+        print("Show of %d points does not fit version %d format" % (len(position_frames), version))
+        return EXIT_ERROR
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    # Every window is checked and appended to the binaries, so only one window of the show is held in memory
+    writers = [ShowStreamWriter(show_path(args.output, pioneer_id, version), len(position_frames), len(color_frames),
+                                args.position_freq, args.color_freq, origin, version, args.compact)
+               for pioneer_id in range(1, len(pioneers) + 1)]
+    kinematics = None
+    separation = WindowedSeparation(args.min_distance, args.grid_threshold)
+    faults = {}
+    print("Sampling %d drones of %s" % (len(pioneers), bpy.data.filepath))
+    try:
+        for window in sampler.windows(args.window):
+            for (name, frame) in window.faults:
+                faults.setdefault(name, frame)
+            if not args.skip_validation:
+                if kinematics is None:
+                    params = load_config(args.config)["params"][args.nav_system]
+                    limits = limits_from_params(params, horizontal_limit=args.speed_limit)
+                    kinematics = KinematicsAccumulator(len(pioneers), window.position_period, limits)
+                kinematics.add(window.positions)
+                separation.add(window.positions.transpose(1, 0, 2))
+            for drone, writer in enumerate(writers):
+                writer.write(window.positions[drone], window.colors[drone])
+    except Exception as e:
+        # Blender exits with 0 on exceptions raised by --python scripts
+        for writer in writers:
+            writer.discard()
+        print("Failed to export the show: %s" % e)
+        return EXIT_ERROR
+
+    for (name, frame) in faults.items():
+        print("No color found on %s on frame %d" % (name, frame))
+    violations = 0
+    if kinematics is not None:
+        violations = report_violations(names, position_frames, kinematics, separation)
+    if faults or (violations and not args.force):
+        for writer in writers:
+            writer.discard()
+        if faults:
+            return EXIT_ERROR
+        print("Show has %d violations, nothing written" % violations)
+        return EXIT_VIOLATIONS
+
+    # Compact shows are encoded on close
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers or default_workers()) as executor:
+        futures = [executor.submit(writer.close) for writer in writers]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    for error in errors:
+        print("Failed to write show binary: %s" % error)
+    if errors:
+        for writer in writers:
+            writer.discard()
+        return EXIT_ERROR
+    print("Written %d show binaries to %s" % (len(writers), output_dir))
+    return EXIT_VIOLATIONS if violations else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,125 @@
+import threading
+
+from export_cache import drone_fingerprint, cacheable
+
+# Depsgraph updates arriving within this many seconds are handled at once
+COALESCE_INTERVAL = 0.5
+# ID types a drone trajectory or color may depend on, updates of the rest are ignored
+TRACKED_TYPES = ("Object", "Material", "Action", "Curve", "Mesh", "Scene")
+
+
+def _actions(id_data):
+    anim = getattr(id_data, "animation_data", None)
+    if anim is None:
+        return []
+    actions = [anim.action] + [strip.action for track in anim.nla_tracks for strip in track.strips]
+    return [action for action in actions if action is not None]
+
+
+def dependencies(pioneer):
+    """ (type, name) keys of the IDs the sampled drone depends on """
+    keys = set()
+    pending = [pioneer]
+    seen = set()
+    while pending:
+        obj = pending.pop()
+        if obj is None or obj.name in seen:
+            continue
+        seen.add(obj.name)
+        keys.add(("Object", obj.name))
+        keys.update(("Action", action.name) for action in _actions(obj))
+        pending.append(obj.parent)
+        for constraint in obj.constraints:
+            target = getattr(constraint, "target", None)
+            pending.append(target)
+            data = getattr(target, "data", None)
+            if data is not None:
+                # Curves of Follow Path and Clamp To, meshes of Shrinkwrap
+                keys.add((type(data).__name__, data.name))
+                keys.update(("Action", action.name) for action in _actions(data))
+        anim = obj.animation_data
+        if anim is not None:
+            for fcurve in anim.drivers:
+                for variable in fcurve.driver.variables:
+                    for target in variable.targets:
+                        if hasattr(target.id, "matrix_world"):
+                            pending.append(target.id)
+                        elif target.id is not None:
+                            # Custom properties of the scene and other IDs
+                            keys.add((type(target.id).__name__, target.id.name))
+                            keys.update(("Action", action.name) for action in _actions(target.id))
+        material = obj.active_material
+        if material is not None:
+            keys.add(("Material", material.name))
+            keys.update(("Action", action.name) for action in _actions(material))
+    return keys
+
+
+class ChangeTracker:
+    """ Fingerprints of drones kept current from depsgraph updates
+
+        Updates are collected as they come and resolved to drones once a burst is over, only drones depending on
+        an updated object, material, action, curve, mesh or scene are fingerprinted again. Drones with a volatile
+        fingerprint depend on data that is not followed and are checked on every update.
+        schedule: runs a callback after the given delay on the thread owning bpy data
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.scheduled = False
+        self.fingerprints = {}
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            self.fingerprints.clear()
+
+    def collect(self, updates, flush):
+        """ Remembers updated IDs, flush is called with no arguments once the burst is over """
+        keys = set()
+        for update in updates:
+            id_data = getattr(update.id, "original", update.id)
+            id_type = type(id_data).__name__
+            if id_type in TRACKED_TYPES:
+                keys.add((id_type, id_data.name))
+        if not keys:
+            return
+        with self.lock:
+            self.pending.update(keys)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.schedule(flush, COALESCE_INTERVAL)
+
+    def flush(self, pioneers):
+        """ Names of the drones whose fingerprint changed or is not known since the last flush """
+        with self.lock:
+            pending, self.pending = self.pending, set()
+            self.scheduled = False
+        changed = set()
+        if not pending:
+            return changed
+        for pioneer in pioneers:
+            known = self.fingerprints.get(pioneer.name)
+            if (known is None or cacheable(known[1])) and not dependencies(pioneer) & pending:
+                continue
+            if known is None:
+                changed.add(pioneer.name)
+                continue
+            settings, fingerprint = known
+            current = drone_fingerprint(pioneer, settings)
+            if current != fingerprint:
+                self.fingerprints[pioneer.name] = (settings, current)
+                changed.add(pioneer.name)
+        return changed
+
+    def fingerprint(self, pioneer, settings):
+        """ drone_fingerprint, hashed again only if the drone changed since the last call """
+        known = self.fingerprints.get(pioneer.name)
+        if known is not None and known[0] == settings and cacheable(known[1]):
+            return known[1]
+        fingerprint = drone_fingerprint(pioneer, settings)
+        self.fingerprints[pioneer.name] = (settings, fingerprint)
+        return fingerprint
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+CACHE_DIRECTORY = ".pioneer_cache"
+CACHE_VERSION = 1
+
+# Object channels whose static (not animated) values define the drone transform
+TRANSFORM_PROPS = ("location", "rotation_mode", "rotation_euler", "rotation_quaternion", "rotation_axis_angle",
+                   "scale", "delta_location", "delta_rotation_euler", "delta_rotation_quaternion", "delta_scale")
+# Fingerprints of drones depending on data that is not hashed start with this, they never match a stored one
+VOLATILE_PREFIX = "volatile-"
+
+
+class _Untracked(Exception):
+    """ The drone depends on data the fingerprint does not follow """
+
+
+def _update(h, *values):
+    h.update(repr(values).encode())
+
+
+def _value(value):
+    try:
+        return tuple(_value(item) for item in value) if not isinstance(value, str) else value
+    except TypeError:
+        return value
+
+
+def _hash_fcurve(h, fcurve):
+    points = fcurve.keyframe_points
+    count = len(points)
+    _update(h, fcurve.data_path, fcurve.array_index, count, fcurve.mute, fcurve.extrapolation)
+    for modifier in fcurve.modifiers:
+        _hash_rna(h, modifier, set(), ())
+    if count:
+        values = np.empty(count * 2, dtype=np.float32)
+        for attribute in ("co", "handle_left", "handle_right"):
+            points.foreach_get(attribute, values)
+            h.update(values.tobytes())
+        _update(h, [(point.interpolation, point.easing) for point in points])
+
+
+def _animated_paths(id_data):
+    anim = getattr(id_data, "animation_data", None)
+    paths = set()
+    if anim is None:
+        return paths
+    actions = [anim.action] + [strip.action for track in anim.nla_tracks for strip in track.strips]
+    for action in actions:
+        if action is not None:
+            paths.update(fcurve.data_path for fcurve in getattr(action, "fcurves", ()))
+    paths.update(fcurve.data_path for fcurve in anim.drivers)
+    return paths
+
+
+def _hash_animation(h, id_data, seen):
+    anim = getattr(id_data, "animation_data", None)
+    if anim is None:
+        _update(h, None)
+        return
+    action = anim.action
+    _update(h, action.name if action else None, anim.action_blend_type, anim.action_extrapolation,
+            anim.action_influence)
+    if action is not None:
+        for fcurve in getattr(action, "fcurves", ()):
+            _hash_fcurve(h, fcurve)
+    for fcurve in anim.drivers:
+        _hash_fcurve(h, fcurve)
+        driver = fcurve.driver
+        _update(h, driver.type, driver.expression)
+        for variable in driver.variables:
+            for target in variable.targets:
+                _update(h, variable.name, variable.type, target.data_path, target.transform_type,
+                        target.transform_space, target.bone_target)
+                if target.id is not None:
+                    _hash_id(h, target.id, seen)
+                    # Custom and other properties read from any ID, animated ones are hashed with its animation
+                    if target.data_path:
+                        try:
+                            _update(h, _value(target.id.path_resolve(target.data_path)))
+                        except ValueError:
+                            _update(h, None)
+    for track in anim.nla_tracks:
+        _update(h, track.name, track.mute, track.is_solo)
+        for strip in track.strips:
+            _hash_rna(h, strip, seen, ())
+            if strip.action is not None:
+                for fcurve in getattr(strip.action, "fcurves", ()):
+                    _hash_fcurve(h, fcurve)
+
+
+def _hash_rna(h, data, seen, animated):
+    """ Every editable property of an RNA struct, except the animated ones """
+    for prop in data.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier == "rna_type" or prop.type == 'COLLECTION' or prop.is_readonly:
+            continue
+        try:
+            if data.path_from_id(identifier) in animated:
+                continue
+        except (ValueError, TypeError):
+            pass
+        value = getattr(data, identifier, None)
+        if prop.type == 'POINTER':
+            if value is not None and hasattr(value, "matrix_world"):
+                _hash_id(h, value, seen)
+            else:
+                _update(h, identifier, getattr(value, "name", None))
+            continue
+        _update(h, identifier, _value(value))
+
+
+def _hash_points(h, points, attributes, size):
+    values = np.empty(len(points) * size, dtype=np.float32)
+    for attribute in attributes:
+        points.foreach_get(attribute, values)
+        h.update(values.tobytes())
+
+
+def _hash_target_data(h, target, seen):
+    """ Curve or mesh of a constraint target, paths and surfaces of Follow Path, Clamp To, Shrinkwrap and others """
+    data = target.data
+    if data is None:
+        return
+    key = (type(data).__name__, data.name)
+    _update(h, key)
+    if key in seen:
+        return
+    seen.add(key)
+    if len(target.modifiers) or getattr(data, "shape_keys", None) is not None:
+        raise _Untracked(target.name)
+    if key[0] == "Curve":
+        _hash_rna(h, data, seen, _animated_paths(data))
+        _hash_animation(h, data, seen)
+        for spline in data.splines:
+            _hash_rna(h, spline, seen, ())
+            _hash_points(h, spline.bezier_points, ("co", "handle_left", "handle_right"), 3)
+            _hash_points(h, spline.points, ("co",), 4)
+            for points in (spline.bezier_points, spline.points):
+                _hash_points(h, points, ("radius", "tilt"), 1)
+    elif key[0] == "Mesh":
+        _hash_points(h, data.vertices, ("co",), 3)
+    else:
+        raise _Untracked(target.name)
+
+
+def _hash_id(h, id_data, seen):
+    key = (type(id_data).__name__, id_data.name)
+    _update(h, key)
+    if key in seen:
+        return
+    seen.add(key)
+    if not hasattr(id_data, "matrix_world"):
+        _hash_animation(h, id_data, seen)
+        return
+    animated = _animated_paths(id_data)
+    for identifier in TRANSFORM_PROPS:
+        if identifier not in animated:
+            _update(h, identifier, _value(getattr(id_data, identifier)))
+    _update(h, id_data.parent_type, id_data.parent_bone, _value(id_data.matrix_parent_inverse))
+    _hash_animation(h, id_data, seen)
+    for constraint in id_data.constraints:
+        _update(h, constraint.type)
+        _hash_rna(h, constraint, seen, animated)
+        target = getattr(constraint, "target", None)
+        if target is not None:
+            _hash_target_data(h, target, seen)
+    if id_data.parent is not None:
+        _hash_id(h, id_data.parent, seen)
+    material = id_data.active_material
+    if material is not None:
+        material_animated = _animated_paths(material)
+        _update(h, material.name)
+        if "diffuse_color" not in material_animated:
+            _update(h, _value(material.diffuse_color))
+        _hash_animation(h, material, seen)
+
+
+def drone_fingerprint(pioneer, settings):
+    """ Hash of everything the sampled arrays of a drone depend on
+
+        settings: sampling settings, see ShowSampler.settings
+        Drones depending on data that is not hashed get a new volatile fingerprint every time.
+    """
+    h = hashlib.sha1()
+    _update(h, CACHE_VERSION, settings)
+    try:
+        _hash_id(h, pioneer, set())
+    except _Untracked:
+        return VOLATILE_PREFIX + uuid.uuid4().hex
+    return h.hexdigest()
+
+
+def cacheable(fingerprint):
+    return not fingerprint.startswith(VOLATILE_PREFIX)
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ExportCache:
+    """ Sampled arrays, emitted binaries and validation state of drones, stored next to the export """
+
+    def __init__(self, filepath):
+        filepath = os.path.abspath(filepath)
+        self.directory = os.path.join(os.path.dirname(filepath), CACHE_DIRECTORY)
+        self.index_path = os.path.join(self.directory, (os.path.basename(filepath) or "show") + ".json")
+        self.index = {"version": CACHE_VERSION, "drones": {}, "validation": {}}
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index.get("version") == CACHE_VERSION:
+                self.index = index
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def drones(self):
+        return self.index["drones"]
+
+    def _arrays_path(self, name):
+        return os.path.join(self.directory, hashlib.sha1(name.encode()).hexdigest() + ".npz")
+
+    def cached(self, name, fingerprint):
+        entry = self.drones.get(name)
+        return entry is not None and entry.get("fingerprint") == fingerprint and \
+            os.path.exists(self._arrays_path(name))
+
+    def load(self, name):
+        with np.load(self._arrays_path(name)) as data:
+            return data["positions"], data["colors"]
+
+    def store(self, name, fingerprint, positions, colors):
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(self._arrays_path(name), positions=positions, colors=colors)
+        entry = self.drones.setdefault(name, {})
+        if entry.get("fingerprint") != fingerprint:
+            entry.clear()
+        entry["fingerprint"] = fingerprint
+
+    def bin_current(self, name, fingerprint, path, origin, version=2, compact=False):
+        entry = self.drones.get(name)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return False
+        info = entry.get("bin")
+        if not info or info["path"] != path or info["origin"] != list(origin) or info["version"] != version or \
+                info.get("compact", False) != compact:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != info["size"]:
+            return False
+        return stat.st_mtime_ns == info["mtime"] or _file_digest(path) == info["sha1"]
+
+    def store_bin(self, name, path, origin, version=2, compact=False):
+        entry = self.drones.setdefault(name, {})
+        stat = os.stat(path)
+        entry["bin"] = {"path": path, "origin": list(origin), "version": version, "compact": compact,
+                        "sha1": _file_digest(path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def validated(self, params_key):
+        """ Fingerprints of drones that passed the last validation with the same params """
+        validation = self.index["validation"]
+        if validation.get("params") != params_key:
+            return {}
+        return validation.get("drones", {})
+
+    def store_validation(self, params_key, names, fingerprints):
+        self.index["validation"] = {"params": params_key, "drones": dict(zip(names, fingerprints))}
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_path, self.index_path)
+
+
+def sample_with_cache(sampler, cache, fingerprint=drone_fingerprint):
+    """ Samples only drones whose fingerprint changed, the rest is loaded from the cache
+
+        fingerprint: function of a drone and sampling settings, ChangeTracker.fingerprint skips unchanged drones
+        Returns trajectories, fingerprints of all drones and indices of re-sampled drones.
+    """
+    settings = sampler.settings()
+    fingerprints = [fingerprint(pioneer, settings) for pioneer in sampler.pioneers]
+    trajectories = sampler.trajectories()
+    dirty = []
+    for drone, name in enumerate(trajectories.names):
+        if cache.cached(name, fingerprints[drone]):
+            try:
+                trajectories.positions[drone], trajectories.colors[drone] = cache.load(name)
+                continue
+            except (OSError, ValueError, KeyError):
+                pass
+        dirty.append(drone)
+    sampler.sample(dirty, trajectories)
+    if not trajectories.faults:
+        for drone in dirty:
+            if not cacheable(fingerprints[drone]):
+                continue
+            cache.store(trajectories.names[drone], fingerprints[drone], trajectories.positions[drone],
+                        trajectories.colors[drone])
+    return trajectories, fingerprints, dirty
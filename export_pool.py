@@ -0,0 +1,58 @@
+import concurrent.futures
+import os
+
+from show_bin import write_show
+
+
+def default_workers():
+    return min(8, os.cpu_count() or 1)
+
+
+class ShowWriterPool:
+    """ Encodes and writes show binaries of many drones in worker threads
+
+        Jobs get plain arrays only, so no bpy data is touched outside the main thread.
+        Threads are used instead of processes: NumPy copies and file writes release the GIL,
+        and spawning processes from inside Blender would start new Blender instances.
+    """
+
+    def __init__(self, max_workers=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or default_workers())
+        self.futures = []
+
+    def submit(self, filepath, drone_number, coords_array, colors_array, position_freq, color_freq, origin,
+               version=2, compact: bool = False):
+        future = self.executor.submit(write_show, filepath, drone_number, coords_array, colors_array, position_freq,
+                                      color_freq, origin, version, compact)
+        self.futures.append(future)
+        return future
+
+    @property
+    def total(self):
+        return len(self.futures)
+
+    @property
+    def done(self):
+        return sum(1 for future in self.futures if future.done())
+
+    @property
+    def finished(self):
+        return all(future.done() for future in self.futures)
+
+    def errors(self):
+        return [future.exception() for future in self.futures
+                if future.done() and not future.cancelled() and future.exception() is not None]
+
+    def paths(self):
+        return [future.result() for future in self.futures
+                if future.done() and not future.cancelled() and future.exception() is None]
+
+    def wait(self):
+        concurrent.futures.wait(self.futures)
+        self.shutdown()
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            for future in self.futures:
+                future.cancel()
+        self.executor.shutdown(wait=not cancel)
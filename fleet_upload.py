@@ -0,0 +1,160 @@
+import concurrent.futures
+import threading
+
+from loader import Loader, SerialMaster
+from show_bin import pack_show
+
+STEPS = ("connect", "params", "script", "show", "restart", "done")
+
+
+class FleetCancelled(Exception):
+    pass
+
+
+class BoardLink(Loader):
+    """ Loader of a single known port, sharing config and transfer tuning with the main loader """
+
+    def __init__(self, loader, port):
+        self._apply_config(loader.config)
+        self.transfer_tuner = loader.transfer_tuner
+        self.upload_ledger = loader.upload_ledger
+        self.port = port
+        serial_master = SerialMaster(self.connect_callback, self.disconnect_callback, self.ports_update_callback,
+                                     auto_connect=False, watch_ports=False, baudrate_cache=loader.baudrate_cache,
+                                     cache_path=loader.cache_path)
+        serial_master.port_ids = loader.serial_master.port_ids
+        self._init_link(auto_connect=False, serial_master=serial_master)
+
+    def connect(self):
+        self.serial_master.connect_serial(self.port)
+        return self.connected
+
+    def close(self):
+        self.serial_master.close_serial()
+
+    @staticmethod
+    def ports_update_callback():
+        pass
+
+
+class DroneUpload:
+    def __init__(self, port, board_number=None):
+        self.port = port
+        self.board_number = board_number
+        self.step = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.step == "done"
+
+
+class FleetUpload:
+    """ Uploads params, show script and show binary to the drones on every port at once
+
+        trajectories: sampled show, board N gets drone N - 1
+        keep_numbers: drones keep the board number stored on them, otherwise sorted ports get
+        consecutive numbers starting from first_board
+        compact: compact show encoding on boards reading format version 3
+    """
+
+    def __init__(self, loader, ports, trajectories, script_path, gps, origin, first_board=1,
+                 keep_numbers: bool = False, compact: bool = False):
+        self.loader = loader
+        self.trajectories = trajectories
+        self.script_path = script_path
+        self.gps = gps
+        self.origin = origin
+        self.compact = compact
+        self.jobs = [DroneUpload(port, None if keep_numbers else first_board + i)
+                     for i, port in enumerate(sorted(ports))]
+        self._claimed = set(job.board_number for job in self.jobs if job.board_number is not None)
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        # Every port is a separate link, so there is a thread per drone
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(self.jobs), 1))
+        self.futures = [self.executor.submit(self._run, job) for job in self.jobs]
+
+    @property
+    def total(self):
+        return len(self.jobs)
+
+    @property
+    def done(self):
+        return sum(1 for future in self.futures if future.done())
+
+    @property
+    def finished(self):
+        return all(future.done() for future in self.futures)
+
+    def succeeded(self):
+        return [job for job in self.jobs if job.succeeded]
+
+    def failed(self):
+        return [job for job in self.jobs if job.error is not None]
+
+    def wait(self):
+        concurrent.futures.wait(self.futures)
+        self.executor.shutdown()
+
+    def cancel(self):
+        self._cancel.set()
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _set_step(self, job, step):
+        if self._cancel.is_set():
+            raise FleetCancelled("Upload cancelled")
+        job.step = step
+
+    def _claim_board(self, job, link):
+        # Board number param is zero based
+        board_number = link.get_board_number() + 1
+        with self._lock:
+            if board_number in self._claimed:
+                raise Exception("Drone number %d is already used by another port" % board_number)
+            self._claimed.add(board_number)
+        job.board_number = board_number
+
+    def _run(self, job):
+        link = BoardLink(self.loader, job.port)
+        try:
+            self._set_step(job, "connect")
+            if not link.connect():
+                raise Exception("No Pioneer connected")
+            if link.get_ap_firmware_version() < link.actual_ap_fw_version:
+                raise Exception("Actual firmware version ({}) is higher than current ({})".format(
+                    link.actual_ap_fw_version, link.get_ap_firmware_version()))
+            if job.board_number is None:
+                self._claim_board(job, link)
+            if not 1 <= job.board_number <= len(self.trajectories):
+                raise Exception("Drone number %d exceeded drones amount of drones on scene" % job.board_number)
+
+            self._set_step(job, "params")
+            if self.gps:
+                link.upload_gps_params()
+            else:
+                link.upload_lps_params()
+
+            self._set_step(job, "script")
+            if not link.upload_lua_script(self.script_path):
+                raise Exception("Show script upload failed")
+            link.set_board_number(job.board_number - 1)
+
+            self._set_step(job, "show")
+            coords_array = self.trajectories.positions[job.board_number - 1]
+            colors_array = self.trajectories.colors[job.board_number - 1]
+            version = link.show_version(len(coords_array))
+            binary = pack_show(coords_array, colors_array, self.trajectories.position_freq,
+                               self.trajectories.color_freq, self.origin, version, self.compact and version == 3)
+            if not link.upload_bin(binary):
+                raise Exception("Show binary upload failed")
+
+            self._set_step(job, "restart")
+            link.restart_board()
+            job.step = "done"
+        except Exception as e:
+            job.error = e
+        finally:
+            link.close()
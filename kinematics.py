@@ -0,0 +1,163 @@
+import json
+
+import numpy as np
+
+NAV_SYSTEMS = ("gps", "lps")
+
+
+def load_config(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def limits_from_params(params, horizontal_limit=None, acceleration_limit=None):
+    """ Speed limits (m/s) of a navigation system from its config.json params """
+    horizontal = params["Copter_pos_vMax"]
+    if horizontal_limit is not None:
+        horizontal = min(horizontal, horizontal_limit)
+    return {
+        "horizontal": horizontal,
+        "up": params["Copter_pos_vUp"],
+        "down": params["Copter_pos_vDown"],
+        "acceleration": acceleration_limit,
+    }
+
+
+class KinematicsReport:
+    """ Per-drone velocity and acceleration of sampled trajectories checked against limits
+
+        velocity: (drones, ticks - 1, 3) m/s, interval i lies between ticks i and i + 1
+        acceleration: (drones, ticks - 2) m/s^2 magnitude, reached at tick i + 1
+    """
+
+    KINDS = ("horizontal", "up", "down", "acceleration")
+
+    def __init__(self, positions, period, limits):
+        positions = np.asarray(positions, dtype=np.float32)
+        self.period = period
+        self.limits = limits
+        self.velocity = np.diff(positions, axis=1) / period
+        self.acceleration = np.linalg.norm(np.diff(self.velocity, axis=1), axis=2) / period
+        vertical = self.velocity[..., 2]
+        self.values = {
+            "horizontal": np.linalg.norm(self.velocity[..., :2], axis=2),
+            "up": np.maximum(vertical, 0.0),
+            "down": np.maximum(-vertical, 0.0),
+            "acceleration": self.acceleration,
+        }
+
+    def __len__(self):
+        return self.velocity.shape[0]
+
+    def exceeded(self, kind):
+        """ Boolean (drones, samples) mask of samples above the limit of the given kind """
+        limit = self.limits.get(kind)
+        values = self.values[kind]
+        if limit is None:
+            return np.zeros(values.shape, dtype=bool)
+        return values > limit
+
+    def violations(self):
+        """ First violation of every drone and kind as (drone, kind, tick, value, limit) """
+        result = []
+        for kind in self.KINDS:
+            mask = self.exceeded(kind)
+            if not mask.size:
+                continue
+            drones = np.nonzero(mask.any(axis=1))[0]
+            for drone in drones.tolist():
+                sample = int(np.argmax(mask[drone]))
+                # Speeds are reported at the end of their interval, accelerations at their middle tick
+                result.append((drone, kind, sample + 1, float(self.values[kind][drone, sample]), self.limits[kind]))
+        result.sort(key=lambda violation: (violation[0], self.KINDS.index(violation[1])))
+        return result
+
+    def table(self, names):
+        """ One row per drone: name, max value of every kind and the number of exceeded samples """
+        rows = []
+        for drone, name in enumerate(names):
+            row = [name]
+            for kind in self.KINDS:
+                values = self.values[kind][drone]
+                row.append(float(values.max()) if values.size else 0.0)
+                row.append(int(self.exceeded(kind)[drone].sum()))
+            rows.append(row)
+        return rows
+
+    def format_table(self, names):
+        header = "%-24s" % "drone" + "".join("%14s%6s" % (kind, "n") for kind in self.KINDS)
+        lines = [header]
+        for row in self.table(names):
+            line = "%-24s" % row[0][:24]
+            for i in range(len(self.KINDS)):
+                line += "%14.2f%6d" % (row[1 + 2 * i], row[2 + 2 * i])
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class KinematicsAccumulator:
+    """ KinematicsReport of trajectories fed in consecutive windows of ticks
+
+        Only the last two ticks are kept between windows, maxima, counts and first violations are accumulated.
+    """
+
+    KINDS = KinematicsReport.KINDS
+
+    def __init__(self, drones, period, limits):
+        self.period = period
+        self.limits = limits
+        self.maxima = np.zeros((drones, len(self.KINDS)), dtype=np.float32)
+        self.counts = np.zeros((drones, len(self.KINDS)), dtype=np.int64)
+        self.first = np.full((drones, len(self.KINDS)), -1, dtype=np.int64)
+        self.first_values = np.zeros((drones, len(self.KINDS)), dtype=np.float32)
+        self.ticks = 0
+        self.tail = None
+
+    def __len__(self):
+        return self.maxima.shape[0]
+
+    def add(self, positions):
+        """ positions: (drones, ticks, 3) following the previously added ones """
+        positions = np.asarray(positions, dtype=np.float32)
+        tail_size = 0 if self.tail is None else self.tail.shape[1]
+        block = positions if self.tail is None else np.concatenate((self.tail, positions), axis=1)
+        report = KinematicsReport(block, self.period, self.limits)
+        # Sample i of block is sample base + i of the whole trajectory
+        base = self.ticks - tail_size
+        for k, kind in enumerate(self.KINDS):
+            # Samples lying entirely within the tail were counted with the previous window
+            skip = max(tail_size - (2 if kind == "acceleration" else 1), 0)
+            values = report.values[kind][:, skip:]
+            if not values.shape[1]:
+                continue
+            np.maximum(self.maxima[:, k], values.max(axis=1), out=self.maxima[:, k])
+            mask = report.exceeded(kind)[:, skip:]
+            self.counts[:, k] += mask.sum(axis=1)
+            found = (self.first[:, k] < 0) & mask.any(axis=1)
+            sample = np.argmax(mask, axis=1)
+            self.first[found, k] = base + skip + sample[found] + 1
+            self.first_values[found, k] = values[found, sample[found]]
+        self.ticks += positions.shape[1]
+        self.tail = block[:, -2:].copy()
+
+    def violations(self):
+        """ First violation of every drone and kind as (drone, kind, tick, value, limit) """
+        result = []
+        for drone, k in zip(*np.nonzero(self.first >= 0)):
+            kind = self.KINDS[k]
+            result.append((int(drone), kind, int(self.first[drone, k]), float(self.first_values[drone, k]),
+                           self.limits[kind]))
+        result.sort(key=lambda violation: (violation[0], self.KINDS.index(violation[1])))
+        return result
+
+    def table(self, names):
+        rows = []
+        for drone, name in enumerate(names):
+            row = [name]
+            for k in range(len(self.KINDS)):
+                row.append(float(self.maxima[drone, k]))
+                row.append(int(self.counts[drone, k]))
+            rows.append(row)
+        return rows
+
+    format_table = KinematicsReport.format_table
@@ -0,0 +1,158 @@
+import threading
+
+import numpy as np
+
+from kinematics import KinematicsReport
+from separation import SeparationViolations, find_separation_violations, find_swept_violations, \
+    GRID_DRONE_THRESHOLD
+
+SPEED_KINDS = ("horizontal", "up", "down")
+
+
+def _without(violations, drones):
+    """ Violations not involving any drone of the boolean mask """
+    keep = ~(drones[violations.first] | drones[violations.second])
+    return SeparationViolations(violations.ticks[keep], violations.first[keep], violations.second[keep],
+                                violations.distances[keep], violations.fractions[keep])
+
+
+class LiveResult:
+    """ Violations of the live validation, positions are in scene coordinates
+
+        segments: (n, 2, 3) float32 ends of position intervals exceeding a speed limit
+        links: (n, 2, 3) float32 positions of drone pairs at their closest approach
+    """
+
+    def __init__(self, names, segments, links, speeding, close):
+        self.names = names
+        self.segments = segments
+        self.links = links
+        self.speeding = speeding
+        self.close = close
+
+
+class LiveValidator:
+    """ Speed and separation checks of sampled positions in a worker thread
+
+        Only drones submitted since the last run are checked again, violations between the other drones are kept.
+        The worker checks a snapshot of the state taken under the lock and stores it back only if clear was not
+        called in between.
+        schedule: hands a callback over to the main thread, on_result is called there with a LiveResult
+    """
+
+    def __init__(self, schedule, on_result, grid_threshold=GRID_DRONE_THRESHOLD):
+        self.schedule = schedule
+        self.on_result = on_result
+        self.grid_threshold = grid_threshold
+        self.lock = threading.Lock()
+        self.requests = []
+        self.thread = None
+        self.generation = 0
+        self.names = []
+        self.positions = None
+        self.speeding = None
+        self.close = SeparationViolations.empty()
+
+    def submit(self, names, positions, period, limits, min_distance, offset, drones=None):
+        """ Checks positions (drones, ticks, 3) of the given drone indices, every drone of names by default """
+        with self.lock:
+            if drones is None:
+                # A full update makes the queued ones useless
+                self.requests.clear()
+            self.requests.append((list(names), positions, period, limits, min_distance, offset, drones))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def clear(self):
+        with self.lock:
+            self.requests.clear()
+            self.generation += 1
+            self.names = []
+            self.positions = None
+            self.speeding = None
+            self.close = SeparationViolations.empty()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                requests, self.requests = self.requests, []
+                if not requests:
+                    self.thread = None
+                    return
+                generation = self.generation
+                names, positions, speeding, close = self.names, self.positions, self.speeding, self.close
+            # Arrays of the stored state are copied before they are changed, so a stale check changes nothing
+            owned = False
+            checked = None
+            for request_names, request_positions, period, limits, min_distance, offset, drones in requests:
+                if drones is not None and (positions is None or request_names != names):
+                    # Rows of some drones are useless without the rest
+                    continue
+                if drones is None:
+                    names = request_names
+                    positions = np.array(request_positions, dtype=np.float32)
+                    speeding = np.zeros((len(names), max(positions.shape[1] - 1, 0)), dtype=bool)
+                    close = SeparationViolations.empty()
+                    checked = np.ones(len(names), dtype=bool)
+                    owned = True
+                    continue
+                if not owned:
+                    positions, speeding = positions.copy(), speeding.copy()
+                    owned = True
+                positions[drones] = request_positions
+                if checked is None:
+                    checked = np.zeros(len(names), dtype=bool)
+                checked[drones] = True
+            if checked is None:
+                continue
+            try:
+                result, close = self._check(names, positions, speeding, close, checked, period, limits,
+                                            min_distance, offset)
+            except Exception as e:
+                print("Live validation failed: {}".format(e))
+                continue
+            with self.lock:
+                if generation != self.generation:
+                    # Cleared while checking, the result is stale
+                    continue
+                self.names, self.positions, self.speeding, self.close = names, positions, speeding, close
+            self.schedule(lambda result=result: self.on_result(result))
+
+    def _check(self, names, positions, speeding, close, checked, period, limits, min_distance, offset):
+        """ LiveResult and the updated separation violations, speeding rows of checked drones are updated """
+        drones = np.nonzero(checked)[0]
+        kinematics = KinematicsReport(positions[drones], period, limits)
+        exceeded = np.zeros((len(drones), speeding.shape[1]), dtype=bool)
+        for kind in SPEED_KINDS:
+            exceeded |= kinematics.exceeded(kind)
+        speeding[drones] = exceeded
+
+        by_tick = positions.transpose(1, 0, 2)
+        close = SeparationViolations.concatenate([
+            _without(close, checked),
+            find_separation_violations(by_tick, min_distance, self.grid_threshold, only=checked),
+            find_swept_violations(by_tick, min_distance, self.grid_threshold, only=checked)])
+
+        offset = np.asarray(offset, dtype=np.float32)
+        drone, interval = np.nonzero(speeding)
+        segments = np.stack([positions[drone, interval], positions[drone, interval + 1]], axis=1) - offset
+        # Worst violation of every pair, swept ones lie between tick and tick + 1
+        worst = {}
+        for index, (_, first, second, distance) in enumerate(close):
+            known = worst.get((first, second))
+            if known is None or distance < close.distances[known]:
+                worst[(first, second)] = index
+        worst = np.array(sorted(worst.values()), dtype=np.int64)
+        ticks = close.ticks[worst]
+        following = np.minimum(ticks + 1, positions.shape[1] - 1)
+        fractions = close.fractions[worst][:, None]
+        links = np.zeros((len(worst), 2, 3), dtype=np.float32)
+        for end, drones_of_pair in enumerate((close.first[worst], close.second[worst])):
+            start = positions[drones_of_pair, ticks]
+            links[:, end] = start + (positions[drones_of_pair, following] - start) * fractions
+        links -= offset
+        speeding_names = [names[drone] for drone in np.nonzero(speeding.any(axis=1))[0].tolist()]
+        close_names = [(names[first], names[second]) for (first, second) in
+                       zip(close.first[worst].tolist(), close.second[worst].tolist())]
+        return LiveResult(names, segments.astype(np.float32), links, speeding_names, close_names), close
@@ -1,34 +1,93 @@
+import importlib.util
+import math
 import time
 import threading
 import struct
 import os
 import sys
-import glob
 import urllib.error
 import urllib.request
 import json
 import ssl
 import certifi
 import subprocess
-import os
+import zlib
+
+# Addon registration above this many seconds is reported as slowing Blender startup down
+REGISTER_BUDGET = 0.2
+
+
+def ensure_dependencies():
+    if importlib.util.find_spec("serial") is None:
+        if sys.platform.startswith('win'):
+            py_exec = os.path.join(sys.prefix, 'bin', 'python.exe')
+            target = os.path.join(sys.prefix, 'lib', 'site-packages')
+            subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pip', '-t', target])
+            subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pyserial', '-t', target])
+        else:
+            py_exec = str(sys.executable)
+            subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pip'])
+            subprocess.call([py_exec, "-m", "pip", "install", "pyserial"])
+        # find_spec cached the directory listings from before the install
+        importlib.invalidate_caches()
+
 
-if sys.platform.startswith('win'):
-    py_exec = os.path.join(sys.prefix, 'bin', 'python.exe')
-    target = os.path.join(sys.prefix, 'lib', 'site-packages')
-    subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pip', '-t', target])
-    subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pyserial', '-t', target])
-else:
-    py_exec = str(sys.executable)
-    modules = (subprocess.check_output([py_exec, "-m", "pip", "list"])).decode("UTF-8")
-    subprocess.call([py_exec, '-m', 'pip', 'install', '--upgrade', 'pip'])
-    if not ("pyserial" in modules):
-        subprocess.call([py_exec, "-m", "pip", "install", "pyserial"])
+ensure_dependencies()
 
 import proto
 import serial
+import serial.tools.list_ports
+
+try:
+    # Hotplug events on linux, ports are listed periodically without it
+    import pyudev
+except ImportError:
+    pyudev = None
+from show_bin import CONTROL_SEQUENCE, select_show_version, version_supported, v3_firmware
+from transfer_tuner import TransferTuner
+from upload_ledger import UploadLedger
 
 json_url = "https://storage.yandexcloud.net/pioneer.geoscan.aero/other/config.json"
 
+CONFIG_TIMEOUT = 5
+PORTS_POLL_INTERVAL = 1.0
+CONNECT_ATTEMPTS = 10
+PROBE_ATTEMPTS = 2
+
+
+class BaudrateCache:
+    """ Last baudrate each board connected at, keyed by USB serial number or port name """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.baudrates = {}
+        if path:
+            try:
+                with open(path, 'r') as f:
+                    self.baudrates = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def get(self, key):
+        with self.lock:
+            return self.baudrates.get(key)
+
+    def set(self, key, baudrate):
+        with self.lock:
+            if self.baudrates.get(key) == baudrate:
+                return
+            self.baudrates[key] = baudrate
+            if not self.path:
+                return
+            try:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(self.baudrates, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print("Failed to save baudrates: {}".format(e))
+
 
 class SerialMaster:
     baudrate = None
@@ -63,16 +122,37 @@ class SerialMaster:
             self._tstate_lock.release()
             self._stop()
 
-    def __init__(self, connect_callback, disconnect_callback, ports_update_callback, auto_connect: bool = True):
+    def __init__(self, connect_callback, disconnect_callback, ports_update_callback, auto_connect: bool = True,
+                 watch_ports: bool = True, usb_ids=None, baudrate_cache=None, cache_path=None):
         self.connect_callback = connect_callback
         self.disconnect_callback = disconnect_callback
         self.ports_update_callback = ports_update_callback
         self.auto_connect = auto_connect
+        # (vid, pid) pairs of boards, any USB serial device if empty
+        self.usb_ids = set((int(vid, 16), int(pid, 16)) for (vid, pid) in usb_ids or [])
+        self.baudrate_cache = baudrate_cache or BaudrateCache()
+        # Component descriptions discovered by proto.Messenger are cached on disk here
+        self.cache_path = cache_path or os.path.join('cache')
+        # Port and baudrate of the open stream and messenger
+        self.session = None
+        # USB serial numbers of listed ports
+        self.port_ids = {}
 
         self.__is_working = True
+        self.__monitor = None
 
-        self.port_handler_thread = self.Thread(self.__port_handler)
-        self.port_handler_thread.start()
+        # Masters of a single known port (fleet upload) do not scan ports
+        self.port_handler_thread = None
+        if watch_ports:
+            if pyudev is not None:
+                try:
+                    self.__monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+                    self.__monitor.filter_by('tty')
+                    self.__monitor.start()
+                except Exception:
+                    self.__monitor = None
+            self.port_handler_thread = self.Thread(self.__port_handler)
+            self.port_handler_thread.start()
 
     def set_serial(self, serial):
         if not serial:
@@ -93,8 +173,9 @@ class SerialMaster:
         self.close_serial()
         try:
             self.stream = proto.SerialStream(serial, baudrate)
-            self.messenger = proto.Messenger(self.stream, os.path.join('cache'))
+            self.messenger = proto.Messenger(self.stream, self.cache_path)
             self.hub = self.messenger.hub
+            self.session = (serial, baudrate)
         except Exception:
             print('Failed to open port {}. Try another port and reconnect'.format(serial))
 
@@ -142,7 +223,14 @@ class SerialMaster:
 
             if self.ports and self.auto_connect and not self.connected and not connection_thread.is_alive():
                 connection_thread = self.__create_thread(self.__auto_connect)
-            time.sleep(0.25)
+            self.__wait_ports_change()
+
+    def __wait_ports_change(self):
+        if self.__monitor is not None:
+            # Returns on the first tty hotplug event
+            self.__monitor.poll(timeout=PORTS_POLL_INTERVAL)
+        else:
+            time.sleep(PORTS_POLL_INTERVAL)
 
     def __create_thread(self, target, args=None, join: bool = False):
         thread = self.Thread(target)
@@ -165,26 +253,46 @@ class SerialMaster:
             self.serial = serial
             self.__make_connection()
 
+    def port_key(self, port):
+        return self.port_ids.get(port) or port
+
     def __make_connection(self):
-        for baudrate in self.baudrate_list:
-            try:
-                self.open_serial(self.serial, baudrate)
-            except serial.SerialException:
-                pass
+        # Last good baudrate of the board goes first, a short probe of every rate precedes the full sweep
+        key = self.port_key(self.serial)
+        cached = self.baudrate_cache.get(key)
+        baudrates = [cached] if cached in self.baudrate_list else []
+        baudrates += [baudrate for baudrate in self.baudrate_list if baudrate != cached]
+        for attempts in (PROBE_ATTEMPTS, CONNECT_ATTEMPTS):
+            for baudrate in baudrates:
+                try:
+                    self.open_serial(self.serial, baudrate)
+                except serial.SerialException:
+                    pass
+                try:
+                    if self.stream.socket.is_open:
+                        self.baudrate = baudrate
+                        connected = self.connect_messenger(attempts)
+                        if connected:
+                            print("Connected port {} at {}".format(self.serial, baudrate))
+                            self.connected = True
+                            self.baudrate_cache.set(key, baudrate)
+                            return
+                        else:
+                            self.stream.socket.close()
+                except Exception:
+                    pass
+
+    def reconnect_after_restart(self):
+        # The messenger with its discovered components is kept if the port survived the restart
+        if self.session == (self.serial, self.baudrate):
             try:
-                if self.stream.socket.is_open:
-                    self.baudrate = baudrate
-                    connected = self.connect_messenger()
-                    if connected:
-                        print("Connected port {}".format(self.serial))
-                        self.connected = True
-                        break
-                    else:
-                        self.stream.socket.close()
+                if not self.stream.socket.is_open:
+                    self.stream.socket.open()
+                self.connected = self.connect_messenger(PROBE_ATTEMPTS)
+                if self.connected:
+                    return
             except Exception:
                 pass
-
-    def reconnect_after_restart(self):
         self.open_serial(self.serial, self.baudrate)
         try:
             self.connected = self.connect_messenger()
@@ -193,9 +301,9 @@ class SerialMaster:
             pass
         self.__make_connection()
 
-    def connect_messenger(self):
+    def connect_messenger(self, attempts=CONNECT_ATTEMPTS):
         connected = False
-        for i in range(10):
+        for i in range(attempts):
             connected = self.hub.connect()
             if connected and self.hub['LuaScript'] is not None:
                 break
@@ -210,6 +318,7 @@ class SerialMaster:
         if self.connected:
             self.disconnect_callback()
         self.connected = False
+        self.session = None
         if self.messenger:
             self.messenger.stop()
         if self.stream:
@@ -221,39 +330,24 @@ class SerialMaster:
         print(self.connected, self.serial, "close serial serialMaster")
 
     def available_ports(self):
-        """ Lists serial port names
+        """ Lists USB serial port names without opening them
 
-            :raises: EnvironmentError:
-                On unsupported or unknown platforms
             :returns:
-                A list of the serial ports available on the system
+                A sorted list of the serial ports available on the system
         """
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-            # this excludes your current terminal "/dev/tty"
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif sys.platform.startswith('darwin'):
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
-
         result = []
-        for port in ports:
-            if port == self.serial:
-                result.append(port)
+        for port in serial.tools.list_ports.comports():
+            if port.device == self.serial:
+                result.append(port.device)
                 continue
-            elif port == "COM1":
+            if port.vid is None:
                 continue
-            try:
-                s = serial.Serial(port)
-                s.close()
-                if "USB" in port or "ACM" in port or "COM" in port:
-                    result.append(port)
-            except (OSError, serial.SerialException):
-                pass
-
-        return result
+            if self.usb_ids and (port.vid, port.pid) not in self.usb_ids:
+                continue
+            if port.serial_number:
+                self.port_ids[port.device] = port.serial_number
+            result.append(port.device)
+        return sorted(result)
 
 
 class Loader:
@@ -264,35 +358,97 @@ class Loader:
     connected = None
 
     def __init__(self, addons_path, connection_callback=None, auto_connect: bool = True):
+        self.config_path = addons_path + "/addons/config.json"
+        # Local config is used right away and refreshed from the url in background
         data = None
         try:
-            with urllib.request.urlopen(json_url, context=ssl.create_default_context(cafile=certifi.where()),
-                                        timeout=5) as url:
-                data = json.load(url)
-                print("Json loaded from url")
-                f = open(addons_path + "/addons/config.json", 'w')
-                json.dump(data, f)
-                f.close()
-        except urllib.error.URLError:
-            f = open(addons_path + "/addons/config.json", 'r')
-            data = json.load(f)
-            f.close()
+            with open(self.config_path, 'r') as f:
+                data = json.load(f)
             print("Json loaded from locals")
+        except (OSError, ValueError):
+            data = self._fetch_config()
+        self._apply_config(data)
+        self._config_thread = threading.Thread(target=self.refresh_config, daemon=True)
+        self._config_thread.start()
+        self.transfer_tuner = TransferTuner(addons_path + "/addons/transfer.json")
+        self.upload_ledger = UploadLedger(addons_path + "/addons/uploads.json")
+        self.baudrate_cache = BaudrateCache(addons_path + "/addons/baudrates.json")
+        self.cache_path = addons_path + "/addons/cache"
+        self._init_link(connection_callback, auto_connect)
+
+    def _init_link(self, connection_callback=None, auto_connect: bool = True, serial_master=None):
+        """ Connection state shared by every loader, serial_master is created on first use if not given """
+        self._auto_connect = auto_connect
+        self._serial_master = serial_master
+        self._serial_master_lock = threading.Lock()
+        self._user_connection_callback = connection_callback
+        self._sem = threading.Semaphore(1)
+
+    @property
+    def serial_master(self):
+        """ Port watching starts on first use """
+        with self._serial_master_lock:
+            if self._serial_master is None:
+                self._serial_master = SerialMaster(self.connect_callback, self.disconnect_callback,
+                                                   self.ports_update_callback, auto_connect=self._auto_connect,
+                                                   usb_ids=self.config.get("usb_ids"),
+                                                   baudrate_cache=self.baudrate_cache, cache_path=self.cache_path)
+            return self._serial_master
+
+    def _fetch_config(self):
+        """ Config from the url, None if it is not modified since the saved one or unavailable """
+        meta_path = self.config_path + ".meta"
+        headers = {}
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if os.path.exists(self.config_path):
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+        except (OSError, ValueError):
+            pass
+        try:
+            request = urllib.request.Request(json_url, headers=headers)
+            with urllib.request.urlopen(request, context=ssl.create_default_context(cafile=certifi.where()),
+                                        timeout=CONFIG_TIMEOUT) as url:
+                data = json.load(url)
+                meta = {"etag": url.headers.get("ETag"), "last_modified": url.headers.get("Last-Modified"),
+                        "fetched": time.time()}
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                print("Json is up to date")
+            else:
+                print(e)
+            return None
         except Exception as e:
             print(e)
+            return None
+        print("Json loaded from url")
+        try:
+            with open(self.config_path, 'w') as f:
+                json.dump(data, f)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        except OSError as e:
+            print(e)
+        return data
+
+    def refresh_config(self):
+        data = self._fetch_config()
+        if data is not None:
+            self._apply_config(data)
+
+    def _apply_config(self, data):
+        self.config = data
         self.actual_ap_fw_version = data["ap_fw"]
         self.params_gps = data["params"]["gps"]
         self.params_lps = data["params"]["lps"]
         self.hubs_gps = data["fields"]["gps"]
         self.hubs_lps = data["fields"]["lps"]
-
-        self.serial_master = SerialMaster(self.connect_callback, self.disconnect_callback,
-                                          self.ports_update_callback,
-                                          auto_connect=auto_connect)
-
-        self._user_connection_callback = connection_callback
-
-        self._sem = threading.Semaphore(1)
+        # First autopilot firmware reading show format version 3, absent until it is released
+        self.show_v3_fw = v3_firmware(data)
 
     def _acquire_sem(self, interval=1):
         timer = threading.Timer(interval, lambda: self._sem.release())
@@ -300,17 +456,19 @@ class Loader:
         self._sem.acquire()
 
     def _check_bin(self, binary):
-        check_bytes = b'\xaa\xbb\xcc\xdd'
         control_sequence = binary[:4]
-        if control_sequence != check_bytes:
+        if control_sequence != CONTROL_SEQUENCE:
             return False
         bin_file_version = bytes(binary[4:5])
         bin_file_version = struct.unpack('<B', bin_file_version)[0]
-        ap_firmware_version = self.get_ap_firmware_version()
-        if (bin_file_version == 1 and ap_firmware_version > 8123) or \
-                (bin_file_version == 2 and ap_firmware_version < 8016):
-            return False
-        return True
+        return version_supported(bin_file_version, self.get_ap_firmware_version(), self.show_v3_fw)
+
+    def _transfer_key(self):
+        return self.transfer_tuner.key(self.serial_master.serial, self.serial_master.baudrate,
+                                       self.get_ap_firmware_version())
+
+    def show_version(self, points_number):
+        return select_show_version(self.get_ap_firmware_version(), points_number, self.show_v3_fw)
 
     def connect_callback(self, stream, messenger, hub):
         self.stream = stream
@@ -343,8 +501,11 @@ class Loader:
         self.serial_master.auto_connect = False
 
     def kill_serial_master(self):
-        self.serial_master.port_handler_thread.kill()
-        self.serial_master.close_serial()
+        if self._serial_master is None:
+            return
+        if self._serial_master.port_handler_thread:
+            self._serial_master.port_handler_thread.kill()
+        self._serial_master.close_serial()
 
     def restart_board(self):
         if self.connected:
@@ -389,44 +550,142 @@ class Loader:
 
             return version
 
+    def get_board_uid(self):
+        """ Board UID as a string stable across sessions, None if the board does not report it """
+        if self.connected:
+            for component in self.hub.components:
+                if component.name == 'UavMonitor' or component.name == 'BaseMonitor':
+                    try:
+                        uid = component.uid()
+                    except Exception:
+                        return None
+                    if isinstance(uid, (bytes, bytearray)):
+                        return uid.hex()
+                    return None if uid is None else str(uid)
+
+    @staticmethod
+    def _remote_file_info(file):
+        """ (size, crc32) of a LuaScript file as reported by the board, None if it does not report both """
+        try:
+            info = file.readFileInfo()
+        except Exception:
+            return None
+        if isinstance(info, dict):
+            size, crc = info.get("size"), info.get("crc32", info.get("crc"))
+        elif isinstance(info, (tuple, list)) and len(info) >= 2:
+            size, crc = info[0], info[1]
+        else:
+            size, crc = getattr(info, "size", None), getattr(info, "crc32", getattr(info, "crc", None))
+        if not isinstance(size, int) or not isinstance(crc, int):
+            return None
+        return size, crc & 0xffffffff
+
+    def _confirmed_length(self, file, data):
+        """ Length of the prefix of data the board reports to hold, 0 if it does not report one """
+        remote = self._remote_file_info(file)
+        if remote is None or remote[0] > len(data) or zlib.crc32(data[:remote[0]]) != remote[1]:
+            return 0
+        return remote[0]
+
+    def _write_file(self, index, data):
+        """ Writes a LuaScript file, skipping it or its known prefix if the board confirms it holds them """
+        data = bytes(data)
+        file = self.hub["LuaScript"].files[index]
+        board = self.get_board_uid()
+        start = 0
+        if board is not None:
+            start = self.upload_ledger.start_offset(board, index, data, self._remote_file_info(file))
+            if start == len(data) and data:
+                print("File {} is unchanged, upload skipped".format(index))
+                return
+            # Entry is restored only after a complete write
+            self.upload_ledger.forget(board, index)
+        self.transfer_tuner.write(file, data, self._transfer_key(), start=start,
+                                  confirmed=lambda: self._confirmed_length(file, data))
+        if board is not None:
+            self.upload_ledger.store(board, index, data)
+
     def get_ports_list(self):
         return self.serial_master.ports
 
     def change_port(self, port):
         self.serial_master.connect_serial(port)
 
-    def upload_lps_params(self):
-        for param in self.params_lps.keys():
-            self.set_param(name=param, value=self.params_lps.get(param))
+    def _current_params(self):
+        """ All board params read in one request, empty if the firmware does not list them """
+        try:
+            params = self.hub.getParamList()
+        except Exception:
+            return {}
+        if isinstance(params, dict):
+            return params
+        try:
+            return dict(params)
+        except (TypeError, ValueError):
+            return {}
+
+    @staticmethod
+    def _same_value(current, value):
+        if current is None:
+            return False
+        try:
+            return math.isclose(float(current), float(value), rel_tol=1e-6, abs_tol=1e-6)
+        except (TypeError, ValueError):
+            return current == value
 
-        self.restart_board()
-        for hub_name in self.hubs_lps.keys():
+    def _write_fields(self, hubs):
+        changed = 0
+        for hub_name in hubs.keys():
             try:
                 hub = self.hub[hub_name]
             except Exception:
                 continue
-            fields = self.hubs_lps[hub_name]
+            if hub is None:
+                continue
+            fields = hubs[hub_name]
             for (_, field) in hub.fields.items():
                 if field.name in fields.keys():
+                    if self._same_value(getattr(field, "value", None), fields.get(field.name)):
+                        continue
                     field.write(fields.get(field.name), self.field_written_callback)
-        self.restart_board()
+                    changed += 1
+        return changed
 
-    def upload_gps_params(self):
-        for param in self.params_gps.keys():
-            self.set_param(name=param, value=self.params_gps.get(param))
-
-        self.restart_board()
-        for hub_name in self.hubs_gps.keys():
+    def _missing_hubs(self, hubs):
+        missing = []
+        for hub_name in hubs.keys():
             try:
-                hub = self.hub[hub_name]
+                if self.hub[hub_name] is None:
+                    missing.append(hub_name)
             except Exception:
-                continue
-            fields = self.hubs_gps[hub_name]
-            for (_, field) in hub.fields.items():
-                if field.name in fields.keys():
-                    print(field.name)
-                    field.write(fields.get(field.name), self.field_written_callback)
-        self.restart_board()
+                missing.append(hub_name)
+        return missing
+
+    def upload_params(self, params, hubs):
+        """ Writes only params and hub fields differing from the board, restarts only if something changed
+
+            Returns the number of written values.
+        """
+        current = self._current_params()
+        changed = {name: value for (name, value) in params.items() if not self._same_value(current.get(name), value)}
+        for (name, value) in changed.items():
+            self.set_param(name=name, value=value)
+        print("Params changed: {} of {}".format(len(changed), len(params)))
+        restart_needed = bool(changed)
+        # Hubs enabled by the new params appear only after a restart
+        if changed and self._missing_hubs(hubs):
+            self.restart_board()
+            restart_needed = False
+        fields_changed = self._write_fields(hubs)
+        if restart_needed or fields_changed:
+            self.restart_board()
+        return len(changed) + fields_changed
+
+    def upload_lps_params(self):
+        return self.upload_params(self.params_lps, self.hubs_lps)
+
+    def upload_gps_params(self):
+        return self.upload_params(self.params_gps, self.hubs_gps)
 
     def set_board_number(self, board_number):
         self.set_param(name="Board_number", value=board_number)
@@ -441,10 +700,13 @@ class Loader:
             lua = self.hub["LuaScript"]
             if lua:
                 try:
-                    file = lua.files[0]
-                    file.writeImpl(data=path.read(), chunkSize=48, burstSize=4, append=False, verify=True)
-                except Exception:
-                    pass
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    self._write_file(0, data)
+                    return True
+                except Exception as e:
+                    print(e)
+        return False
 
     def upload_bin(self, binary):
         if self.connected:
@@ -454,10 +716,11 @@ class Loader:
                     checked = self._check_bin(binary)
                     if checked:
                         print("Begin upload bin")
-                        file = lua.files[1]
-                        file.writeImpl(data=binary, chunkSize=48, burstSize=4, append=False, verify=True)
+                        self._write_file(1, binary)
                         print("Completed writing bin")
+                        return True
                     else:
                         raise
                 except Exception as e:
                     print(e)
+        return False
@@ -1,14 +1,15 @@
 import time
 
 import bpy
+import gpu
+from gpu_extras.batch import batch_for_shader
 from bpy_extras.io_utils import ExportHelper
 from bpy.types import Operator, Panel, WindowManager
 from bpy.props import StringProperty, BoolProperty, FloatProperty, IntProperty, EnumProperty
-import math
-import struct
-import threading
 import sys
 
+import numpy as np
+
 if sys.platform.startswith('win'):
     if sys.getwindowsversion()[2] < 21000:
         sys.path.append(bpy.utils.user_resource('SCRIPTS') + "/addons/win/win10/")
@@ -17,7 +18,17 @@ if sys.platform.startswith('win'):
 
 else:
     sys.path.append(bpy.utils.user_resource('SCRIPTS') + "/addons/linux/")
-from loader import Loader
+from loader import Loader, REGISTER_BUDGET
+from sampler import ShowSampler
+from show_bin import pack_show, select_show_version, show_path, v3_firmware
+from export_pool import ShowWriterPool
+from fleet_upload import FleetUpload
+from upload_worker import UploadJob, UploadWorker, require
+from export_cache import ExportCache, sample_with_cache
+from change_tracker import ChangeTracker
+from live_validation import LiveValidator
+from separation import find_separation_violations, find_swept_violations, GRID_DRONE_THRESHOLD
+from kinematics import KinematicsReport, limits_from_params, load_config
 
 bl_info = {
     "name": "pioneer-show",
@@ -29,8 +40,41 @@ bl_info = {
 }
 
 
-def scene_change_handler(scene):
-    bpy.context.scene.export_allowed = False
+def run_later(callback, delay):
+    def timer():
+        callback()
+        return None
+
+    bpy.app.timers.register(timer, first_interval=delay)
+
+
+change_tracker = ChangeTracker(run_later)
+
+
+def flush_scene_changes():
+    scene = bpy.context.scene
+    changed = [name for name in change_tracker.flush(scene.objects) if is_drone_name(scene, name)]
+    # Writing the property is a depsgraph update itself, so it is only written when a drone did change
+    if changed and scene.export_allowed:
+        scene.export_allowed = False
+    live_changes.update(changed)
+
+
+@bpy.app.handlers.persistent
+def scene_change_handler(scene, depsgraph):
+    change_tracker.collect(depsgraph.updates, flush_scene_changes)
+
+
+@bpy.app.handlers.persistent
+def scene_reload_handler(*args):
+    global live_key
+    change_tracker.reset()
+    live_key = None
+    if hasattr(bpy.context, "scene"):
+        if bpy.context.scene.export_allowed:
+            bpy.context.scene.export_allowed = False
+        # Loaded files keep the property but not the viewport handler
+        live_validation_set_callback(None, bpy.context)
 
 
 def connection_state_handler(status, value=None):
@@ -48,6 +92,165 @@ def auto_connection_set_callback(self, context):
         else:
             loader.disable_auto_connect()
 
+def is_drone_name(scene, name):
+    return not scene.using_name_filter or scene.drones_name.lower() in name.lower()
+
+
+def get_pioneers(context):
+    scene = context.scene
+    return [pioneers_obj for pioneers_obj in context.visible_objects if is_drone_name(scene, pioneers_obj.name)]
+
+
+def report_sampling_faults(operator, trajectories, language):
+    for (name, frame) in trajectories.faults:
+        operator.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("miss_color_error") % (name, frame))
+    return bool(trajectories.faults)
+
+
+def get_origin(scene):
+    if scene.position_system:
+        return [float(scene.lat_offset), float(scene.lon_offset)]
+    return [scene.x_offset, scene.y_offset]
+
+
+def run_on_main_thread(callback):
+    # bpy data may only be changed from the main thread, where timers run
+    run_later(callback, 0)
+
+
+upload_worker = UploadWorker(run_on_main_thread)
+
+
+def redraw_view3d(context):
+    if context.screen is None:
+        return
+    for area in context.screen.areas:
+        if area.type == 'VIEW_3D':
+            area.tag_redraw()
+
+
+# Viewport colors of live validation: intervals above the speed limit and drones closer than the minimum
+SPEED_COLOR = (1.0, 0.2, 0.1, 1.0)
+DISTANCE_COLOR = (1.0, 0.8, 0.0, 1.0)
+LIVE_INTERVAL = 0.5
+
+live_changes = set()
+live_key = None
+live_result = None
+live_batches = None
+live_draw_handler = None
+
+
+def show_live_result(result):
+    global live_result, live_batches
+    if live_draw_handler is None:
+        # Scheduled before live validation was turned off
+        return
+    live_result, live_batches = result, None
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+live_validator = LiveValidator(run_on_main_thread, show_live_result)
+
+
+def live_validate(scene):
+    """ Samples drones changed since the last live check, all of them once settings or drones change """
+    global live_key
+    pioneers = [obj for obj in scene.objects if obj.visible_get() and is_drone_name(scene, obj.name)]
+    names = [pioneer.name for pioneer in pioneers]
+    sampler = ShowSampler(scene, pioneers)
+    settings = sampler.settings()
+    limits = limits_from_params(get_nav_params(scene), horizontal_limit=scene.speed_exceed_value)
+    key = (repr(settings), names, repr(limits), scene.minimum_drone_distance, scene.grid_drone_threshold)
+    if key == live_key:
+        drones = [drone for drone, name in enumerate(names) if name in live_changes]
+        if not drones:
+            live_changes.clear()
+            return
+        sampler = ShowSampler(scene, [pioneers[drone] for drone in drones])
+    else:
+        drones = None
+    live_key = key
+    live_changes.clear()
+    trajectories = sampler.sample()
+    # Fingerprints let the change tracker tell real changes of these drones from other updates
+    for pioneer in sampler.pioneers:
+        change_tracker.fingerprint(pioneer, settings)
+    live_validator.grid_threshold = scene.grid_drone_threshold
+    live_validator.submit(names, trajectories.positions, trajectories.position_period, limits,
+                          scene.minimum_drone_distance, sampler.offset, drones)
+
+
+def live_validation_timer():
+    if live_draw_handler is None:
+        return None
+    live_validate(bpy.context.scene)
+    return LIVE_INTERVAL
+
+
+def draw_live_violations():
+    global live_batches
+    if live_result is None:
+        return
+    if live_batches is None:
+        shader = gpu.shader.from_builtin('UNIFORM_COLOR' if bpy.app.version >= (3, 4, 0) else '3D_UNIFORM_COLOR')
+        lines = ((live_result.segments, SPEED_COLOR), (live_result.links, DISTANCE_COLOR))
+        live_batches = [(shader, batch_for_shader(shader, 'LINES', {"pos": coords.reshape(-1, 3)}), color)
+                        for (coords, color) in lines if len(coords)]
+    for shader, batch, color in live_batches:
+        shader.bind()
+        shader.uniform_float("color", color)
+        batch.draw(shader)
+
+
+def stop_live_validation():
+    global live_draw_handler, live_result, live_batches
+    if live_draw_handler is not None:
+        bpy.types.SpaceView3D.draw_handler_remove(live_draw_handler, 'WINDOW')
+        live_draw_handler = None
+    if bpy.app.timers.is_registered(live_validation_timer):
+        bpy.app.timers.unregister(live_validation_timer)
+    live_validator.clear()
+    live_result, live_batches = None, None
+
+
+def live_validation_set_callback(self, context):
+    global live_draw_handler, live_key
+    if context.scene.live_validation and live_draw_handler is None:
+        live_key = None
+        live_draw_handler = bpy.types.SpaceView3D.draw_handler_add(draw_live_violations, (), 'WINDOW', 'POST_VIEW')
+        bpy.app.timers.register(live_validation_timer, first_interval=0)
+    elif not context.scene.live_validation and live_draw_handler is not None:
+        stop_live_validation()
+    redraw_view3d(context)
+
+
+def pack_board_show(scene, loader, coords_array, colors_array):
+    # Compact encoding is read only by boards supporting format version 3
+    version = loader.show_version(len(coords_array))
+    return pack_show(coords_array, colors_array, scene.positionFreq, scene.colorFreq, get_origin(scene), version,
+                     scene.compact_show and version == 3)
+
+
+def show_v3_firmware():
+    """ First firmware version reading show format version 3, None while no firmware and show script do """
+    loader = classes_loader[0].loader
+    if loader:
+        return loader.show_v3_fw
+    return v3_firmware(load_config(bpy.utils.user_resource('SCRIPTS') + "/addons/config.json"))
+
+
+def get_nav_params(scene):
+    loader = classes_loader[0].loader
+    if loader:
+        return loader.params_gps if scene.position_system else loader.params_lps
+    config = load_config(bpy.utils.user_resource('SCRIPTS') + "/addons/config.json")
+    return config["params"]["gps" if scene.position_system else "lps"]
+
+
 def items_ports_callback(scene, context):
     loader = classes_loader[0].loader
     if loader:
@@ -99,6 +302,7 @@ PIONEER_PROPS = [
                                  default=1, min=1)),
     ("available_ports", EnumProperty(items=items_ports_callback, name="Available ports", default=None)),
     ("auto_connection", BoolProperty(name="Auto port connection", default=True, update=auto_connection_set_callback)),
+    ("fleet_keep_numbers", BoolProperty(name="Keep drone numbers of boards", default=False)),
 ]
 
 SYSTEM_PROPS_PUBLIC = [
@@ -106,6 +310,8 @@ SYSTEM_PROPS_PUBLIC = [
                                  default=2)),
     ("colorFreq", IntProperty(name="Color FPS",
                               default=5)),
+    ("grid_drone_threshold", IntProperty(name="Spatial grid above drones",
+                                         default=GRID_DRONE_THRESHOLD, min=2)),
 
 ]
 
@@ -113,6 +319,10 @@ SYSTEM_PROPS_PRIVATE = [
     ("export_allowed", BoolProperty(default=False)),
     ("upload_allowed", BoolProperty(default=False)),
     ("language", BoolProperty(default=False)),
+    ("export_cache_path", StringProperty(default="")),
+    # Shown in the export dialog only while some firmware reads format version 3
+    ("compact_show", BoolProperty(name="Compact show binaries", default=False)),
+    ("live_validation", BoolProperty(name="Live validation", default=False, update=live_validation_set_callback)),
 ]
 
 LANGUAGE_PACK_ENGLISH = {
@@ -122,6 +332,10 @@ LANGUAGE_PACK_ENGLISH = {
     "speed_exceed_value": "Limit of  speed (m/s)",
     "positionFreq": "Position FPS (Hz)",
     "colorFreq": "Color FPS (Hz)",
+    "grid_drone_threshold": "Spatial grid check above drones",
+    "compact_show": "Compact show binaries",
+    "live_validation": "Live validation in viewport",
+    "live_violations": "Speed exceeded: %d drones, too close: %d pairs",
     "position_system_true": "Navigation system: outdoors",
     "position_system_false": "Navigation system: indoors",
     "x_offset": "Start point X offset (m)",
@@ -138,12 +352,24 @@ LANGUAGE_PACK_ENGLISH = {
     "UploadNavSystemParams": "Upload params",
     "UploadFilesToPioneer": "Upload files",
     "UploadAll": "Upload params & bin",
+    "UploadFleet": "Upload to all ports",
+    "CancelUpload": "Cancel",
+    "upload_stage": "Uploading %s (%d/%d)",
+    "stage_params": "params",
+    "stage_script": "show script",
+    "stage_show": "show",
+    "stage_restart": "restart",
+    "fleet_keep_numbers": "Keep drone numbers of boards",
     "auto_connection": "Auto port connection",
     "no_pioneer_connected": "No Pioneer connected",
     "pioneer_fw_version": "Pioneer firmware version: ",
     "pioneer_connected_port": "Pioneer port: ",
     "speed_exceeded_error": "Speed exceeded on frame %d on drone %s. speed: %.2f m/s",
+    "up_speed_exceeded_error": "Climb speed exceeded on frame %d on drone %s. speed: %.2f m/s",
+    "down_speed_exceeded_error": "Descent speed exceeded on frame %d on drone %s. speed: %.2f m/s",
+    "acceleration_exceeded_error": "Acceleration exceeded on frame %d on drone %s. acceleration: %.2f m/s²",
     "distance_underestimated_error": "Distance less than minimums on frame %d on drones  %s & %s",
+    "distance_swept_error": "Distance less than minimums between frames %d and %d on drones  %s & %s",
     "miss_color_error": "No color found on %s on frame %d",
     "fw_version_unmatched_error": "Actual firmware version ({}) is higher than current ({})",
     "params_loading_error": "Params loading error %s",
@@ -151,8 +377,16 @@ LANGUAGE_PACK_ENGLISH = {
     "binaries_drone_number_error": "Drone number %d exceeded drones amount of drones on scene",
     "latlon_not_float": "Given cooedinates are wrong, please ensure data format XX.XXXXXXX",
     "export_succeed": "GeoScan show done!",
+    "export_progress": "Writing show binaries %d/%d",
+    "export_error": "Show export error %s",
+    "show_v3_unsupported_error": "Compact show binaries need format version 3, no firmware reads it yet",
     "params_uploaded_successfully": "Params uploaded successfully",
     "binaries_uploaded_successfully": "Loading show done for Pioneer %d",
+    "fleet_no_ports": "No ports found",
+    "fleet_progress": "Uploading show to drones %d/%d",
+    "fleet_drone_step": "Drone %s on %s: %s",
+    "fleet_drone_error": "Drone %s on %s failed on %s: %s",
+    "fleet_succeed": "Show uploaded to %d of %d drones",
     "SystemProperties": "GeoScan System properties",
     "ConfigProperties": "GeoScan Show",
     "ConnectionPanel": "GeoScan Pioneer connection",
@@ -166,6 +400,10 @@ LANGUAGE_PACK_RUSSIAN = {
     "speed_exceed_value": "Предел скорости (м/с)",
     "positionFreq": "Частота сохранения позиции (Гц)",
     "colorFreq": "Частота сохранения цветов (Гц)",
+    "grid_drone_threshold": "Проверка по сетке от числа дронов",
+    "compact_show": "Сжатые бинарники шоу",
+    "live_validation": "Проверка во вьюпорте",
+    "live_violations": "Превышение скорости: %d дронов, сближение: %d пар",
     "position_system_true": "Навигация на улице",
     "position_system_false": "Навигация в помещении",
     "x_offset": "Смещение 0 точки по Х (м)",
@@ -182,12 +420,24 @@ LANGUAGE_PACK_RUSSIAN = {
     "UploadNavSystemParams": "Загрузить параметры",
     "UploadFilesToPioneer": "Загрузить файлы",
     "UploadAll": "Загрузить параметры и шоу",
+    "UploadFleet": "Загрузить на все порты",
+    "CancelUpload": "Отмена",
+    "upload_stage": "Загрузка: %s (%d/%d)",
+    "stage_params": "параметры",
+    "stage_script": "скрипт шоу",
+    "stage_show": "шоу",
+    "stage_restart": "перезагрузка",
+    "fleet_keep_numbers": "Сохранить номера дронов",
     "auto_connection": "Автоматическое подключение",
     "no_pioneer_connected": "Пионер не подключен",
     "pioneer_fw_version": "Версия прошивки Пионера: ",
     "pioneer_connected_port": "Порт Пионера: ",
     "speed_exceeded_error": "Скорость превышена на кадре %d дроном %s. скорость: %.2f м/с",
+    "up_speed_exceeded_error": "Скорость подъёма превышена на кадре %d дроном %s. скорость: %.2f м/с",
+    "down_speed_exceeded_error": "Скорость спуска превышена на кадре %d дроном %s. скорость: %.2f м/с",
+    "acceleration_exceeded_error": "Ускорение превышено на кадре %d дроном %s. ускорение: %.2f м/с²",
     "distance_underestimated_error": "Расстояние меньше минимального на кадре %d между дронами  %s и %s",
+    "distance_swept_error": "Расстояние меньше минимального между кадрами %d и %d у дронов  %s и %s",
     "miss_color_error": "Не найден цвет у %s на кадре %d",
     "fw_version_unmatched_error": "Актуальная версия прошивки ({}) выше текущей ({})",
     "params_loading_error": "Ошибка загрузки параметров %s",
@@ -195,8 +445,16 @@ LANGUAGE_PACK_RUSSIAN = {
     "binaries_drone_number_error": "Номер дрона %d превышает общее число дронов на сцене",
     "latlon_not_float": "Указанные кординаты некорректны, проверьте формат введенных данных XX.XXXXXXX",
     "export_succeed": "GeoScan шоу успешно создано",
+    "export_progress": "Запись бинарников шоу %d/%d",
+    "export_error": "Ошибка экспорта шоу %s",
+    "show_v3_unsupported_error": "Сжатым бинарникам шоу нужен формат версии 3, ни одна прошивка его пока не читает",
     "params_uploaded_successfully": "Параметры успешно загружены",
     "binaries_uploaded_successfully": "Шоу загружено в Пионер %d",
+    "fleet_no_ports": "Порты не найдены",
+    "fleet_progress": "Загрузка шоу в дроны %d/%d",
+    "fleet_drone_step": "Дрон %s на %s: %s",
+    "fleet_drone_error": "Дрон %s на %s: ошибка на шаге %s: %s",
+    "fleet_succeed": "Шоу загружено в %d из %d дронов",
     "SystemProperties": "GeoScan Системные параметры",
     "ConfigProperties": "GeoScan Шоу",
     "ConnectionPanel": "GeoScan Подключение к дрону",
@@ -226,6 +484,8 @@ class ExportLuaBinaries(Operator, ExportHelper):
                         "drones_name",
                         "positionFreq",
                         "colorFreq", ]
+        if show_v3_firmware() is not None:
+            global_props.append("compact_show")
 
         props_lps = ["x_offset",
                      "y_offset",
@@ -268,170 +528,91 @@ class ExportLuaBinaries(Operator, ExportHelper):
             if not (self.is_float(scene.lat_offset) and self.is_float(scene.lon_offset)):
                 self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("latlon_not_float"))
                 return {"CANCELLED"}
-        objects = context.visible_objects
-        pioneers = []
-        if context.scene.using_name_filter:
-            for pioneers_obj in objects:
-                if scene.drones_name.lower() in pioneers_obj.name.lower():
-                    pioneers.append(pioneers_obj)
-        else:
-            pioneers = objects
-
-        pioneer_id = 1
-        for pioneer in pioneers:
-            coords_array, colors_array, faults = self.prepare_export_arrays(pioneer, scene)
-            if not faults:
-                if scene.position_system:
-                    self.write_to_bin(pioneer_id, coords_array, colors_array, self.filepath,
-                                      [float(scene.lat_offset), float(scene.lon_offset)])
-                else:
-                    self.write_to_bin(pioneer_id, coords_array, colors_array, self.filepath,
-                                      [scene.x_offset, scene.y_offset])
-            else:
-                return {"CANCELLED"}
-            pioneer_id += 1
+        pioneers = get_pioneers(context)
+        self._filepath = bpy.path.abspath(self.filepath)
+        self._cache = ExportCache(self._filepath)
+        flush_scene_changes()
+        trajectories, fingerprints, _ = sample_with_cache(ShowSampler(scene, pioneers), self._cache,
+                                                          change_tracker.fingerprint)
+        if report_sampling_faults(self, trajectories, scene.language):
+            return {"CANCELLED"}
+
+        self._origin = get_origin(scene)
+        # Shows longer than the fixed layout and compact shows are exported in the version 3 format,
+        # which is refused while no firmware reads it
+        v3_fw = show_v3_firmware()
+        self._compact = scene.compact_show
+        if self._compact and v3_fw is None:
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("show_v3_unsupported_error"))
+            return {"CANCELLED"}
+        try:
+            self._version = 3 if self._compact else select_show_version(None, trajectories.positions.shape[1],
+                                                                          v3_fw)
+        except ValueError as e:
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("export_error") % str(e))
+            return {"CANCELLED"}
+        self._pool = ShowWriterPool()
+        self._written = []
+        for pioneer_id in range(1, len(trajectories) + 1):
+            name = trajectories.names[pioneer_id - 1]
+            if self._cache.bin_current(name, fingerprints[pioneer_id - 1], show_path(self._filepath, pioneer_id),
+                                       self._origin, self._version, self._compact):
+                continue
+            coords_array = trajectories.positions[pioneer_id - 1]
+            colors_array = trajectories.colors[pioneer_id - 1]
+            self._written.append((name, self._pool.submit(self._filepath, pioneer_id, coords_array, colors_array,
+                                                          scene.positionFreq, scene.colorFreq, self._origin,
+                                                          self._version, self._compact)))
+
+        wm = context.window_manager
+        if context.window is None:
+            self._pool.wait()
+            return self.finish(context)
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.progress_begin(0, self._pool.total)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._pool.shutdown(cancel=True)
+            self.stop_progress(context)
+            self.store_cache(context)
+            return {"CANCELLED"}
+        if event.type != 'TIMER':
+            return {"PASS_THROUGH"}
+        context.window_manager.progress_update(self._pool.done)
+        context.workspace.status_text_set((LANGUAGE_PACK.get(context.scene.language)).get("export_progress") % (
+            self._pool.done, self._pool.total))
+        if not self._pool.finished:
+            return {"RUNNING_MODAL"}
+        self._pool.shutdown()
+        self.stop_progress(context)
+        return self.finish(context)
+
+    def stop_progress(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def store_cache(self, context):
+        for (name, future) in self._written:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._cache.store_bin(name, future.result(), self._origin, self._version, self._compact)
+        self._cache.save()
+        context.scene.export_cache_path = self._filepath
+
+    def finish(self, context):
+        self.store_cache(context)
+        errors = self._pool.errors()
+        for error in errors:
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("export_error") % str(error))
+        if errors:
+            return {"CANCELLED"}
         self.report({"INFO"}, (LANGUAGE_PACK.get(context.scene.language)).get("export_succeed"))
         return {"FINISHED"}
 
-    def prepare_export_arrays(self, pioneer, scene):
-        coords_array = list()
-        colors_array = list()
-        faults = False
-        for frame in range(scene.frame_start, scene.frame_end + 1):
-            scene.frame_set(frame)
-            if frame % int(scene.render.fps / scene.positionFreq) == 0:
-                x, y, z = pioneer.matrix_world.to_translation()
-                coords_array.append((x + scene.x_offset * (not scene.position_system),
-                                     y + scene.y_offset * (not scene.position_system), z + scene.z_offset) * (
-                                        not scene.position_system))
-            if frame % int(scene.render.fps / scene.colorFreq) == 0:
-                r, g, b, _ = pioneer.active_material.diffuse_color
-                if r is None:
-                    faults = True
-                    self.report({"ERROR"}, (LANGUAGE_PACK.get(scene.language)).get("missed_color_error")
-                                % (pioneer.name, frame))
-                colors_array.append((r, g, b))
-        return coords_array, colors_array, faults
-
-    @staticmethod
-    def write_to_bin(droneNum, coords_array, colors_array, filepath, origin, to_file: bool = True):
-        HeaderFormat = '<BLBBBBBBBBHHfffff'
-        size = struct.calcsize(HeaderFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 2,
-            "AnimationId": 1,
-            "PreFlightColor": 249,
-            "UserColorRed": 0,
-            "UserColorGreen": 0,
-            "UserColorBlue": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-        outBinPath = ''.join([filepath, '_', str(droneNum), '.bin'])
-        coords_size = len(coords_array)
-        with open(outBinPath, "wb") as f:
-            # Control sequence
-            f.write(b'\xaa\xbb\xcc\xdd')
-            f.write(struct.pack(HeaderFormat, meta_data['Version'],
-                                meta_data['AnimationId'],
-                                meta_data['PreFlightColor'],
-                                meta_data['UserColorRed'],
-                                meta_data['UserColorGreen'],
-                                meta_data['UserColorBlue'],
-                                meta_data['FreqPositions'],
-                                meta_data['FreqColors'],
-                                meta_data['FormatPositions'],
-                                meta_data['FormatColors'],
-                                meta_data['NumberPositions'],
-                                meta_data['NumberColors'],
-                                meta_data['TimeStart'],
-                                meta_data['TimeEnd'],
-                                meta_data['LatOrigin'],
-                                meta_data['LonOrigin'],
-                                meta_data['AltOrigin']))
-            # Points data starts at offset of 100 bytes
-            for i in range(size + 4, 100):
-                f.write(b'\x00')
-            # Write points
-            for point in coords_array:
-                f.write(struct.pack('<fff', point[0], point[1], point[2]))
-
-            # Colors data starts at offset of 43300 bytes
-            if coords_size < 3600:
-                for _ in range(coords_size, 3600):
-                    f.write(b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-            # Write colors
-            for color in colors_array:
-                f.write(struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255)))
-
-            f.close()
-
-    @staticmethod
-    def write_to_bin_old(droneNum, coords_array, colors_array, filepath, origin):
-        headerFormat = "<BBBBBBHHfffff"
-        size = struct.calcsize(headerFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 1,
-            "AnimationId": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-
-        coords_size = len(coords_array)
-        outBinPath = ''.join([filepath, '_', str(droneNum - 1), '_old.bin'])
-        with open(outBinPath, "wb") as f:
-            # Control sequence
-            f.write(b'\xaa\xbb\xcc\xdd')
-            f.write(struct.pack(headerFormat, meta_data['Version'],
-                                meta_data['AnimationId'],
-                                meta_data['FreqPositions'],
-                                meta_data['FreqColors'],
-                                meta_data['FormatPositions'],
-                                meta_data['FormatColors'],
-                                meta_data['NumberPositions'],
-                                meta_data['NumberColors'],
-                                meta_data['TimeStart'],
-                                meta_data['TimeEnd'],
-                                meta_data['LatOrigin'],
-                                meta_data['LonOrigin'],
-                                meta_data['AltOrigin']))
-            # Points data starts at offset of 100 bytes
-            for i in range(size + 4, 100):
-                f.write(b'\x00')
-            # Write points
-            for point in coords_array:
-                f.write(struct.pack('<fff', point[0], point[1], point[2]))
-
-            # Colors data starts at offset of 21700 bytes
-            if coords_size < 1800:
-                for _ in range(coords_size, 1800):
-                    f.write(b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-            # Write colors
-            for color in colors_array:
-                f.write(struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255)))
-
-            f.close()
-
     @staticmethod
     def is_float(num):
         try:
@@ -511,30 +692,18 @@ class UploadFilesToPioneer(Operator):
                 if not (self.is_float(scene.lat_offset) and self.is_float(scene.lon_offset)):
                     self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("latlon_not_float"))
                     return {"CANCELLED"}
-            objects = context.visible_objects
-            pioneers = []
-            if scene.using_name_filter:
-                for pioneers_obj in objects:
-                    if scene.drones_name.lower() in pioneers_obj.name.lower():
-                        pioneers.append(pioneers_obj)
-            else:
-                pioneers = objects
-            if scene.board_number == len(pioneers) + 1:
+            pioneers = get_pioneers(context)
+            if scene.board_number > len(pioneers):
                 self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get(
                     "binaries_drone_number_error") % scene.board_number)
                 return {"CANCELLED"}
             pioneer = pioneers[scene.board_number - 1]
-            coords_array, colors_array, faults = self.prepare_export_arrays(pioneer, scene)
-            if not faults:
-                if scene.position_system:
-                    binary = self.write_to_bin(coords_array, colors_array,
-                                               [float(scene.lat_offset), float(scene.lon_offset)])
-                else:
-                    binary = self.write_to_bin(coords_array, colors_array,
-                                               [scene.x_offset, scene.y_offset])
-            else:
+            trajectories = ShowSampler(scene, [pioneer]).sample()
+            if report_sampling_faults(self, trajectories, scene.language):
                 return {"CANCELLED"}
+            coords_array, colors_array = trajectories.positions[0], trajectories.colors[0]
             try:
+                binary = pack_board_show(scene, self.loader, coords_array, colors_array)
                 self.loader.upload_lua_script(bpy.utils.user_resource('SCRIPTS') + "/addons/" + "pioneer-show.out")
                 self.loader.set_board_number(scene.board_number - 1)
                 self.loader.upload_bin(binary)
@@ -547,140 +716,6 @@ class UploadFilesToPioneer(Operator):
                             (LANGUAGE_PACK.get(context.scene.language)).get("binaries_loading_error") % str(e))
         return {"FINISHED"}
 
-    def prepare_export_arrays(self, pioneer, scene):
-        coords_array = list()
-        colors_array = list()
-        faults = False
-        for frame in range(scene.frame_start, scene.frame_end + 1):
-            scene.frame_set(frame)
-            if frame % int(scene.render.fps / scene.positionFreq) == 0:
-                x, y, z = pioneer.matrix_world.to_translation()
-                coords_array.append((x + scene.x_offset * (not scene.position_system),
-                                     y + scene.y_offset * (not scene.position_system), z + scene.z_offset * (
-                                         not scene.position_system)))
-            if frame % int(scene.render.fps / scene.colorFreq) == 0:
-                r, g, b, _ = pioneer.active_material.diffuse_color
-                if r is None:
-                    faults = True
-                    self.report({"ERROR"}, (LANGUAGE_PACK.get(scene.language)).get("missed_color_error")
-                                % (pioneer.name, frame))
-                colors_array.append((r, g, b))
-        return coords_array, colors_array, faults
-
-    @staticmethod
-    def write_to_bin(coords_array, colors_array, origin):
-        HeaderFormat = '<BLBBBBBBBBHHfffff'
-        size = struct.calcsize(HeaderFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 2,
-            "AnimationId": 1,
-            "PreFlightColor": 249,
-            "UserColorRed": 0,
-            "UserColorGreen": 0,
-            "UserColorBlue": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-        coords_size = len(coords_array)
-        binary = b''
-        binary += b'\xaa\xbb\xcc\xdd'
-        binary += (struct.pack(HeaderFormat, meta_data['Version'],
-                               meta_data['AnimationId'],
-                               meta_data['PreFlightColor'],
-                               meta_data['UserColorRed'],
-                               meta_data['UserColorGreen'],
-                               meta_data['UserColorBlue'],
-                               meta_data['FreqPositions'],
-                               meta_data['FreqColors'],
-                               meta_data['FormatPositions'],
-                               meta_data['FormatColors'],
-                               meta_data['NumberPositions'],
-                               meta_data['NumberColors'],
-                               meta_data['TimeStart'],
-                               meta_data['TimeEnd'],
-                               meta_data['LatOrigin'],
-                               meta_data['LonOrigin'],
-                               meta_data['AltOrigin']))
-        # Points data starts at offset of 100 bytes
-        for i in range(size + 4, 100):
-            binary += b'\x00'
-        # Write points
-        for point in coords_array:
-            binary += struct.pack('<fff', point[0], point[1], point[2])
-
-        # Colors data starts at offset of 43300 bytes
-        if coords_size < 3600:
-            for _ in range(coords_size, 3600):
-                binary += b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-        # Write colors
-        for color in colors_array:
-            binary += struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
-
-        return binary
-
-    @staticmethod
-    def write_to_bin_old(coords_array, colors_array, origin):
-        headerFormat = "<BBBBBBHHfffff"
-        size = struct.calcsize(headerFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 1,
-            "AnimationId": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-        coords_size = len(coords_array)
-        binary = b''
-        binary += b'\xaa\xbb\xcc\xdd'
-        binary += struct.pack(headerFormat, meta_data['Version'],
-                              meta_data['AnimationId'],
-                              meta_data['FreqPositions'],
-                              meta_data['FreqColors'],
-                              meta_data['FormatPositions'],
-                              meta_data['FormatColors'],
-                              meta_data['NumberPositions'],
-                              meta_data['NumberColors'],
-                              meta_data['TimeStart'],
-                              meta_data['TimeEnd'],
-                              meta_data['LatOrigin'],
-                              meta_data['LonOrigin'],
-                              meta_data['AltOrigin'])
-        # Points data starts at offset of 100 bytes
-        for i in range(size + 4, 100):
-            binary += b'\x00'
-        # Write points
-        for point in coords_array:
-            binary += struct.pack('<fff', point[0], point[1], point[2])
-
-        # Colors data starts at offset of 21700 bytes
-        if coords_size < 1800:
-            for _ in range(coords_size, 1800):
-                binary += b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-        # Write colors
-        for color in colors_array:
-            binary += struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
-
-        return binary
-
     @staticmethod
     def is_float(num):
         try:
@@ -697,202 +732,92 @@ class UploadAllToPioneer(Operator):
 
     def execute(self, context):
         scene = context.scene
-        if self.loader:
-            if self.loader.connected:
-                if self.loader.get_ap_firmware_version() < self.loader.actual_ap_fw_version:
-                    self.report({"ERROR"},
-                                (LANGUAGE_PACK.get(scene.language)).get("fw_version_unmatched_error").format(
-                                    self.loader.actual_ap_fw_version, self.loader.get_ap_firmware_version()))
-                    scene.upload_allowed = False
-                    return {"FINISHED"}
-                try:
-                    if context.scene.position_system:
-                        self.loader.upload_gps_params()
-                    else:
-                        self.loader.upload_lps_params()
-                    scene.upload_allowed = True
-                    self.report({"INFO"},
-                                (LANGUAGE_PACK.get(scene.language)).get("params_uploaded_successfully"))
-                except Exception as e:
-                    self.report({"ERROR"},
-                                (LANGUAGE_PACK.get(scene.language)).get("params_loading_error") % str(e))
-                    scene.upload_allowed = False
-
-            if scene.upload_allowed:
-                if scene.position_system:
-                    if not (self.is_float(scene.lat_offset) and self.is_float(scene.lon_offset)):
-                        self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("latlon_not_float"))
-                        return {"CANCELLED"}
-                objects = context.visible_objects
-                pioneers = []
-                if scene.using_name_filter:
-                    for pioneers_obj in objects:
-                        if scene.drones_name.lower() in pioneers_obj.name.lower():
-                            pioneers.append(pioneers_obj)
-                else:
-                    pioneers = objects
-                if scene.board_number == len(pioneers) + 1:
-                    self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get(
-                        "binaries_drone_number_error") % scene.board_number)
-                    return {"CANCELLED"}
-                pioneer = pioneers[scene.board_number - 1]
-                coords_array, colors_array, faults = self.prepare_export_arrays(pioneer, scene)
-                if not faults:
-                    if scene.position_system:
-                        binary = self.write_to_bin(coords_array, colors_array,
-                                                   [float(scene.lat_offset), float(scene.lon_offset)])
-                    else:
-                        binary = self.write_to_bin(coords_array, colors_array,
-                                                   [scene.x_offset, scene.y_offset])
-                else:
-                    return {"CANCELLED"}
-                try:
-                    self.loader.upload_lua_script(bpy.utils.user_resource('SCRIPTS') + "/addons/" + "pioneer-show.out")
-                    self.loader.set_board_number(scene.board_number - 1)
-                    self.loader.upload_bin(binary)
-                    self.loader.restart_board()
-                    self.report({"INFO"}, (LANGUAGE_PACK.get(context.scene.language)).get(
-                        "binaries_uploaded_successfully") % scene.board_number)
-                    scene.board_number += 1
-                except Exception as e:
-                    self.report({"ERROR"},
-                                (LANGUAGE_PACK.get(context.scene.language)).get("binaries_loading_error") % str(e))
-                    return {"CANCELLED"}
-        return {"FINISHED"}
-
-    def prepare_export_arrays(self, pioneer, scene):
-        coords_array = list()
-        colors_array = list()
-        faults = False
-        for frame in range(scene.frame_start, scene.frame_end + 1):
-            scene.frame_set(frame)
-            if frame % int(scene.render.fps / scene.positionFreq) == 0:
-                x, y, z = pioneer.matrix_world.to_translation()
-                coords_array.append((x + scene.x_offset * (not scene.position_system),
-                                     y + scene.y_offset * (not scene.position_system), z + scene.z_offset * (
-                                         not scene.position_system)))
-            if frame % int(scene.render.fps / scene.colorFreq) == 0:
-                r, g, b, _ = pioneer.active_material.diffuse_color
-                if r is None:
-                    faults = True
-                    self.report({"ERROR"}, (LANGUAGE_PACK.get(scene.language)).get("missed_color_error")
-                                % (pioneer.name, frame))
-                colors_array.append((r, g, b))
-        return coords_array, colors_array, faults
+        language = scene.language
+        if not (self.loader and self.loader.connected):
+            return {"FINISHED"}
+        if upload_worker.busy:
+            return {"CANCELLED"}
+        if self.loader.get_ap_firmware_version() < self.loader.actual_ap_fw_version:
+            self.report({"ERROR"},
+                        (LANGUAGE_PACK.get(language)).get("fw_version_unmatched_error").format(
+                            self.loader.actual_ap_fw_version, self.loader.get_ap_firmware_version()))
+            scene.upload_allowed = False
+            return {"FINISHED"}
+        if scene.position_system:
+            if not (self.is_float(scene.lat_offset) and self.is_float(scene.lon_offset)):
+                self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("latlon_not_float"))
+                return {"CANCELLED"}
+        pioneers = get_pioneers(context)
+        if scene.board_number > len(pioneers):
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get(
+                "binaries_drone_number_error") % scene.board_number)
+            return {"CANCELLED"}
+        # Everything touching bpy is done here, the worker gets plain data only
+        trajectories = ShowSampler(scene, [pioneers[scene.board_number - 1]]).sample()
+        if report_sampling_faults(self, trajectories, language):
+            return {"CANCELLED"}
+        try:
+            binary = pack_board_show(scene, self.loader, trajectories.positions[0], trajectories.colors[0])
+        except Exception as e:
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("binaries_loading_error") % str(e))
+            return {"CANCELLED"}
+
+        loader = self.loader
+        board_number = scene.board_number
+        script_path = bpy.utils.user_resource('SCRIPTS') + "/addons/" + "pioneer-show.out"
+        upload_params = loader.upload_gps_params if scene.position_system else loader.upload_lps_params
+
+        def upload_show():
+            loader.set_board_number(board_number - 1)
+            require(loader.upload_bin(binary), "Show binary upload failed")
+
+        self._board_number = board_number
+        self._job = upload_worker.submit(UploadJob([
+            ("params", upload_params),
+            ("script", lambda: require(loader.upload_lua_script(script_path), "Show script upload failed")),
+            ("show", upload_show),
+            ("restart", loader.restart_board),
+        ], on_stage_done=self.stage_done, on_finish=self.job_finished))
+        if context.window is None:
+            return {"FINISHED"}
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
 
     @staticmethod
-    def write_to_bin(coords_array, colors_array, origin):
-        HeaderFormat = '<BLBBBBBBBBHHfffff'
-        size = struct.calcsize(HeaderFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 2,
-            "AnimationId": 1,
-            "PreFlightColor": 249,
-            "UserColorRed": 0,
-            "UserColorGreen": 0,
-            "UserColorBlue": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-        coords_size = len(coords_array)
-        binary = b''
-        binary += b'\xaa\xbb\xcc\xdd'
-        binary += (struct.pack(HeaderFormat, meta_data['Version'],
-                               meta_data['AnimationId'],
-                               meta_data['PreFlightColor'],
-                               meta_data['UserColorRed'],
-                               meta_data['UserColorGreen'],
-                               meta_data['UserColorBlue'],
-                               meta_data['FreqPositions'],
-                               meta_data['FreqColors'],
-                               meta_data['FormatPositions'],
-                               meta_data['FormatColors'],
-                               meta_data['NumberPositions'],
-                               meta_data['NumberColors'],
-                               meta_data['TimeStart'],
-                               meta_data['TimeEnd'],
-                               meta_data['LatOrigin'],
-                               meta_data['LonOrigin'],
-                               meta_data['AltOrigin']))
-        # Points data starts at offset of 100 bytes
-        for i in range(size + 4, 100):
-            binary += b'\x00'
-        # Write points
-        for point in coords_array:
-            binary += struct.pack('<fff', point[0], point[1], point[2])
-
-        # Colors data starts at offset of 43300 bytes
-        if coords_size < 3600:
-            for _ in range(coords_size, 3600):
-                binary += b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-        # Write colors
-        for color in colors_array:
-            binary += struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
-
-        return binary
+    def stage_done(job, stage):
+        if stage == "params":
+            bpy.context.scene.upload_allowed = True
 
     @staticmethod
-    def write_to_bin_old(coords_array, colors_array, origin):
-        headerFormat = "<BBBBBBHHfffff"
-        size = struct.calcsize(headerFormat)
-        meta_data = {
-            # if -1 == should be calculated
-            "Version": 1,
-            "AnimationId": 0,
-            "FreqPositions": bpy.context.scene.positionFreq,
-            "FreqColors": bpy.context.scene.colorFreq,
-            "FormatPositions": struct.calcsize('f'),
-            "FormatColors": struct.calcsize('B'),
-            "NumberPositions": len(coords_array),
-            "NumberColors": len(colors_array),
-            "TimeStart": 0,
-            "TimeEnd": round(len(coords_array) / bpy.context.scene.positionFreq, 2),
-            "LatOrigin": origin[0],
-            "LonOrigin": origin[1],
-            "AltOrigin": 0,  # not used == 0
-        }
-        coords_size = len(coords_array)
-        binary = b''
-        binary += b'\xaa\xbb\xcc\xdd'
-        binary += struct.pack(headerFormat, meta_data['Version'],
-                              meta_data['AnimationId'],
-                              meta_data['FreqPositions'],
-                              meta_data['FreqColors'],
-                              meta_data['FormatPositions'],
-                              meta_data['FormatColors'],
-                              meta_data['NumberPositions'],
-                              meta_data['NumberColors'],
-                              meta_data['TimeStart'],
-                              meta_data['TimeEnd'],
-                              meta_data['LatOrigin'],
-                              meta_data['LonOrigin'],
-                              meta_data['AltOrigin'])
-        # Points data starts at offset of 100 bytes
-        for i in range(size + 4, 100):
-            binary += b'\x00'
-        # Write points
-        for point in coords_array:
-            binary += struct.pack('<fff', point[0], point[1], point[2])
-
-        # Colors data starts at offset of 21700 bytes
-        if coords_size < 1800:
-            for _ in range(coords_size, 1800):
-                binary += b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-        # Write colors
-        for color in colors_array:
-            binary += struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
-
-        return binary
+    def job_finished(job):
+        scene = bpy.context.scene
+        if job.succeeded:
+            scene.board_number += 1
+        elif job.stage == "params":
+            scene.upload_allowed = False
+        redraw_view3d(bpy.context)
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._job.cancel()
+        if event.type != 'TIMER':
+            return {"PASS_THROUGH"}
+        redraw_view3d(context)
+        if not self._job.finished:
+            return {"RUNNING_MODAL"}
+        context.window_manager.event_timer_remove(self._timer)
+        language = context.scene.language
+        job = self._job
+        if job.succeeded:
+            self.report({"INFO"}, (LANGUAGE_PACK.get(language)).get("params_uploaded_successfully"))
+            self.report({"INFO"}, (LANGUAGE_PACK.get(language)).get(
+                "binaries_uploaded_successfully") % self._board_number)
+            return {"FINISHED"}
+        key = "params_loading_error" if job.stage == "params" else "binaries_loading_error"
+        self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get(key) % str(job.error))
+        return {"CANCELLED"}
 
     @staticmethod
     def is_float(num):
@@ -903,6 +828,88 @@ class UploadAllToPioneer(Operator):
             return False
 
 
+class CancelUpload(Operator):
+    bl_idname = "show.cancel_upload"
+    bl_label = "Отменить загрузку"
+
+    def execute(self, context):
+        upload_worker.cancel()
+        return {"FINISHED"}
+
+
+class UploadFleet(Operator):
+    bl_idname = "show.upload_fleet"
+    bl_label = "Загрузить на все порты"
+    loader = None
+    fleet = None
+
+    def execute(self, context):
+        scene = context.scene
+        language = scene.language
+        if not self.loader:
+            return {"CANCELLED"}
+        if scene.position_system:
+            if not (UploadAllToPioneer.is_float(scene.lat_offset) and UploadAllToPioneer.is_float(scene.lon_offset)):
+                self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("latlon_not_float"))
+                return {"CANCELLED"}
+        ports = list(self.loader.get_ports_list() or [])
+        if not ports:
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("fleet_no_ports"))
+            return {"CANCELLED"}
+        trajectories = ShowSampler(scene, get_pioneers(context)).sample()
+        if report_sampling_faults(self, trajectories, language):
+            return {"CANCELLED"}
+
+        # Ports are handed over to the fleet links
+        scene.auto_connection = False
+        self.loader.disconnect()
+        UploadFleet.fleet = FleetUpload(self.loader, ports, trajectories,
+                                        bpy.utils.user_resource('SCRIPTS') + "/addons/" + "pioneer-show.out",
+                                        scene.position_system, get_origin(scene), scene.board_number,
+                                        scene.fleet_keep_numbers, scene.compact_show)
+        if context.window is None:
+            UploadFleet.fleet.wait()
+            return self.finish(context)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        wm.progress_begin(0, UploadFleet.fleet.total)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        fleet = UploadFleet.fleet
+        if event.type == 'ESC':
+            fleet.cancel()
+            self.stop_progress(context)
+            return self.finish(context)
+        if event.type != 'TIMER':
+            return {"PASS_THROUGH"}
+        context.window_manager.progress_update(fleet.done)
+        context.workspace.status_text_set((LANGUAGE_PACK.get(context.scene.language)).get("fleet_progress") % (
+            fleet.done, fleet.total))
+        redraw_view3d(context)
+        if not fleet.finished:
+            return {"RUNNING_MODAL"}
+        self.stop_progress(context)
+        return self.finish(context)
+
+    def stop_progress(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def finish(self, context):
+        fleet = UploadFleet.fleet
+        language = context.scene.language
+        for job in fleet.failed():
+            self.report({"ERROR"}, (LANGUAGE_PACK.get(language)).get("fleet_drone_error") % (
+                job.board_number, job.port, job.step, str(job.error)))
+        self.report({"INFO"}, (LANGUAGE_PACK.get(language)).get("fleet_succeed") % (
+            len(fleet.succeeded()), fleet.total))
+        return {"FINISHED"} if fleet.succeeded() else {"CANCELLED"}
+
+
 class ConfigurePanel(Panel):
     bl_idname = 'VIEW3D_PT_geoscan_config_panel'
     bl_label = 'GeoScan show'
@@ -917,6 +924,12 @@ class ConfigurePanel(Panel):
             row.prop(context.scene, prop_name, text=(LANGUAGE_PACK.get(context.scene.language)).get(prop_name))
         col.operator(CheckForLimits.bl_idname,
                      text=(LANGUAGE_PACK.get(context.scene.language)).get("CheckForLimits"))
+        row = col.row()
+        row.prop(context.scene, "live_validation",
+                 text=(LANGUAGE_PACK.get(context.scene.language)).get("live_validation"))
+        if context.scene.live_validation and live_result is not None:
+            col.label(text=(LANGUAGE_PACK.get(context.scene.language)).get("live_violations") % (
+                len(live_result.speeding), len(live_result.close)))
 
 
 class SystemPanel(Panel):
@@ -1027,6 +1040,29 @@ class ConnectionPanel(Panel):
                 _upload_all.enabled = True
         _upload_all.operator(UploadAllToPioneer.bl_idname,
                              text=(LANGUAGE_PACK.get(context.scene.language)).get("UploadAll"))
+        job = upload_worker.current
+        if job is not None:
+            _upload_all.enabled = False
+            row = col.row()
+            row.label(text=(LANGUAGE_PACK.get(context.scene.language)).get("upload_stage") % (
+                (LANGUAGE_PACK.get(context.scene.language)).get("stage_" + job.stage), job.stage_index + 1, job.total))
+            row.operator(CancelUpload.bl_idname, text=(LANGUAGE_PACK.get(context.scene.language)).get("CancelUpload"))
+
+        row = col.row()
+        row.label(text=(LANGUAGE_PACK.get(context.scene.language)).get("fleet_keep_numbers"))
+        row.prop(scene, "fleet_keep_numbers", text='')
+        row = col.row()
+        row.enabled = bool(self.loader and self.loader.get_ports_list())
+        row.operator(UploadFleet.bl_idname, text=(LANGUAGE_PACK.get(context.scene.language)).get("UploadFleet"))
+        if UploadFleet.fleet:
+            for job in UploadFleet.fleet.jobs:
+                row = col.row()
+                if job.error is not None:
+                    row.label(text=(LANGUAGE_PACK.get(context.scene.language)).get("fleet_drone_error") % (
+                        job.board_number, job.port, job.step, str(job.error)), icon='ERROR')
+                else:
+                    row.label(text=(LANGUAGE_PACK.get(context.scene.language)).get("fleet_drone_step") % (
+                        job.board_number, job.port, job.step))
 
 
 class ChangeLanguage(Operator):
@@ -1049,6 +1085,13 @@ class ChangeLanguage(Operator):
             bpy.utils.register_class(system_panel)
 
 
+# Message of every KinematicsReport kind
+LIMIT_ERRORS = {"horizontal": "speed_exceeded_error",
+                "up": "up_speed_exceeded_error",
+                "down": "down_speed_exceeded_error",
+                "acceleration": "acceleration_exceeded_error"}
+
+
 class CheckForLimits(Operator):
     bl_idname = "show.limits_checker"
     bl_label = "Check if is animation correct"
@@ -1057,76 +1100,70 @@ class CheckForLimits(Operator):
         params = {}
         for (prop_name, _) in CONFIG_PROPS:
             exec("params.update({prop_name: context.scene." + prop_name + "})")
-        speed_exceeded = False
-        frame_speed_exceeded = None
-        speed_exceeded_drone = None
-        exceeded_speed = None
-        distance_underestimated = False
-        frame_low_distance = None
-        low_distance_drones = [None, None]
-
         scene = context.scene
-        objects = context.visible_objects
-        pioneers = []
-        if params["using_name_filter"]:
-            for pioneers_obj in objects:
-                if params["drones_name"].lower() in pioneers_obj.name.lower():
-                    pioneers.append(pioneers_obj)
+        pioneers = get_pioneers(context)
+        sampler = ShowSampler(scene, pioneers)
+        limits = limits_from_params(get_nav_params(scene), horizontal_limit=params["speed_exceed_value"])
+        params_key = repr((limits, params["minimum_drone_distance"]))
+        # Drones unchanged since the last successful check are not checked against each other again
+        cache = ExportCache(scene.export_cache_path) if scene.export_cache_path else None
+        if cache:
+            flush_scene_changes()
+            trajectories, fingerprints, _ = sample_with_cache(sampler, cache, change_tracker.fingerprint)
+            validated = cache.validated(params_key)
+            checked = np.array([validated.get(name) != fingerprints[drone]
+                                for drone, name in enumerate(trajectories.names)], dtype=bool)
         else:
-            pioneers = objects
-
-        for pioneer in pioneers:
-            prev_x, prev_y, prev_z = None, None, None
-            if speed_exceeded or distance_underestimated:
-                break
-            for frame in range(scene.frame_start, scene.frame_end + 1, int(scene.render.fps / scene.positionFreq)):
-                scene.frame_set(frame)
-                x, y, z = pioneer.matrix_world.to_translation()
-                if prev_x is not None and prev_y is not None and prev_z is not None:
-                    speed = self.get_speed((x, y, z), (prev_x, prev_y, prev_z))
-                    if speed > params["speed_exceed_value"]:
-                        speed_exceeded = True
-                        frame_speed_exceeded = frame
-                        speed_exceeded_drone = pioneer.name
-                        exceeded_speed = speed
-                        break
-                prev_x, prev_y, prev_z = x, y, z
-                for another_pioneer in pioneers[pioneers.index(pioneer) + 1:]:
-                    _x, _y, _z = another_pioneer.matrix_world.to_translation()
-                    distance = self.get_distance((x, y, z), (_x, _y, _z))
-                    if distance < context.scene.minimum_drone_distance:
-                        distance_underestimated = True
-                        frame_low_distance = frame
-                        low_distance_drones = [pioneer.name, another_pioneer.name]
-                        break
-
-        if not speed_exceeded and not distance_underestimated:
+            trajectories = sampler.sample()
+            checked = np.ones(len(trajectories), dtype=bool)
+        if report_sampling_faults(self, trajectories, scene.language):
+            return {"CANCELLED"}
+        positions = trajectories.positions
+        checked_drones = np.nonzero(checked)[0]
+
+        kinematics = KinematicsReport(positions[checked_drones], trajectories.position_period, limits)
+        speed_violations = [(checked_drones[drone], kind, tick, value, limit)
+                            for (drone, kind, tick, value, limit) in kinematics.violations()]
+        print(kinematics.format_table([trajectories.names[drone] for drone in checked_drones]))
+
+        frames = trajectories.position_frames
+        violations = find_separation_violations(positions.transpose(1, 0, 2), params["minimum_drone_distance"],
+                                                scene.grid_drone_threshold, only=checked)
+        for tick, first, second, distance in violations:
+            print("Distance %.2f m on frame %d between %s and %s" % (
+                distance, frames[tick], trajectories.names[first], trajectories.names[second]))
+        # Drones fly straight between the sampled points and may cross each other in between
+        swept = find_swept_violations(positions.transpose(1, 0, 2), params["minimum_drone_distance"],
+                                      scene.grid_drone_threshold, only=checked)
+        sampled_pairs = set((first, second) for (first, second, _, _) in violations.pairs())
+        crossings = [pair for pair in swept.pairs() if (pair[0], pair[1]) not in sampled_pairs]
+        for (first, second, tick, distance) in crossings:
+            print("Distance %.2f m between frames %d and %d between %s and %s" % (
+                distance, frames[tick], frames[tick + 1], trajectories.names[first], trajectories.names[second]))
+
+        if not speed_violations and not len(violations) and not crossings:
+            if cache:
+                cache.store_validation(params_key, trajectories.names, fingerprints)
+                cache.save()
             bpy.context.scene.export_allowed = True
             self.report({"INFO"}, (LANGUAGE_PACK.get(context.scene.language)).get("CheckSuccess"))
         else:
             bpy.context.scene.export_allowed = False
-            if speed_exceeded:
-                self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get("speed_exceeded_error") % (
-                    frame_speed_exceeded,
-                    speed_exceeded_drone,
-                    exceeded_speed))
-            else:
+            for (drone, kind, tick, value, _) in speed_violations:
+                self.report({"ERROR"}, (LANGUAGE_PACK.get(context.scene.language)).get(LIMIT_ERRORS[kind]) % (
+                    frames[tick],
+                    trajectories.names[drone],
+                    value))
+            for (first, second, tick, _) in violations.pairs():
                 self.report({"ERROR"},
                             (LANGUAGE_PACK.get(context.scene.language)).get("distance_underestimated_error")
-                            % (frame_low_distance, low_distance_drones[0], low_distance_drones[1]))
+                            % (frames[tick], trajectories.names[first], trajectories.names[second]))
+            for (first, second, tick, _) in crossings:
+                self.report({"ERROR"},
+                            (LANGUAGE_PACK.get(context.scene.language)).get("distance_swept_error")
+                            % (frames[tick], frames[tick + 1], trajectories.names[first], trajectories.names[second]))
         return {"FINISHED"}
 
-    @staticmethod
-    def get_distance(p1, p2):
-        return math.sqrt((p1[0] - p2[0]) ** 2 +
-                         (p1[1] - p2[1]) ** 2 +
-                         (p1[2] - p2[2]) ** 2
-                         )
-
-    def get_speed(self, p1, p2):
-        diff_time = 1 / bpy.context.scene.render.fps
-        return self.get_distance(p1, p2) / diff_time
-
 
 class TOPBAR_MT_geoscan_menu(bpy.types.Menu):
     bl_label = "GeoScan"
@@ -1168,16 +1205,27 @@ classes_loader.append(DisconnectPioneer)
 # classes_loader.append(UploadNavSystemParams)
 # classes_loader.append(UploadFilesToPioneer)
 classes_loader.append(UploadAllToPioneer)
+classes_loader.append(UploadFleet)
+classes_loader.append(CancelUpload)
 classes_loader.append(ConnectionPanel)
 
 
 def _disable_uploading_on_startup():
-    while not ("scene" in dir(bpy.context)):
-        pass
+    # Timers run once Blender has a context with the scene
+    if not hasattr(bpy.context, "scene"):
+        return 0.1
     bpy.context.scene.upload_allowed = False
+    return None
+
+
+def _start_serial_master(loader):
+    # Port watching and auto connection start after Blender has finished loading
+    loader.serial_master
+    return None
 
 
 def register():
+    started = time.perf_counter()
     for (prop_name, prop_value) in CONFIG_PROPS:
         setattr(bpy.types.Scene, prop_name, prop_value)
 
@@ -1197,7 +1245,6 @@ def register():
         bpy.utils.register_class(cls)
 
     loader = Loader(bpy.utils.user_resource('SCRIPTS'), connection_state_handler)
-    time.sleep(1)
     for loader_cls in classes_loader:
         loader_cls.loader = loader
 
@@ -1205,16 +1252,26 @@ def register():
         bpy.utils.register_class(cls)
 
     bpy.types.TOPBAR_MT_editor_menus.append(TOPBAR_MT_geoscan_menu.menu_draw)
-    bpy.app.handlers.depsgraph_update_pre.append(scene_change_handler)
+    bpy.app.handlers.depsgraph_update_post.append(scene_change_handler)
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handlers.append(scene_reload_handler)
+
+    bpy.app.timers.register(_disable_uploading_on_startup, first_interval=0)
+    bpy.app.timers.register(lambda: _start_serial_master(loader), first_interval=1)
 
-    _disable_uploading_on_startup_thread = threading.Thread(target=_disable_uploading_on_startup)
-    _disable_uploading_on_startup_thread.start()
+    elapsed = time.perf_counter() - started
+    print("Pioneer addon registered in {:.3f} s".format(elapsed))
+    if elapsed > REGISTER_BUDGET:
+        print("Pioneer addon registration took longer than {} s".format(REGISTER_BUDGET))
 
 
 def unregister():
     bpy.context.scene.export_allowed = False
-    [bpy.app.handlers.depsgraph_update_pre.remove(h) for h in bpy.app.handlers.depsgraph_update_pre if
+    stop_live_validation()
+    [bpy.app.handlers.depsgraph_update_post.remove(h) for h in bpy.app.handlers.depsgraph_update_post if
      h.__name__ == "scene_change_handler"]
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        [handlers.remove(h) for h in handlers if h.__name__ == "scene_reload_handler"]
     bpy.types.TOPBAR_MT_editor_menus.remove(TOPBAR_MT_geoscan_menu.menu_draw)
     for (prop_name, _) in CONFIG_PROPS:
         delattr(bpy.types.Scene, prop_name)
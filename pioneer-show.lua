@@ -12,10 +12,91 @@ local state = {
     inCheck = 5
 }
 
-local periodColors = 1 / NandLua.readFreqColors()
-local numColors = NandLua.readNumberColors()
-local periodPositions = 1 / NandLua.readFreqPositions()
-local numPositions = NandLua.readNumberPositions()
+local POSITIONS_DELTA_CM = 0x82
+local POSITIONS_BLOCK = 64
+local COLORS_RLE = 0x81
+
+-- Version 3 shows are parsed from the raw show file, older versions through the firmware accessors.
+-- NandLua.read(offset, length) is expected from the firmware that reads version 3, released firmware
+-- lacks it and the reader falls back to the accessors. The shipped pioneer-show.out does not contain
+-- this reader yet, the addon does not export version 3 until it is rebuilt (SHOW_SCRIPT_READS_V3 of show_bin.py).
+local function readShowV3()
+    if NandLua.read == nil then
+        return nil
+    end
+    local header = NandLua.read(0, 64)
+    if header == nil or string.len(header) < 61 or string.sub(header, 1, 4) ~= "\xaa\xbb\xcc\xdd"
+            or string.byte(header, 5) ~= 3 then
+        return nil
+    end
+    local _, _, _, _, _, _, freqPositions, freqColors, formatPositions, formatColors, numberPositions, numberColors,
+        _, _, latOrigin, lonOrigin, altOrigin, positionsOffset, _, colorsOffset =
+        string.unpack("<BI4BBBBBBBBI4I4fffffI4I4I4I4", header, 5)
+    local show = {
+        readFreqPositions = function() return freqPositions end,
+        readFreqColors = function() return freqColors end,
+        readNumberPositions = function() return numberPositions end,
+        readNumberColors = function() return numberColors end,
+        readPositionOrigin = function() return latOrigin, lonOrigin, altOrigin end,
+        readPosition = function(id)
+            local x, y, z = string.unpack("<fff", NandLua.read(positionsOffset + id * 12, 12))
+            return x, y, z
+        end,
+        readColor = function(id)
+            local r, g, b = string.byte(NandLua.read(colorsOffset + id * 3, 3), 1, 3)
+            return r / 255, g / 255, b / 255
+        end
+    }
+    if formatPositions == POSITIONS_DELTA_CM then
+        -- Blocks of an absolute int32 centimetre point and int16 deltas, the last point is kept for sequential reads
+        local blockSize = 12 + (POSITIONS_BLOCK - 1) * 6
+        local lastId, lastX, lastY, lastZ
+        show.readPosition = function(id)
+            local blockStart = positionsOffset + (id // POSITIONS_BLOCK) * blockSize
+            local step = id % POSITIONS_BLOCK
+            if lastId ~= nil and id == lastId + 1 and step ~= 0 then
+                local dx, dy, dz = string.unpack("<i2i2i2", NandLua.read(blockStart + 12 + (step - 1) * 6, 6))
+                lastX, lastY, lastZ = lastX + dx, lastY + dy, lastZ + dz
+            else
+                local block = NandLua.read(blockStart, 12 + step * 6)
+                local x, y, z, pos = string.unpack("<i4i4i4", block)
+                for _ = 1, step do
+                    local dx, dy, dz
+                    dx, dy, dz, pos = string.unpack("<i2i2i2", block, pos)
+                    x, y, z = x + dx, y + dy, z + dz
+                end
+                lastX, lastY, lastZ = x, y, z
+            end
+            lastId = id
+            return lastX / 100, lastY / 100, lastZ / 100
+        end
+    end
+    if formatColors == COLORS_RLE then
+        -- Runs of an uint16 length and a color, scanned forward from the last run
+        local runIndex, runStart, runLength, runColor = 0, 0, 0, { 0, 0, 0 }
+        show.readColor = function(id)
+            if id < runStart then
+                runIndex, runStart, runLength = 0, 0, 0
+            end
+            while id >= runStart + runLength do
+                runStart = runStart + runLength
+                local length, r, g, b = string.unpack("<I2BBB", NandLua.read(colorsOffset + runIndex * 5, 5))
+                runIndex = runIndex + 1
+                runLength = length
+                runColor = { r / 255, g / 255, b / 255 }
+            end
+            return unpack(runColor)
+        end
+    end
+    return show
+end
+
+local show = readShowV3() or NandLua
+
+local periodColors = 1 / show.readFreqColors()
+local numColors = show.readNumberColors()
+local periodPositions = 1 / show.readFreqPositions()
+local numPositions = show.readNumberPositions()
 local idPoint = 0
 local idColor = 0
 local onPosition = false
@@ -90,7 +171,7 @@ local function getGNSSState()
             changeColor({ 1, 1, 0 }) -- yellow
         elseif gnssRtk == 0 then
             changeColor({ 1, 0, 1 }) -- purple
-            local originLat, originLon, _ = NandLua.readPositionOrigin()
+            local originLat, originLon, _ = show.readPositionOrigin()
             local _, _, originAlt = Sensors.gnssPosition()
             if originLat ~= nil and originLon ~= nil and originAlt ~= nil then
                 ap.setGpsOrigin(originLat, originLon, originAlt)
@@ -98,7 +179,7 @@ local function getGNSSState()
         elseif gnssRtk == 1 then
             changeColor({ 0, 0, 1 }) -- blue
             GNSSReady = true
-            local originLat, originLon, _ = NandLua.readPositionOrigin()
+            local originLat, originLon, _ = show.readPositionOrigin()
             local _, _, originAlt = Sensors.gnssPosition()
             if originLat ~= nil and originLon ~= nil and originAlt ~= nil then
                 ap.setGpsOrigin(originLat, originLon, originAlt)
@@ -106,7 +187,7 @@ local function getGNSSState()
         elseif gnssRtk == 2 then
             changeColor({ 0, 1, 0 }) -- green
             GNSSReady = true
-            local originLat, originLon, _ = NandLua.readPositionOrigin()
+            local originLat, originLon, _ = show.readPositionOrigin()
             local _, _, originAlt = Sensors.gnssPosition()
             if originLat ~= nil and originLon ~= nil and originAlt ~= nil then
                 ap.setGpsOrigin(originLat, originLon, originAlt)
@@ -122,7 +203,7 @@ local function checkOriginPosition()
         if navSystem == 1 then
             local lpsPosition = Sensors.lpsPosition
             local x1, y1, z1 = lpsPosition() -- current position
-            local x2, y2, z2 = NandLua.readPosition(curr_ind_point) -- origin position
+            local x2, y2, z2 = show.readPosition(curr_ind_point) -- origin position
             if (math.abs(x1 - x2) <= dist_check_position) and math.abs(y1 - y2) <= dist_check_position then
                 changeColor({ 0, 1, 0 }) -- green
                 onPosition = true
@@ -150,7 +231,7 @@ end
 local function colorLoop(startTime)
     if selfState == state.flight and idColor < numColors then
         local colorTime = (idColor + 1) * periodColors
-        changeColor({ NandLua.readColor(idColor) })
+        changeColor({ show.readColor(idColor) })
         idColor = idColor + 1
         Timer.callAtGlobal(startTime + colorTime, function()
             colorLoop(startTime)
@@ -166,7 +247,7 @@ local function positionLoop(startTime)
 
     local pointTime = (idPoint + 1) * periodPositions
     if selfState == state.flight and idPoint < numPositions then
-        local x, y, z = NandLua.readPosition(idPoint)
+        local x, y, z = show.readPosition(idPoint)
         ap.goToLocalPoint(x, y, z, periodPositions)
         logMessage(string.format("point #%d", idPoint))
         idPoint = idPoint + 1
@@ -222,7 +303,7 @@ end
 local function init()
     if navSystem == 0 then
         -- GPS
-        local x, y, z = NandLua.readPosition(0)
+        local x, y, z = show.readPosition(0)
         ap.setFirstPoint(x, y, z)
         GNSSReady = false
     elseif navSystem == 1 then
@@ -0,0 +1,212 @@
+import bisect
+
+import numpy as np
+
+# Position ticks sampled at once by ShowSampler.windows
+WINDOW_TICKS = 1024
+
+
+def sample_frames(frame_start, frame_end, fps, freq):
+    step = max(int(fps / freq), 1)
+    return [frame for frame in range(frame_start, frame_end + 1) if frame % step == 0]
+
+
+def scene_offset(scene):
+    # Offsets are applied only for the local (indoor) navigation system
+    if scene.position_system:
+        return np.zeros(3, dtype=np.float32)
+    return np.array([scene.x_offset, scene.y_offset, scene.z_offset], dtype=np.float32)
+
+
+def plain_action_fcurves(id_data):
+    """ F-curves of an action assigned directly to the datablock
+
+        None if its animation needs full depsgraph evaluation (drivers, NLA, blending).
+    """
+    anim = id_data.animation_data
+    if anim is None:
+        return {}
+    if len(anim.drivers) or any(len(track.strips) and not track.mute for track in anim.nla_tracks):
+        return None
+    action = anim.action
+    if action is None:
+        return {}
+    if anim.action_influence != 1.0 or anim.action_blend_type != 'REPLACE':
+        return None
+    fcurves = getattr(action, "fcurves", None)
+    if fcurves is None:
+        return None
+    return {(fcurve.data_path, fcurve.array_index): fcurve for fcurve in fcurves if not fcurve.mute}
+
+
+def direct_curves(pioneer):
+    """ Object and material F-curves of a purely keyframed drone, None for complex rigs
+
+        Without parents and constraints matrix_world translation is location + delta_location.
+    """
+    if pioneer.parent is not None or len(pioneer.constraints) or getattr(pioneer, "rigid_body", None) is not None:
+        return None
+    material = pioneer.active_material
+    if material is None:
+        return None
+    object_curves = plain_action_fcurves(pioneer)
+    material_curves = plain_action_fcurves(material)
+    if object_curves is None or material_curves is None:
+        return None
+    return object_curves, material_curves
+
+
+def evaluate_curves(curves, data_path, values, frames):
+    """ (frames, len(values)) array of a property, static values for channels without F-curves """
+    result = np.empty((len(frames), len(values)), dtype=np.float32)
+    for index, value in enumerate(values):
+        fcurve = curves.get((data_path, index))
+        if fcurve is None:
+            result[:, index] = value
+        else:
+            result[:, index] = [fcurve.evaluate(frame) for frame in frames]
+    return result
+
+
+class ShowTrajectories:
+    """ Positions and colors of every drone sampled on the show ticks
+
+        positions: (drones, position ticks, 3) float32, meters
+        colors: (drones, color ticks, 3) float32, 0..1
+        position_start, color_start: index of the first tick in the whole show, for windows of it
+    """
+
+    def __init__(self, names, position_frames, color_frames, fps, position_freq, color_freq, position_start=0,
+                 color_start=0):
+        self.names = list(names)
+        self.position_frames = np.array(position_frames, dtype=np.int32)
+        self.color_frames = np.array(color_frames, dtype=np.int32)
+        self.fps = fps
+        self.position_freq = position_freq
+        self.color_freq = color_freq
+        self.position_start = position_start
+        self.color_start = color_start
+        self.positions = np.zeros((len(self.names), len(position_frames), 3), dtype=np.float32)
+        self.colors = np.zeros((len(self.names), len(color_frames), 3), dtype=np.float32)
+        self.faults = []
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def position_period(self):
+        return max(int(self.fps / self.position_freq), 1) / self.fps
+
+
+class ShowSampler:
+    """ Steps the timeline once and reads every drone on each position/color tick
+
+        Purely keyframed drones are evaluated from their F-curves without changing the frame.
+    """
+
+    def __init__(self, scene, pioneers, position_freq=None, color_freq=None, offset=None,
+                 direct_evaluation: bool = True):
+        # Settings default to the addon scene properties
+        self.scene = scene
+        self.pioneers = list(pioneers)
+        self.position_freq = position_freq or scene.positionFreq
+        self.color_freq = color_freq or scene.colorFreq
+        self.offset = scene_offset(scene) if offset is None else np.asarray(offset, dtype=np.float32)
+        # Time remapping changes which action frame is shown on a scene frame
+        self.direct_evaluation = direct_evaluation and \
+            getattr(scene.render, "frame_map_old", 100) == getattr(scene.render, "frame_map_new", 100)
+
+    def settings(self):
+        scene = self.scene
+        return (scene.frame_start, scene.frame_end, scene.render.fps, self.position_freq, self.color_freq,
+                self.offset.tolist())
+
+    def frames(self):
+        """ Scene frames of the position and color ticks """
+        scene = self.scene
+        fps = scene.render.fps
+        return (sample_frames(scene.frame_start, scene.frame_end, fps, self.position_freq),
+                sample_frames(scene.frame_start, scene.frame_end, fps, self.color_freq))
+
+    def trajectories(self):
+        """ Empty buffers of all drones for the show ticks """
+        position_frames, color_frames = self.frames()
+        return ShowTrajectories([pioneer.name for pioneer in self.pioneers], position_frames, color_frames,
+                                self.scene.render.fps, self.position_freq, self.color_freq)
+
+    def windows(self, window_ticks=WINDOW_TICKS):
+        """ Samples the show in consecutive windows of at most window_ticks position ticks
+
+            Yields ShowTrajectories of every window, so memory does not grow with the show length.
+            Colors go to the window of the position tick before them.
+            Used by batch_export, the addon samples whole shows as its cache and viewport keep whole arrays.
+        """
+        position_frames, color_frames = self.frames()
+        names = [pioneer.name for pioneer in self.pioneers]
+        bounds = position_frames[window_ticks::window_ticks]
+        position_start = color_start = 0
+        for i in range(len(bounds) + 1):
+            position_end = min(position_start + window_ticks, len(position_frames))
+            color_end = bisect.bisect_left(color_frames, bounds[i]) if i < len(bounds) else len(color_frames)
+            window = ShowTrajectories(names, position_frames[position_start:position_end],
+                                      color_frames[color_start:color_end], self.scene.render.fps,
+                                      self.position_freq, self.color_freq, position_start, color_start)
+            yield self.sample(None, window)
+            position_start, color_start = position_end, color_end
+
+    def sample(self, drones=None, trajectories=None):
+        """ Samples the given drone indices (all by default) into trajectories, other rows are left as is """
+        scene = self.scene
+        if trajectories is None:
+            trajectories = self.trajectories()
+        if drones is None:
+            drones = range(len(self.pioneers))
+        targets = []
+        for drone in drones:
+            pioneer = self.pioneers[drone]
+            curves = direct_curves(pioneer) if self.direct_evaluation else None
+            if curves is None:
+                targets.append((drone, pioneer))
+            else:
+                self.sample_curves(drone, pioneer, curves, trajectories)
+        if not targets:
+            return trajectories
+        position_ticks = {frame: i for i, frame in enumerate(trajectories.position_frames.tolist())}
+        color_ticks = {frame: i for i, frame in enumerate(trajectories.color_frames.tolist())}
+        positions = trajectories.positions
+        colors = trajectories.colors
+        missed_color = set()
+
+        current_frame = scene.frame_current
+        for frame in sorted(position_ticks.keys() | color_ticks.keys()):
+            scene.frame_set(frame)
+            tick = position_ticks.get(frame)
+            if tick is not None:
+                for drone, pioneer in targets:
+                    positions[drone, tick] = pioneer.matrix_world.translation
+            tick = color_ticks.get(frame)
+            if tick is not None:
+                for drone, pioneer in targets:
+                    material = pioneer.active_material
+                    if material is None:
+                        if drone not in missed_color:
+                            missed_color.add(drone)
+                            trajectories.faults.append((pioneer.name, frame))
+                        continue
+                    colors[drone, tick] = material.diffuse_color[:3]
+        scene.frame_set(current_frame)
+
+        for drone, _ in targets:
+            positions[drone] += self.offset
+        return trajectories
+
+    def sample_curves(self, drone, pioneer, curves, trajectories):
+        object_curves, material_curves = curves
+        position_frames = trajectories.position_frames.tolist()
+        trajectories.positions[drone] = \
+            evaluate_curves(object_curves, "location", pioneer.location, position_frames) + \
+            evaluate_curves(object_curves, "delta_location", pioneer.delta_location, position_frames) + \
+            self.offset
+        trajectories.colors[drone] = evaluate_curves(material_curves, "diffuse_color",
+                                                     pioneer.active_material.diffuse_color[:3],
+                                                     trajectories.color_frames.tolist())
@@ -0,0 +1,287 @@
+import itertools
+
+import numpy as np
+
+GRID_DRONE_THRESHOLD = 100
+
+# Bytes of temporaries allowed per processed block of frames
+_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Own cell plus half of the 26 neighbours: every unordered pair of cells is visited once
+_HALF_NEIGHBOURS = [offset for offset in itertools.product((-1, 0, 1), repeat=3) if offset > (0, 0, 0)]
+
+
+class SeparationViolations:
+    """ Every (tick, first drone, second drone) pair closer than the minimum distance
+
+        ticks, first, second: int arrays, first < second
+        distances: closest distance of the pair on that tick
+        fractions: for swept checks, position of the closest approach between tick and tick + 1 (0..1)
+    """
+
+    def __init__(self, ticks, first, second, distances, fractions=None):
+        order = np.lexsort((second, first, ticks))
+        self.ticks = ticks[order]
+        self.first = first[order]
+        self.second = second[order]
+        self.distances = distances[order]
+        if fractions is None:
+            fractions = np.zeros(len(ticks), dtype=np.float32)
+        self.fractions = fractions[order]
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __iter__(self):
+        return zip(self.ticks.tolist(), self.first.tolist(), self.second.tolist(), self.distances.tolist())
+
+    def pairs(self):
+        """ Worst tick of every violating pair as (first, second, tick, distance) """
+        result = {}
+        for tick, first, second, distance in self:
+            worst = result.get((first, second))
+            if worst is None or distance < worst[3]:
+                result[(first, second)] = (first, second, tick, distance)
+        return sorted(result.values())
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                   np.zeros(0, dtype=np.float32))
+
+    @classmethod
+    def concatenate(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        return cls(np.concatenate([part.ticks for part in parts]),
+                   np.concatenate([part.first for part in parts]),
+                   np.concatenate([part.second for part in parts]),
+                   np.concatenate([part.distances for part in parts]),
+                   np.concatenate([part.fractions for part in parts]))
+
+
+def _frame_blocks(frames, bytes_per_frame):
+    block = max(int(_BLOCK_BYTES // max(bytes_per_frame, 1)), 1)
+    for start in range(0, frames, block):
+        yield start, min(start + block, frames)
+
+
+def _involving(only, first, second):
+    # Pairs with at least one drone of the boolean mask, all pairs without a mask
+    if only is None:
+        return np.ones(len(first), dtype=bool)
+    return only[first] | only[second]
+
+
+def brute_force_violations(positions, min_distance, only=None):
+    """ Broadcasted distances of all drone pairs on every tick of a (ticks, drones, 3) array """
+    positions = np.asarray(positions, dtype=np.float32)
+    ticks, drones, _ = positions.shape
+    first, second = np.triu_indices(drones, 1)
+    involved = _involving(only, first, second)
+    first, second = first[involved], second[involved]
+    if not len(first):
+        return SeparationViolations.empty()
+    min_distance_sq = min_distance * min_distance
+    parts = []
+    for start, end in _frame_blocks(ticks, len(first) * 3 * 4 * 2):
+        block = positions[start:end]
+        diff = block[:, first] - block[:, second]
+        distance_sq = np.einsum('fpk,fpk->fp', diff, diff)
+        tick, pair = np.nonzero(distance_sq < min_distance_sq)
+        parts.append(SeparationViolations(tick + start, first[pair], second[pair],
+                                          np.sqrt(distance_sq[tick, pair])))
+    return SeparationViolations.concatenate(parts)
+
+
+def grid_candidates(points, cell_size):
+    """ Candidate pairs of a uniform-grid spatial hash built per tick
+
+        points: (ticks, drones, 3); cell_size: scalar or one size per tick.
+        Returns (tick, first, second) of every pair sharing a cell or touching neighbour cells.
+    """
+    ticks, drones, _ = points.shape
+    cell_size = np.broadcast_to(np.asarray(cell_size, dtype=np.float64), (ticks,))
+    cells = np.floor(points / cell_size[:, None, None]).astype(np.int64)
+    # Shift cells so that every neighbour of an occupied cell has non-negative coordinates
+    cells -= cells.min(axis=(0, 1)) - 1
+    dims = cells.max(axis=(0, 1)) + 2
+    tick = np.repeat(np.arange(ticks, dtype=np.int64), drones)
+    flat_cells = cells.reshape(-1, 3)
+    keys = ((tick * dims[0] + flat_cells[:, 0]) * dims[1] + flat_cells[:, 1]) * dims[2] + flat_cells[:, 2]
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    left = np.arange(1, len(sorted_keys) + 1)
+    right = np.searchsorted(sorted_keys, sorted_keys, side='right')
+
+    sources, partners = [], []
+    for offset in [(0, 0, 0)] + _HALF_NEIGHBOURS:
+        if offset != (0, 0, 0):
+            neighbour_keys = sorted_keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+            left = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+            right = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+        counts = right - left
+        counts[counts < 0] = 0
+        total = counts.sum()
+        if not total:
+            continue
+        source = np.repeat(np.arange(len(sorted_keys)), counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        partner = np.repeat(left, counts) + (np.arange(total) - starts)
+        sources.append(order[source])
+        partners.append(order[partner])
+
+    if not sources:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    sources = np.concatenate(sources)
+    partners = np.concatenate(partners)
+    first = np.minimum(sources, partners) % drones
+    second = np.maximum(sources, partners) % drones
+    return sources // drones, first, second
+
+
+def grid_violations(positions, min_distance, only=None):
+    """ Spatial hash with cell size equal to the minimum distance, exact check of candidate pairs """
+    positions = np.asarray(positions, dtype=np.float32)
+    ticks, drones, _ = positions.shape
+    min_distance_sq = min_distance * min_distance
+    parts = []
+    for start, end in _frame_blocks(ticks, drones * 27 * 8 * 4):
+        block = positions[start:end]
+        tick, first, second = grid_candidates(block, min_distance)
+        involved = _involving(only, first, second)
+        tick, first, second = tick[involved], first[involved], second[involved]
+        diff = block[tick, first] - block[tick, second]
+        distance_sq = np.einsum('pk,pk->p', diff, diff)
+        close = distance_sq < min_distance_sq
+        parts.append(SeparationViolations(tick[close] + start, first[close], second[close],
+                                          np.sqrt(distance_sq[close])))
+    return SeparationViolations.concatenate(parts)
+
+
+def find_separation_violations(positions, min_distance, grid_threshold=GRID_DRONE_THRESHOLD, only=None):
+    """ All pairs of drones closer than min_distance on any sampled tick
+
+        only: optional boolean mask of drones, pairs without any of them are not checked
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    if positions.ndim != 3 or positions.shape[1] < 2 or positions.shape[0] == 0:
+        return SeparationViolations.empty()
+    if positions.shape[1] > grid_threshold and min_distance > 0:
+        return grid_violations(positions, min_distance, only)
+    return brute_force_violations(positions, min_distance, only)
+
+
+def closest_approach(start_first, end_first, start_second, end_second):
+    """ Closest distance of two drones flying straight from start to end over the same interval
+
+        Matches the linear motion of ap.goToLocalPoint between two show points.
+        Returns distances and the interval fraction (0..1) where they are reached.
+    """
+    start = start_first - start_second
+    motion = (end_first - end_second) - start
+    motion_sq = np.einsum('...k,...k->...', motion, motion)
+    projection = np.einsum('...k,...k->...', start, motion)
+    fraction = np.zeros_like(motion_sq)
+    moving = motion_sq > 1e-12
+    fraction[moving] = np.clip(-projection[moving] / motion_sq[moving], 0.0, 1.0)
+    closest = start + motion * fraction[..., None]
+    return np.sqrt(np.einsum('...k,...k->...', closest, closest)), fraction
+
+
+def _swept_candidates(starts, ends, min_distance):
+    """ Pairs whose swept AABBs, grown by min_distance, overlap within each interval """
+    lower = np.minimum(starts, ends)
+    upper = np.maximum(starts, ends)
+    centers = (lower + upper) * 0.5
+    extents = (upper - lower) * 0.5
+    # Any overlapping pair has centers at most one cell apart on every axis
+    cell_size = min_distance + 2.0 * extents.max(axis=(1, 2))
+    interval, first, second = grid_candidates(centers, cell_size)
+    reach = extents[interval, first] + extents[interval, second] + min_distance
+    overlap = np.all(np.abs(centers[interval, first] - centers[interval, second]) <= reach, axis=1)
+    return interval[overlap], first[overlap], second[overlap]
+
+
+def _swept_all_pairs(intervals, drones, only):
+    first, second = np.triu_indices(drones, 1)
+    involved = _involving(only, first, second)
+    first, second = first[involved], second[involved]
+    interval = np.repeat(np.arange(intervals), len(first))
+    return interval, np.tile(first, intervals), np.tile(second, intervals)
+
+
+def find_swept_violations(positions, min_distance, grid_threshold=GRID_DRONE_THRESHOLD, only=None):
+    """ Pairs of drones passing closer than min_distance between two consecutive ticks
+
+        ticks of the result are the interval start ticks, fractions locate the closest approach.
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    if positions.ndim != 3 or positions.shape[1] < 2 or positions.shape[0] < 2:
+        return SeparationViolations.empty()
+    ticks, drones, _ = positions.shape
+    use_grid = drones > grid_threshold and min_distance > 0
+    bytes_per_interval = drones * 27 * 8 * 4 if use_grid else drones * (drones - 1) * 3 * 4 * 2
+    parts = []
+    for start, end in _frame_blocks(ticks - 1, bytes_per_interval):
+        starts = positions[start:end]
+        ends = positions[start + 1:end + 1]
+        if use_grid:
+            interval, first, second = _swept_candidates(starts, ends, min_distance)
+            involved = _involving(only, first, second)
+            interval, first, second = interval[involved], first[involved], second[involved]
+        else:
+            interval, first, second = _swept_all_pairs(end - start, drones, only)
+        distances, fractions = closest_approach(starts[interval, first], ends[interval, first],
+                                                starts[interval, second], ends[interval, second])
+        close = distances < min_distance
+        parts.append(SeparationViolations(interval[close] + start, first[close], second[close],
+                                          distances[close], fractions[close]))
+    return SeparationViolations.concatenate(parts)
+
+
+def _shifted(violations, ticks):
+    return SeparationViolations(violations.ticks + ticks, violations.first, violations.second, violations.distances,
+                                violations.fractions)
+
+
+class WindowedSeparation:
+    """ Sampled and swept separation violations of positions fed in consecutive windows of ticks
+
+        Only the last tick of the previous window is kept, for the interval crossing into the next one.
+    """
+
+    def __init__(self, min_distance, grid_threshold=GRID_DRONE_THRESHOLD):
+        self.min_distance = min_distance
+        self.grid_threshold = grid_threshold
+        self.ticks = 0
+        self.last = None
+        self.sampled_parts = []
+        self.swept_parts = []
+
+    def add(self, positions):
+        """ positions: (ticks, drones, 3) following the previously added ones """
+        positions = np.asarray(positions, dtype=np.float32)
+        if not len(positions):
+            return
+        sampled = find_separation_violations(positions, self.min_distance, self.grid_threshold)
+        self.sampled_parts.append(_shifted(sampled, self.ticks))
+        if self.last is None:
+            block, start = positions, self.ticks
+        else:
+            block, start = np.concatenate((self.last[None], positions)), self.ticks - 1
+        swept = find_swept_violations(block, self.min_distance, self.grid_threshold)
+        self.swept_parts.append(_shifted(swept, start))
+        self.last = positions[-1].copy()
+        self.ticks += len(positions)
+
+    @property
+    def sampled(self):
+        return SeparationViolations.concatenate(self.sampled_parts)
+
+    @property
+    def swept(self):
+        return SeparationViolations.concatenate(self.swept_parts)
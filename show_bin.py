@@ -0,0 +1,465 @@
+import os
+import shutil
+import struct
+
+import numpy as np
+
+CONTROL_SEQUENCE = b'\xaa\xbb\xcc\xdd'
+HEADER_FORMATS = {
+    1: "<BBBBBBHHfffff",
+    2: '<BLBBBBBBBBHHfffff',
+    # Same fields as version 2 with 32-bit counters, followed by offsets and lengths of points and colors
+    3: '<BLBBBBBBBBIIfffffIIII',
+}
+# Names of the HEADER_FORMATS fields
+HEADER_FIELDS = {
+    1: ("Version", "AnimationId", "FreqPositions", "FreqColors", "FormatPositions", "FormatColors", "NumberPositions",
+        "NumberColors", "TimeStart", "TimeEnd", "LatOrigin", "LonOrigin", "AltOrigin"),
+    2: ("Version", "AnimationId", "PreFlightColor", "UserColorRed", "UserColorGreen", "UserColorBlue",
+        "FreqPositions", "FreqColors", "FormatPositions", "FormatColors", "NumberPositions", "NumberColors",
+        "TimeStart", "TimeEnd", "LatOrigin", "LonOrigin", "AltOrigin"),
+}
+HEADER_FIELDS[3] = HEADER_FIELDS[2] + ("PointsOffset", "PointsLength", "ColorsOffset", "ColorsLength")
+# Points data starts at offset of 100 bytes
+POINTS_OFFSET = 100
+# Colors data starts right after the maximum number of points
+MAX_POINTS = {
+    1: 1800,
+    2: 3600,
+}
+# Version 3 has no fixed layout: points follow the header, colors follow the points
+V3_POINTS_OFFSET = (len(CONTROL_SEQUENCE) + struct.calcsize(HEADER_FORMATS[3]) + 3) // 4 * 4
+# Autopilot firmware range of each fixed layout
+V1_MAX_FIRMWARE = 8123
+V2_MIN_FIRMWARE = 8016
+# Version 3 section encodings, stored in FormatPositions and FormatColors
+POSITIONS_FLOAT = 4
+COLORS_RAW = 1
+# Blocks of an absolute int32 centimetre point followed by int16 centimetre deltas to the next points
+POSITIONS_DELTA_CM = 0x82
+POSITIONS_BLOCK = 64
+# Runs of an uint16 length and a color
+COLORS_RLE = 0x81
+RUN_DTYPE = np.dtype([('length', '<u2'), ('color', 'u1', 3)])
+POINT_DTYPE = np.dtype('<f4')
+COLOR_DTYPE = np.dtype('u1')
+POINT_SIZE = 3 * POINT_DTYPE.itemsize
+COLOR_SIZE = 3 * COLOR_DTYPE.itemsize
+
+
+# pioneer-show.out is built from pioneer-show.lua with the firmware toolchain. The build shipped with the
+# addon predates the version 3 reader, show_v3_fw of the config is ignored until it is rebuilt
+SHOW_SCRIPT_READS_V3 = False
+
+
+def v3_firmware(config):
+    """ First firmware version reading show format version 3 according to the config, None if there is none """
+    return config.get("show_v3_fw") if SHOW_SCRIPT_READS_V3 else None
+
+
+def show_path(filepath, drone_number, version=2):
+    if version == 1:
+        return ''.join([filepath, '_', str(drone_number - 1), '_old.bin'])
+    return ''.join([filepath, '_', str(drone_number), '.bin'])
+
+
+def select_show_version(firmware_version, coords_size, v3_firmware=None):
+    """ Show format for the autopilot firmware version, None when exporting without a board
+
+        v3_firmware: first firmware version reading version 3, None if no firmware does yet
+    """
+    if firmware_version is None:
+        if coords_size <= MAX_POINTS[2]:
+            return 2
+        if v3_firmware is None:
+            raise ValueError("Show of %d points does not fit version 2 format and no firmware reads version 3" %
+                             coords_size)
+        return 3
+    if v3_firmware is not None and firmware_version >= v3_firmware:
+        return 3
+    version = 1 if firmware_version < V2_MIN_FIRMWARE else 2
+    if coords_size > MAX_POINTS[version]:
+        raise ValueError("Show of %d points does not fit version %d format of firmware %d" % (
+            coords_size, version, firmware_version))
+    return version
+
+
+def version_supported(version, firmware_version, v3_firmware=None):
+    if version == 1:
+        return firmware_version <= V1_MAX_FIRMWARE
+    if version == 2:
+        return firmware_version >= V2_MIN_FIRMWARE
+    if version == 3:
+        return v3_firmware is not None and firmware_version >= v3_firmware
+    return False
+
+
+def pack_header_into(buffer, offset, version, coords_size, colors_size, position_freq, color_freq, origin,
+                     position_format=POSITIONS_FLOAT, color_format=COLORS_RAW, sections=None):
+    """ sections: (positions length, colors length) in bytes of version 3 shows, raw sizes by default """
+    meta_data = {
+        # if -1 == should be calculated
+        "Version": version,
+        "AnimationId": 1 if version >= 2 else 0,
+        "PreFlightColor": 249,
+        "UserColorRed": 0,
+        "UserColorGreen": 0,
+        "UserColorBlue": 0,
+        "FreqPositions": position_freq,
+        "FreqColors": color_freq,
+        "FormatPositions": position_format,
+        "FormatColors": color_format,
+        "NumberPositions": coords_size,
+        "NumberColors": colors_size,
+        "TimeStart": 0,
+        "TimeEnd": round(coords_size / position_freq, 2),
+        "LatOrigin": origin[0],
+        "LonOrigin": origin[1],
+        "AltOrigin": 0,  # not used == 0
+    }
+    if version == 1:
+        struct.pack_into(HEADER_FORMATS[1], buffer, offset, meta_data['Version'],
+                         meta_data['AnimationId'],
+                         meta_data['FreqPositions'],
+                         meta_data['FreqColors'],
+                         meta_data['FormatPositions'],
+                         meta_data['FormatColors'],
+                         meta_data['NumberPositions'],
+                         meta_data['NumberColors'],
+                         meta_data['TimeStart'],
+                         meta_data['TimeEnd'],
+                         meta_data['LatOrigin'],
+                         meta_data['LonOrigin'],
+                         meta_data['AltOrigin'])
+    elif version == 3:
+        positions_length, colors_length = sections or (coords_size * POINT_SIZE, colors_size * COLOR_SIZE)
+        struct.pack_into(HEADER_FORMATS[3], buffer, offset, meta_data['Version'],
+                         meta_data['AnimationId'],
+                         meta_data['PreFlightColor'],
+                         meta_data['UserColorRed'],
+                         meta_data['UserColorGreen'],
+                         meta_data['UserColorBlue'],
+                         meta_data['FreqPositions'],
+                         meta_data['FreqColors'],
+                         meta_data['FormatPositions'],
+                         meta_data['FormatColors'],
+                         meta_data['NumberPositions'],
+                         meta_data['NumberColors'],
+                         meta_data['TimeStart'],
+                         meta_data['TimeEnd'],
+                         meta_data['LatOrigin'],
+                         meta_data['LonOrigin'],
+                         meta_data['AltOrigin'],
+                         V3_POINTS_OFFSET,
+                         positions_length,
+                         V3_POINTS_OFFSET + positions_length,
+                         colors_length)
+    else:
+        struct.pack_into(HEADER_FORMATS[2], buffer, offset, meta_data['Version'],
+                         meta_data['AnimationId'],
+                         meta_data['PreFlightColor'],
+                         meta_data['UserColorRed'],
+                         meta_data['UserColorGreen'],
+                         meta_data['UserColorBlue'],
+                         meta_data['FreqPositions'],
+                         meta_data['FreqColors'],
+                         meta_data['FormatPositions'],
+                         meta_data['FormatColors'],
+                         meta_data['NumberPositions'],
+                         meta_data['NumberColors'],
+                         meta_data['TimeStart'],
+                         meta_data['TimeEnd'],
+                         meta_data['LatOrigin'],
+                         meta_data['LonOrigin'],
+                         meta_data['AltOrigin'])
+
+
+def points_offset(version):
+    return V3_POINTS_OFFSET if version >= 3 else POINTS_OFFSET
+
+
+def colors_offset(version, coords_size):
+    if version >= 3:
+        return V3_POINTS_OFFSET + coords_size * POINT_SIZE
+    # Points longer than the fixed layout push colors further, as the firmware reads them after the points
+    return POINTS_OFFSET + max(coords_size, MAX_POINTS[version]) * POINT_SIZE
+
+
+def show_sections(binary):
+    """ (offset, length) of the header, points and colors of a show image, None if it is not one """
+    if bytes(binary[:len(CONTROL_SEQUENCE)]) != CONTROL_SEQUENCE or len(binary) <= len(CONTROL_SEQUENCE):
+        return None
+    version = binary[len(CONTROL_SEQUENCE)]
+    header_format = HEADER_FORMATS.get(version)
+    if header_format is None or len(binary) < len(CONTROL_SEQUENCE) + struct.calcsize(header_format):
+        return None
+    header = struct.unpack_from(header_format, binary, len(CONTROL_SEQUENCE))
+    if version == 3:
+        header_section = (0, len(CONTROL_SEQUENCE) + struct.calcsize(header_format))
+        return [header_section, (header[-4], header[-3]), (header[-2], header[-1])]
+    # Counters follow the same fields in versions 1 and 2
+    coords_size, colors_size = header[6:8] if version == 1 else header[10:12]
+    return [(0, len(CONTROL_SEQUENCE) + struct.calcsize(header_format)),
+            (POINTS_OFFSET, coords_size * POINT_SIZE),
+            (colors_offset(version, coords_size), colors_size * COLOR_SIZE)]
+
+
+def quantize_colors(colors_array):
+    colors = np.asarray(colors_array, dtype=np.float32).reshape(-1, 3)
+    return (np.clip(colors, 0.0, 1.0) * np.float32(255)).astype(COLOR_DTYPE)
+
+
+def encode_positions_delta(points):
+    """ POSITIONS_DELTA_CM section, None if the points do not fit its ranges """
+    cm = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 3) * 100).astype(np.int64)
+    if not len(cm):
+        return b''
+    if np.abs(cm).max() > np.iinfo(np.int32).max or \
+            (len(cm) > 1 and np.abs(np.diff(cm, axis=0)).max() > np.iinfo(np.int16).max):
+        return None
+    data = bytearray()
+    for start in range(0, len(cm), POSITIONS_BLOCK):
+        block = cm[start:start + POSITIONS_BLOCK]
+        data += block[0].astype('<i4').tobytes()
+        data += np.diff(block, axis=0).astype('<i2').tobytes()
+    return data
+
+
+def decode_positions_delta(data, coords_size):
+    points = np.empty((coords_size, 3), dtype=np.float32)
+    block_size = 12 + (POSITIONS_BLOCK - 1) * 6
+    for block, start in enumerate(range(0, coords_size, POSITIONS_BLOCK)):
+        count = min(POSITIONS_BLOCK, coords_size - start)
+        offset = block * block_size
+        cm = np.empty((count, 3), dtype=np.int64)
+        cm[0] = np.frombuffer(data, dtype='<i4', count=3, offset=offset)
+        cm[1:] = np.frombuffer(data, dtype='<i2', count=(count - 1) * 3, offset=offset + 12).reshape(-1, 3)
+        points[start:start + count] = np.cumsum(cm, axis=0) / 100
+    return points
+
+
+def color_runs(colors):
+    """ Colors and lengths of the runs of equal quantized colors """
+    starts = np.concatenate(([0], np.nonzero(np.any(colors[1:] != colors[:-1], axis=1))[0] + 1))
+    return colors[starts], np.diff(np.append(starts, len(colors)))
+
+
+def pack_runs(colors, lengths):
+    """ COLORS_RLE records of runs, runs longer than the length field are split """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    pieces = -(-lengths // np.iinfo(np.uint16).max)
+    runs = np.empty(int(pieces.sum()), dtype=RUN_DTYPE)
+    runs['color'] = np.repeat(colors, pieces, axis=0)
+    runs['length'] = np.iinfo(np.uint16).max
+    last = np.cumsum(pieces) - 1
+    runs['length'][last] = lengths - (pieces - 1) * np.iinfo(np.uint16).max
+    return runs.tobytes()
+
+
+def encode_colors_rle(colors):
+    """ COLORS_RLE section of quantized colors """
+    colors = np.asarray(colors, dtype=COLOR_DTYPE).reshape(-1, 3)
+    if not len(colors):
+        return b''
+    return pack_runs(*color_runs(colors))
+
+
+def decode_colors_rle(data):
+    runs = np.frombuffer(data, dtype=RUN_DTYPE)
+    return np.repeat(runs['color'], runs['length'], axis=0)
+
+
+def pack_compact_show(points, colors, position_freq, color_freq, origin):
+    positions_data = encode_positions_delta(points)
+    position_format = POSITIONS_DELTA_CM
+    if positions_data is None:
+        positions_data = points.astype(POINT_DTYPE).tobytes()
+        position_format = POSITIONS_FLOAT
+    colors_data = encode_colors_rle(colors)
+    binary = bytearray(V3_POINTS_OFFSET + len(positions_data) + len(colors_data))
+    binary[:len(CONTROL_SEQUENCE)] = CONTROL_SEQUENCE
+    pack_header_into(binary, len(CONTROL_SEQUENCE), 3, len(points), len(colors), position_freq, color_freq, origin,
+                     position_format, COLORS_RLE, (len(positions_data), len(colors_data)))
+    binary[V3_POINTS_OFFSET:V3_POINTS_OFFSET + len(positions_data)] = positions_data
+    binary[V3_POINTS_OFFSET + len(positions_data):] = colors_data
+    return binary
+
+
+def pack_show(coords_array, colors_array, position_freq, color_freq, origin, version=2, compact: bool = False):
+    """ Whole show image in one preallocated buffer, zero padding of fixed layouts comes from the allocation
+
+        compact: centimetre delta positions and run-length colors, version 3 only
+    """
+    points = np.asarray(coords_array, dtype=np.float32).reshape(-1, 3)
+    colors = quantize_colors(colors_array)
+    if compact:
+        if version != 3:
+            raise ValueError("Compact show encoding needs format version 3")
+        return pack_compact_show(points, colors, position_freq, color_freq, origin)
+    points_size = len(points)
+    colors_start = colors_offset(version, points_size)
+    binary = bytearray(colors_start + len(colors) * COLOR_SIZE)
+    binary[:len(CONTROL_SEQUENCE)] = CONTROL_SEQUENCE
+    pack_header_into(binary, len(CONTROL_SEQUENCE), version, points_size, len(colors), position_freq, color_freq,
+                     origin)
+    np.frombuffer(binary, dtype=POINT_DTYPE, count=points_size * 3, offset=points_offset(version))[:] = \
+        points.ravel()
+    np.frombuffer(binary, dtype=COLOR_DTYPE, count=colors.size, offset=colors_start)[:] = colors.ravel()
+    return binary
+
+
+def write_show(filepath, drone_number, coords_array, colors_array, position_freq, color_freq, origin,
+               version=2, compact: bool = False):
+    path = show_path(filepath, drone_number, version)
+    with open(path, "wb") as f:
+        f.write(pack_show(coords_array, colors_array, position_freq, color_freq, origin, version, compact))
+    return path
+
+
+class ShowStreamWriter:
+    """ Show binary of one drone written window by window through memory maps of the file
+
+        coords_size, colors_size: points and colors of the whole show
+        The file is written as path + ".part" and moved in place by close(), discard() removes it.
+        Compact shows are encoded window by window: whole delta blocks and finished color runs go to spool files,
+        the last partial block and the current run are carried over. Raw points are spooled as well, they are
+        written instead if the show does not fit the delta ranges. close() joins the spools with the header.
+    """
+
+    def __init__(self, path, coords_size, colors_size, position_freq, color_freq, origin, version=2,
+                 compact: bool = False):
+        if compact and version != 3:
+            raise ValueError("Compact show encoding needs format version 3")
+        self.path = path
+        self.part_path = path + ".part"
+        self.coords_size = coords_size
+        self.colors_size = colors_size
+        self.position_freq = position_freq
+        self.color_freq = color_freq
+        self.origin = origin
+        self.compact = compact
+        self.points_written = 0
+        self.colors_written = 0
+        if compact:
+            self.points_start = 0
+            self.colors_start = coords_size * POINT_SIZE
+            self.spool_paths = (path + ".delta", path + ".runs")
+            for spool_path in self.spool_paths:
+                open(spool_path, "wb").close()
+            self.delta_length = 0
+            self.runs_length = 0
+            # Points of the block not complete yet and the last centimetre point, None once deltas overflow
+            self.pending = np.empty((0, 3), dtype=POINT_DTYPE)
+            self.last_cm = np.empty((0, 3), dtype=np.int64)
+            self.run = None
+        else:
+            self.points_start = points_offset(version)
+            self.colors_start = colors_offset(version, coords_size)
+            self.spool_paths = ()
+        with open(self.part_path, "wb") as f:
+            f.truncate(self.colors_start + (0 if compact else colors_size * COLOR_SIZE))
+            if not compact:
+                header = bytearray(self.points_start)
+                header[:len(CONTROL_SEQUENCE)] = CONTROL_SEQUENCE
+                pack_header_into(header, len(CONTROL_SEQUENCE), version, coords_size, colors_size, position_freq,
+                                 color_freq, origin)
+                f.write(header)
+
+    def _write(self, offset, array):
+        if not array.size:
+            return
+        target = np.memmap(self.part_path, dtype=array.dtype, mode='r+', offset=offset, shape=(array.size,))
+        target[:] = array.ravel()
+        target.flush()
+        del target
+
+    def _spool(self, index, data):
+        with open(self.spool_paths[index], "ab") as f:
+            f.write(data)
+        return len(data)
+
+    def _encode_points(self, points, final=False):
+        if self.pending is None:
+            return
+        pending = np.concatenate([self.pending, points])
+        count = len(pending) if final else len(pending) // POSITIONS_BLOCK * POSITIONS_BLOCK
+        self.pending = pending[count:]
+        if not count:
+            return
+        blocks = pending[:count]
+        cm = np.round(blocks.astype(np.float64) * 100).astype(np.int64)
+        # Same ranges as encode_positions_delta checks over the whole show
+        steps = np.diff(np.concatenate([self.last_cm, cm]), axis=0)
+        if np.abs(cm).max() > np.iinfo(np.int32).max or (len(steps) and np.abs(steps).max() > np.iinfo(np.int16).max):
+            self.pending = None
+            return
+        self.last_cm = cm[-1:]
+        self.delta_length += self._spool(0, encode_positions_delta(blocks))
+
+    def _encode_colors(self, colors, final=False):
+        if len(colors):
+            run_colors, lengths = color_runs(colors)
+            if self.run is not None:
+                if (run_colors[0] == self.run[0]).all():
+                    lengths[0] += self.run[1]
+                else:
+                    run_colors = np.concatenate([self.run[0][None], run_colors])
+                    lengths = np.concatenate([[self.run[1]], lengths])
+            self.run = (run_colors[-1], lengths[-1])
+            if len(lengths) > 1:
+                self.runs_length += self._spool(1, pack_runs(run_colors[:-1], lengths[:-1]))
+        if final and self.run is not None:
+            self.runs_length += self._spool(1, pack_runs(self.run[0][None], [self.run[1]]))
+            self.run = None
+
+    def write(self, coords_array, colors_array):
+        """ Appends the next points and colors of the show """
+        points = np.asarray(coords_array, dtype=POINT_DTYPE).reshape(-1, 3)
+        colors = quantize_colors(colors_array)
+        if self.points_written + len(points) > self.coords_size or \
+                self.colors_written + len(colors) > self.colors_size:
+            raise ValueError("Show of %s is longer than its header" % self.path)
+        self._write(self.points_start + self.points_written * POINT_SIZE, points)
+        if self.compact:
+            self._encode_points(points)
+            self._encode_colors(colors)
+        else:
+            self._write(self.colors_start + self.colors_written * COLOR_SIZE, colors)
+        self.points_written += len(points)
+        self.colors_written += len(colors)
+
+    def close(self):
+        if self.points_written != self.coords_size or self.colors_written != self.colors_size:
+            raise ValueError("Show of %s is incomplete" % self.path)
+        if self.compact:
+            self._encode_points(np.empty((0, 3), dtype=POINT_DTYPE), final=True)
+            self._encode_colors(np.empty((0, 3), dtype=COLOR_DTYPE), final=True)
+            delta = self.pending is not None
+            positions_path, positions_length = (self.spool_paths[0], self.delta_length) if delta else \
+                (self.part_path, self.coords_size * POINT_SIZE)
+            header = bytearray(V3_POINTS_OFFSET)
+            header[:len(CONTROL_SEQUENCE)] = CONTROL_SEQUENCE
+            pack_header_into(header, len(CONTROL_SEQUENCE), 3, self.coords_size, self.colors_size, self.position_freq,
+                             self.color_freq, self.origin, POSITIONS_DELTA_CM if delta else POSITIONS_FLOAT,
+                             COLORS_RLE, (positions_length, self.runs_length))
+            output_path = self.path + ".compact"
+            with open(output_path, "wb") as output:
+                output.write(header)
+                for section_path in (positions_path, self.spool_paths[1]):
+                    with open(section_path, "rb") as section:
+                        shutil.copyfileobj(section, output)
+            os.replace(output_path, self.part_path)
+            self._remove(self.spool_paths)
+        os.replace(self.part_path, self.path)
+        return self.path
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def discard(self):
+        self._remove((self.part_path, self.path + ".compact") + self.spool_paths)
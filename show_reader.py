@@ -0,0 +1,302 @@
+""" Show binary reader and inspector
+
+    python show_reader.py summarize <bins or directories>
+    python show_reader.py validate <bins or directories>
+    python show_reader.py diff <expected bin or directory> <actual bin or directory>
+
+Files are read through memory maps in parallel threads. Exits with 1 if any file
+has problems or differences, 2 on errors.
+"""
+import argparse
+import concurrent.futures
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from export_pool import default_workers
+from show_bin import CONTROL_SEQUENCE, HEADER_FORMATS, HEADER_FIELDS, MAX_POINTS, POINT_DTYPE, COLOR_DTYPE, \
+    POINT_SIZE, COLOR_SIZE, POSITIONS_FLOAT, POSITIONS_DELTA_CM, COLORS_RAW, COLORS_RLE, RUN_DTYPE, \
+    POSITIONS_BLOCK, show_sections, decode_positions_delta, decode_colors_rle
+
+EXIT_OK = 0
+EXIT_PROBLEMS = 1
+EXIT_ERROR = 2
+
+# Position difference below this many meters is float rounding, not a changed show
+POSITION_TOLERANCE = 1e-4
+
+
+def delta_positions_length(coords_size):
+    blocks = -(-coords_size // POSITIONS_BLOCK)
+    return blocks * 12 + max(coords_size - blocks, 0) * 6
+
+
+class ShowFile:
+    """ Show binary of any version opened through a read-only memory map
+
+        Header is parsed on first use. Raw positions and colors are NumPy views of the map,
+        compact sections are decoded into new arrays. Views keep the map open until they are released.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            # Empty files can not be mapped
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if \
+                os.fstat(self._file.fileno()).st_size else b''
+        except Exception:
+            self._file.close()
+            raise
+        self._header = None
+        self._positions = None
+        self._colors = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._map)
+
+    def close(self):
+        self._positions = self._colors = None
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                # Arrays returned earlier still use the map, it is released with them
+                pass
+        self._file.close()
+
+    @property
+    def is_show(self):
+        return show_sections(self._map) is not None
+
+    @property
+    def version(self):
+        return self._map[len(CONTROL_SEQUENCE)] if len(self._map) > len(CONTROL_SEQUENCE) else None
+
+    @property
+    def header(self):
+        """ Header fields by their HEADER_FIELDS names """
+        if self._header is None:
+            if not self.is_show:
+                raise ValueError("%s is not a show binary" % self.path)
+            version = self.version
+            values = struct.unpack_from(HEADER_FORMATS[version], self._map, len(CONTROL_SEQUENCE))
+            self._header = dict(zip(HEADER_FIELDS[version], values))
+        return self._header
+
+    @property
+    def sections(self):
+        """ (offset, length) of the header, points and colors """
+        return show_sections(self._map)
+
+    @property
+    def positions(self):
+        """ (points, 3) float32 in meters """
+        if self._positions is None:
+            header = self.header
+            offset, length = self.sections[1]
+            count = header["NumberPositions"]
+            if header["FormatPositions"] == POSITIONS_DELTA_CM:
+                self._positions = decode_positions_delta(memoryview(self._map)[offset:offset + length], count)
+            else:
+                self._positions = np.frombuffer(self._map, dtype=POINT_DTYPE, count=count * 3,
+                                                offset=offset).reshape(-1, 3)
+        return self._positions
+
+    @property
+    def colors(self):
+        """ (colors, 3) uint8 """
+        if self._colors is None:
+            header = self.header
+            offset, length = self.sections[2]
+            if header["FormatColors"] == COLORS_RLE:
+                self._colors = decode_colors_rle(memoryview(self._map)[offset:offset + length])
+            else:
+                self._colors = np.frombuffer(self._map, dtype=COLOR_DTYPE, count=header["NumberColors"] * 3,
+                                             offset=offset).reshape(-1, 3)
+        return self._colors
+
+    def problems(self):
+        """ Descriptions of everything the firmware could not read as the exporter meant it """
+        if not self.is_show:
+            return ["not a show binary of a known version"]
+        header = self.header
+        version = header["Version"]
+        coords_size = header["NumberPositions"]
+        colors_size = header["NumberColors"]
+        _, (points_start, points_length), (colors_start, colors_length) = self.sections
+        result = []
+        if header["FreqPositions"] <= 0 or header["FreqColors"] <= 0:
+            return ["zero position or color frequency"]
+        if version == 3:
+            expected = {POSITIONS_FLOAT: coords_size * POINT_SIZE,
+                        POSITIONS_DELTA_CM: delta_positions_length(coords_size)}.get(header["FormatPositions"])
+            if expected is None:
+                result.append("unknown positions format %d" % header["FormatPositions"])
+            elif expected != points_length:
+                result.append("positions section of %d bytes, %d expected" % (points_length, expected))
+            if header["FormatColors"] == COLORS_RAW:
+                if colors_length != colors_size * COLOR_SIZE:
+                    result.append("colors section of %d bytes, %d expected" % (colors_length, colors_size * COLOR_SIZE))
+            elif header["FormatColors"] == COLORS_RLE:
+                if colors_length % RUN_DTYPE.itemsize:
+                    result.append("colors section of %d bytes is not whole runs" % colors_length)
+            else:
+                result.append("unknown colors format %d" % header["FormatColors"])
+            if points_start + points_length > colors_start:
+                result.append("positions and colors sections overlap")
+        elif coords_size > MAX_POINTS[version]:
+            result.append("%d points do not fit the %d points of version %d layout" % (
+                coords_size, MAX_POINTS[version], version))
+        if max(points_start + points_length, colors_start + colors_length) > len(self):
+            result.append("file of %d bytes is shorter than its sections" % len(self))
+        if result:
+            return result
+        if header["FormatColors"] == COLORS_RLE and len(self.colors) != colors_size:
+            result.append("%d run-length colors, %d in header" % (len(self.colors), colors_size))
+        if not np.isfinite(self.positions).all():
+            result.append("positions are not finite")
+        time_end = round(coords_size / header["FreqPositions"], 2)
+        if abs(header["TimeEnd"] - time_end) > 0.01:
+            result.append("TimeEnd %.2f does not match %d points, %.2f expected" % (
+                header["TimeEnd"], coords_size, time_end))
+        return result
+
+    def summary(self):
+        header = self.header
+        positions = self.positions
+        summary = {"path": self.path, "size": len(self), "version": header["Version"],
+                   "points": header["NumberPositions"], "colors": header["NumberColors"],
+                   "position_format": header["FormatPositions"], "color_format": header["FormatColors"],
+                   "duration": header["TimeEnd"], "origin": [header["LatOrigin"], header["LonOrigin"]]}
+        if len(positions):
+            summary["min"] = positions.min(axis=0).tolist()
+            summary["max"] = positions.max(axis=0).tolist()
+            speeds = np.linalg.norm(np.diff(positions, axis=0), axis=1) * header["FreqPositions"]
+            summary["max_speed"] = float(speeds.max()) if len(speeds) else 0.0
+        return summary
+
+
+def diff_shows(expected, actual):
+    """ Descriptions of the differences of two ShowFiles """
+    result = []
+    for field in HEADER_FIELDS[min(expected.version, actual.version)]:
+        if expected.header[field] != actual.header[field]:
+            result.append("%s %s != %s" % (field, expected.header[field], actual.header[field]))
+    for name, first, second in (("positions", expected.positions, actual.positions),
+                                ("colors", expected.colors, actual.colors)):
+        if len(first) != len(second):
+            result.append("%d %s != %d" % (len(first), name, len(second)))
+        count = min(len(first), len(second))
+        if not count:
+            continue
+        delta = np.abs(first[:count].astype(np.float64) - second[:count].astype(np.float64)).max(axis=1)
+        changed = np.nonzero(delta > (POSITION_TOLERANCE if name == "positions" else 0))[0]
+        if len(changed):
+            result.append("%d %s differ from index %d, by up to %g" % (len(changed), name, changed[0],
+                                                                        delta.max()))
+    return result
+
+
+def show_files(paths):
+    """ Bins of the given files and directories """
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".bin")))
+        else:
+            result.append(path)
+    return result
+
+
+def summarize_file(path):
+    with ShowFile(path) as show:
+        return show.summary()
+
+
+def validate_file(path):
+    with ShowFile(path) as show:
+        return show.problems()
+
+
+def diff_files(expected_path, actual_path):
+    with ShowFile(expected_path) as expected, ShowFile(actual_path) as actual:
+        for show in (expected, actual):
+            if not show.is_show:
+                return ["%s is not a show binary" % show.path]
+        return diff_shows(expected, actual)
+
+
+def diff_pairs(expected, actual):
+    """ (expected, actual) pairs of files with the same name, a missing side is None """
+    if not os.path.isdir(expected) and not os.path.isdir(actual):
+        return [(expected, actual)]
+    expected_files = {os.path.basename(path): path for path in show_files([expected])}
+    actual_files = {os.path.basename(path): path for path in show_files([actual])}
+    return [(expected_files.get(name), actual_files.get(name)) for name in sorted(expected_files.keys() |
+                                                                                  actual_files.keys())]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="show_reader.py", description="Read back GeoScan show binaries")
+    parser.add_argument("--workers", type=int, default=None, help="threads reading files")
+    parser.add_argument("--json", action="store_true", help="one JSON object per file")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    for command in ("summarize", "validate"):
+        commands.add_parser(command).add_argument("paths", nargs="+", help="show binaries or directories of them")
+    diff = commands.add_parser("diff")
+    diff.add_argument("expected", help="show binary or directory")
+    diff.add_argument("actual", help="show binary or directory")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.command == "diff":
+        jobs = diff_pairs(args.expected, args.actual)
+        function = diff_files
+    else:
+        jobs = [(path,) for path in show_files(args.paths)]
+        function = summarize_file if args.command == "summarize" else validate_file
+    status = EXIT_OK
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers or default_workers()) as executor:
+        futures = [None if None in job else executor.submit(function, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            name = " ".join(path or "-" for path in job)
+            if future is None:
+                result = {"path": name, "problems": ["missing file"]}
+            else:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print("%s: %s" % (name, e))
+                    status = EXIT_ERROR
+                    continue
+                if not isinstance(result, dict):
+                    result = {"path": name, "problems": result}
+            if result.get("problems"):
+                status = max(status, EXIT_PROBLEMS)
+            if args.json:
+                print(json.dumps(result))
+            elif "problems" in result:
+                print("%s: %s" % (name, "; ".join(result["problems"]) or "ok"))
+            else:
+                print("%s: version %d, %d points, %d colors, %.2f s, %d bytes" % (
+                    name, result["version"], result["points"], result["colors"], result["duration"],
+                    result["size"]))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,33 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class _FakeResult:
+    SUCCESS = object()
+
+
+def _fake_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _failing_stream(*args, **kwargs):
+    raise OSError("no board in tests")
+
+
+# The board protocol library is a compiled module shipped per platform and certifi comes with Blender,
+# loader.py is importable without them with these stand-ins
+try:
+    import proto  # noqa: F401
+except ImportError:
+    sys.modules["proto"] = _fake_module("proto", SerialStream=_failing_stream, Messenger=None, Result=_FakeResult,
+                                        Protocol=types.SimpleNamespace(SYSTEM_COMMANDS={}))
+try:
+    import certifi  # noqa: F401
+except ImportError:
+    sys.modules["certifi"] = _fake_module("certifi", where=lambda: None)
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import change_tracker
+from change_tracker import ChangeTracker, dependencies
+
+
+def make_object(name, constraints=(), drivers=()):
+    variables = [SimpleNamespace(targets=[SimpleNamespace(id=target)]) for target in drivers]
+    anim = SimpleNamespace(action=None, nla_tracks=[],
+                           drivers=[SimpleNamespace(driver=SimpleNamespace(variables=variables))])
+    return SimpleNamespace(name=name, parent=None, active_material=None, animation_data=anim,
+                           constraints=[SimpleNamespace(target=target) for target in constraints])
+
+
+class Curve:
+    name = "Path"
+    animation_data = None
+
+
+class Scene:
+    name = "Scene"
+    animation_data = None
+
+
+def test_dependencies_follow_target_data_and_driver_ids():
+    path = make_object("PathObject")
+    path.data = Curve()
+    drone = make_object("Pioneer", constraints=[path], drivers=[Scene()])
+    keys = dependencies(drone)
+    assert {("Object", "PathObject"), ("Curve", "Path"), ("Scene", "Scene")} <= keys
+
+
+def test_volatile_drones_checked_on_every_update(monkeypatch):
+    fingerprints = iter(["volatile-1", "volatile-2", "volatile-3"])
+    monkeypatch.setattr(change_tracker, "drone_fingerprint", lambda pioneer, settings: next(fingerprints))
+    tracker = ChangeTracker(lambda callback, delay: None)
+    drone = make_object("Pioneer")
+    assert tracker.fingerprint(drone, ()) == "volatile-1"
+    assert tracker.fingerprint(drone, ()) == "volatile-2"
+    tracker.pending.add(("Scene", "Other"))
+    assert tracker.flush([drone]) == {"Pioneer"}
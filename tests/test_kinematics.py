@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from kinematics import KinematicsAccumulator, KinematicsReport, limits_from_params, load_config
+
+LIMITS = {"horizontal": 2.0, "up": 1.0, "down": 1.5, "acceleration": 4.0}
+
+
+def test_limits_from_config():
+    params = load_config(ROOT + "/config.json")["params"]["lps"]
+    limits = limits_from_params(params, horizontal_limit=1.0)
+    assert limits == {"horizontal": 1.0, "up": params["Copter_pos_vUp"], "down": params["Copter_pos_vDown"],
+                      "acceleration": None}
+    assert limits_from_params(params, horizontal_limit=100)["horizontal"] == params["Copter_pos_vMax"]
+
+
+def test_each_kind_is_reported_at_its_tick():
+    positions = np.zeros((1, 6, 3), dtype=np.float32)
+    # 0.5 s ticks: 1.5 m horizontally is 3 m/s, then 1 m up is 2 m/s, then 1 m down
+    positions[0, 2:, 0] = 1.5
+    positions[0, 3, 2] = 1.0
+    report = KinematicsReport(positions, 0.5, LIMITS)
+    violations = {kind: (tick, round(value, 3)) for (_, kind, tick, value, _) in report.violations()}
+    assert violations["horizontal"] == (2, 3.0)
+    assert violations["up"] == (3, 2.0)
+    assert violations["down"] == (4, 2.0)
+    # Speed jumps from 0 to 3 m/s around tick 1
+    assert violations["acceleration"] == (1, 6.0)
+
+
+def test_missing_limit_is_never_exceeded():
+    positions = np.cumsum(np.ones((2, 5, 3), dtype=np.float32), axis=1)
+    report = KinematicsReport(positions, 0.5, dict(LIMITS, acceleration=None))
+    assert not report.exceeded("acceleration").any()
+    assert "acceleration" not in [kind for (_, kind, _, _, _) in report.violations()]
+
+
+@pytest.mark.parametrize("window", [1, 2, 7, 40])
+def test_accumulator_matches_report(window):
+    rng = np.random.default_rng(1)
+    positions = np.cumsum(rng.normal(0, 0.6, (5, 40, 3)), axis=1).astype(np.float32)
+    report = KinematicsReport(positions, 0.5, LIMITS)
+    accumulator = KinematicsAccumulator(5, 0.5, LIMITS)
+    for start in range(0, positions.shape[1], window):
+        accumulator.add(positions[:, start:start + window])
+    names = ["Pioneer%d" % drone for drone in range(5)]
+    assert np.allclose(np.array(accumulator.table(names))[:, 1:].astype(float),
+                       np.array(report.table(names))[:, 1:].astype(float), atol=1e-5)
+    expected = [(drone, kind, tick, pytest.approx(value, abs=1e-5), limit)
+                for (drone, kind, tick, value, limit) in report.violations()]
+    assert accumulator.violations() == expected
@@ -0,0 +1,47 @@
+import numpy as np
+
+from live_validation import LiveValidator
+
+LIMITS = {"horizontal": 10.0, "up": 10.0, "down": 10.0, "acceleration": 100.0}
+
+
+def show(drones=3, ticks=20):
+    positions = np.zeros((drones, ticks, 3), dtype=np.float32)
+    positions[:, :, 0] = np.arange(drones)[:, None] * 10
+    positions[:, :, 2] = np.linspace(0, 5, ticks)
+    return positions
+
+
+def run(validator, *args, **kwargs):
+    validator.submit(*args, **kwargs)
+    validator.thread.join()
+
+
+def test_incremental_check_keeps_other_violations():
+    results = []
+    validator = LiveValidator(lambda callback: callback(), results.append)
+    names = ["Pioneer1", "Pioneer2", "Pioneer3"]
+    positions = show()
+    run(validator, names, positions, 0.5, LIMITS, 3.0, (0, 0, 0))
+    assert results[-1].speeding == [] and results[-1].close == []
+    # Second drone moves next to the first one
+    moved = positions[1:2].copy()
+    moved[:, :, 0] = 1
+    run(validator, names, moved, 0.5, LIMITS, 3.0, (0, 0, 0), drones=[1])
+    assert results[-1].close == [("Pioneer1", "Pioneer2")]
+    assert (validator.positions[1] == moved[0]).all()
+
+
+def test_clear_during_check_drops_result(monkeypatch):
+    results = []
+    validator = LiveValidator(lambda callback: callback(), results.append)
+    check = validator._check
+
+    def clearing_check(*args):
+        validator.clear()
+        return check(*args)
+
+    monkeypatch.setattr(validator, "_check", clearing_check)
+    run(validator, ["Pioneer1"], show(1), 0.5, LIMITS, 3.0, (0, 0, 0))
+    assert results == []
+    assert validator.positions is None and validator.names == []
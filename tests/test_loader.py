@@ -0,0 +1,106 @@
+import importlib.util
+import shutil
+import time
+
+import pytest
+
+import loader
+import show_bin
+from fleet_upload import BoardLink
+from conftest import ROOT
+
+
+@pytest.fixture
+def main_loader(tmp_path, monkeypatch):
+    (tmp_path / "addons").mkdir()
+    shutil.copy(ROOT + "/config.json", str(tmp_path / "addons" / "config.json"))
+    monkeypatch.setattr(loader.Loader, "_fetch_config", lambda self: None)
+    main = loader.Loader(str(tmp_path), auto_connect=False)
+    main._config_thread.join()
+    # No port watching thread in tests
+    main._init_link(auto_connect=False, serial_master=loader.SerialMaster(
+        main.connect_callback, main.disconnect_callback, main.ports_update_callback, auto_connect=False,
+        watch_ports=False, baudrate_cache=main.baudrate_cache, cache_path=main.cache_path))
+    yield main
+    main.kill_serial_master()
+
+
+def test_board_link_connects_without_main_loader_init(main_loader, monkeypatch):
+    monkeypatch.setattr(loader.time, "sleep", lambda seconds: None)
+    link = BoardLink(main_loader, "/dev/ttyNONE")
+    assert link.serial_master is link._serial_master
+    assert not link.connect()
+    link.close()
+    assert link.transfer_tuner is main_loader.transfer_tuner
+
+
+class FileInfo:
+    def __init__(self, info):
+        self.info = info
+
+    def readFileInfo(self):
+        if isinstance(self.info, Exception):
+            raise self.info
+        return self.info
+
+
+def test_remote_file_info_fails_closed():
+    assert loader.Loader._remote_file_info(object()) is None
+    assert loader.Loader._remote_file_info(FileInfo(TimeoutError())) is None
+    assert loader.Loader._remote_file_info(FileInfo(None)) is None
+    assert loader.Loader._remote_file_info(FileInfo({"size": 10})) is None
+    assert loader.Loader._remote_file_info(FileInfo({"size": 10, "crc32": -1})) == (10, 0xffffffff)
+    assert loader.Loader._remote_file_info(FileInfo((10, 5))) == (10, 5)
+
+
+def test_show_v3_needs_rebuilt_script(main_loader, monkeypatch):
+    config = dict(main_loader.config, show_v3_fw=1)
+    main_loader._apply_config(config)
+    assert main_loader.show_v3_fw is None
+    monkeypatch.setattr(show_bin, "SHOW_SCRIPT_READS_V3", True)
+    main_loader._apply_config(config)
+    assert main_loader.show_v3_fw == 1
+
+
+def test_loader_init_within_register_budget(tmp_path, monkeypatch):
+    (tmp_path / "addons").mkdir()
+    shutil.copy(ROOT + "/config.json", str(tmp_path / "addons" / "config.json"))
+    # A slow network must not hold the registration up
+    monkeypatch.setattr(loader.Loader, "_fetch_config", lambda self: time.sleep(1))
+    started = time.perf_counter()
+    main = loader.Loader(str(tmp_path), auto_connect=False)
+    elapsed = time.perf_counter() - started
+    assert main._serial_master is None
+    assert elapsed < loader.REGISTER_BUDGET
+    main._config_thread.join()
+
+
+def test_register_within_budget():
+    pytest.importorskip("bpy")
+    spec = importlib.util.spec_from_file_location("pioneer_addon", ROOT + "/pioneer-addon.py")
+    addon = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(addon)
+    started = time.perf_counter()
+    addon.register()
+    elapsed = time.perf_counter() - started
+    addon.unregister()
+    assert elapsed < loader.REGISTER_BUDGET
+
+
+class Component:
+    def __init__(self, name, uid):
+        self.name = name
+        self._uid = uid
+
+    def uid(self):
+        return self._uid
+
+
+def test_board_uid_calls_component_uid(main_loader, monkeypatch):
+    main_loader.connected = True
+    main_loader.hub = type("Hub", (), {"components": [Component("Autopilot", 1), Component("UavMonitor", 0x1234)]})
+    assert main_loader.get_board_uid() == "4660"
+    main_loader.hub.components[1]._uid = b"\x00\xab"
+    assert main_loader.get_board_uid() == "00ab"
+    main_loader.hub.components[1]._uid = None
+    assert main_loader.get_board_uid() is None
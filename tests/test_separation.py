@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from separation import SeparationViolations, WindowedSeparation, brute_force_violations, grid_violations, \
+    find_separation_violations, find_swept_violations
+
+
+def swarm(ticks=12, drones=150, seed=0):
+    """ (ticks, drones, 3) drones packed densely enough to have close pairs """
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, 30, (drones, 3))
+    steps = rng.normal(0, 0.8, (ticks, drones, 3))
+    return (start + np.cumsum(steps, axis=0)).astype(np.float32)
+
+
+def as_set(violations):
+    return {(tick, first, second, round(distance, 4)) for (tick, first, second, distance) in violations}
+
+
+def test_grid_matches_brute_force():
+    positions = swarm()
+    expected = brute_force_violations(positions, 2.0)
+    assert len(expected)
+    assert as_set(grid_violations(positions, 2.0)) == as_set(expected)
+
+
+def test_only_mask_keeps_pairs_of_given_drones():
+    positions = swarm()
+    only = np.zeros(positions.shape[1], dtype=bool)
+    only[::7] = True
+    expected = {violation for violation in as_set(brute_force_violations(positions, 2.0))
+                if only[violation[1]] or only[violation[2]]}
+    assert as_set(find_separation_violations(positions, 2.0, grid_threshold=10, only=only)) == expected
+    assert as_set(find_separation_violations(positions, 2.0, grid_threshold=1000, only=only)) == expected
+
+
+def test_swept_finds_crossing_between_ticks():
+    # Two drones swap places through the same point, 10 m apart on both ticks
+    positions = np.array([[[0, 0, 5], [10, 0, 5]], [[10, 0, 5], [0, 0, 5]]], dtype=np.float32)
+    assert not len(find_separation_violations(positions, 3.0))
+    swept = find_swept_violations(positions, 3.0)
+    assert list(swept) == [(0, 0, 1, 0.0)]
+    assert swept.fractions.tolist() == [0.5]
+
+
+def test_swept_grid_matches_all_pairs():
+    positions = swarm(drones=80)
+    expected = find_swept_violations(positions, 2.0, grid_threshold=1000)
+    assert len(expected)
+    assert as_set(find_swept_violations(positions, 2.0, grid_threshold=10)) == as_set(expected)
+
+
+@pytest.mark.parametrize("window", [1, 5, 12])
+def test_windows_match_whole_show(window):
+    positions = swarm(drones=40)
+    windowed = WindowedSeparation(2.0, grid_threshold=10)
+    for start in range(0, len(positions), window):
+        windowed.add(positions[start:start + window])
+    assert as_set(windowed.sampled) == as_set(find_separation_violations(positions, 2.0))
+    assert as_set(windowed.swept) == as_set(find_swept_violations(positions, 2.0))
+
+
+def test_pairs_reports_worst_tick():
+    violations = SeparationViolations(np.array([0, 1, 2]), np.array([0, 0, 1]), np.array([1, 1, 2]),
+                                      np.array([2.0, 1.0, 0.5], dtype=np.float32))
+    assert violations.pairs() == [(0, 1, 1, 1.0), (1, 2, 2, 0.5)]
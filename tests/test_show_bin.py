@@ -0,0 +1,96 @@
+import struct
+
+import numpy as np
+import pytest
+
+from show_bin import HEADER_FIELDS, HEADER_FORMATS, MAX_POINTS, POSITIONS_DELTA_CM, POSITIONS_FLOAT, \
+    ShowStreamWriter, decode_colors_rle, decode_positions_delta, pack_show, quantize_colors, select_show_version, \
+    show_sections
+
+
+def test_offline_version_needs_v3_firmware():
+    assert select_show_version(None, MAX_POINTS[2]) == 2
+    with pytest.raises(ValueError):
+        select_show_version(None, MAX_POINTS[2] + 1)
+    assert select_show_version(None, MAX_POINTS[2] + 1, v3_firmware=9000) == 3
+
+
+def stream(path, points, colors, window, version, compact):
+    writer = ShowStreamWriter(str(path), len(points), len(colors), 2, 5, [60.0, 30.0], version, compact)
+    ratio = max(len(colors) // max(len(points), 1), 1)
+    for start in range(0, max(len(points), 1), window):
+        writer.write(points[start:start + window], colors[start * ratio:(start + window) * ratio])
+    # Colors left over by the integer ratio
+    writer.write(points[:0], colors[(start + window) * ratio:])
+    writer.close()
+    return path.read_bytes()
+
+
+def position_format(binary):
+    return dict(zip(HEADER_FIELDS[3], struct.unpack_from(HEADER_FORMATS[3], binary, 4)))["FormatPositions"]
+
+
+def trajectory(count, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.cumsum(rng.normal(0, 0.3, (count, 3)), axis=0).astype(np.float32)
+    colors = np.repeat(rng.random((count // 8 + 1, 3)), 8 * 5 // 2, axis=0)[:count * 5 // 2].astype(np.float32)
+    return points, colors
+
+
+@pytest.mark.parametrize("version,compact", [(1, False), (2, False), (3, False), (3, True)])
+@pytest.mark.parametrize("window", [1, 50, 64, 1000])
+def test_stream_writer_matches_pack_show(tmp_path, version, compact, window):
+    points, colors = trajectory(300)
+    expected = bytes(pack_show(points, colors, 2, 5, [60.0, 30.0], version, compact))
+    assert stream(tmp_path / "show.bin", points, colors, window, version, compact) == expected
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["show.bin"]
+
+
+@pytest.mark.parametrize("window", [7, 64, 130])
+def test_stream_writer_compact_fallback_and_long_runs(tmp_path, window):
+    points, _ = trajectory(200)
+    # Jump beyond the int16 centimetre delta range, across a window border for some windows
+    points[129:] += 400
+    colors = np.zeros((70000, 3), dtype=np.float32)
+    colors[-3:] = 1
+    expected = bytes(pack_show(points, colors, 2, 5, [60.0, 30.0], 3, True))
+    assert position_format(expected) == POSITIONS_FLOAT
+    assert stream(tmp_path / "show.bin", points, colors, window, 3, True) == expected
+
+
+def reference_show(version, points, colors, position_freq, color_freq, origin):
+    """ Show layout of the exporter before format version 3, written field by field """
+    if version == 1:
+        header = struct.pack("<BBBBBBHHfffff", 1, 0, position_freq, color_freq, 4, 1, len(points), len(colors), 0,
+                             round(len(points) / position_freq, 2), origin[0], origin[1], 0)
+    else:
+        header = struct.pack('<BLBBBBBBBBHHfffff', 2, 1, 249, 0, 0, 0, position_freq, color_freq, 4, 1, len(points),
+                             len(colors), 0, round(len(points) / position_freq, 2), origin[0], origin[1], 0)
+    data = bytearray(b'\xaa\xbb\xcc\xdd' + header)
+    data += bytes(100 - len(data))
+    for point in points.tolist():
+        data += struct.pack('<fff', *point)
+    data += bytes(max(MAX_POINTS[version] - len(points), 0) * 12)
+    for color in colors.tolist():
+        data += struct.pack('<BBB', int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
+    return bytes(data)
+
+
+@pytest.mark.parametrize("version", [1, 2])
+@pytest.mark.parametrize("count", [0, 1, 300])
+def test_fixed_layouts_match_reference(version, count):
+    points, colors = trajectory(count, seed=count)
+    expected = reference_show(version, points, colors, 2, 5, [60.010663, 30.347196])
+    assert bytes(pack_show(points, colors, 2, 5, [60.010663, 30.347196], version)) == expected
+
+
+def test_compact_round_trip():
+    points, colors = trajectory(1000)
+    binary = bytes(pack_show(points, colors, 2, 5, [0.0, 0.0], 3, True))
+    assert position_format(binary) == POSITIONS_DELTA_CM
+    sections = show_sections(binary)
+    (points_start, points_length), (colors_start, colors_length) = sections[1], sections[2]
+    decoded = decode_positions_delta(binary[points_start:points_start + points_length], len(points))
+    assert np.abs(decoded - points).max() <= 0.005 + 1e-6
+    assert (decode_colors_rle(binary[colors_start:colors_start + colors_length]) == quantize_colors(colors)).all()
+    assert len(binary) < len(pack_show(points, colors, 2, 5, [0.0, 0.0], 3))
@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pytest
+
+import show_reader
+from show_bin import pack_show, write_show
+from show_reader import ShowFile, diff_shows
+
+ORIGIN = [60.010663, 30.347196]
+
+
+def trajectory(count=200):
+    rng = np.random.default_rng(3)
+    points = np.cumsum(rng.normal(0, 0.2, (count, 3)), axis=0).astype(np.float32)
+    colors = np.repeat(rng.random((count // 10, 3)), 25, axis=0).astype(np.float32)
+    return points, colors
+
+
+@pytest.fixture
+def shows(tmp_path):
+    points, colors = trajectory()
+    paths = {}
+    for name, version, compact in (("v1", 1, False), ("v2", 2, False), ("v3", 3, False), ("compact", 3, True)):
+        paths[name] = write_show(str(tmp_path / name), 1, points, colors, 2, 5, ORIGIN, version, compact)
+    return points, colors, paths
+
+
+@pytest.mark.parametrize("name", ["v1", "v2", "v3", "compact"])
+def test_reads_back_every_version(shows, name):
+    points, colors, paths = shows
+    with ShowFile(paths[name]) as show:
+        assert show.problems() == []
+        assert show.header["NumberPositions"] == len(points)
+        tolerance = 0.005 + 1e-6 if name == "compact" else 0
+        assert np.abs(show.positions - points).max() <= tolerance
+        assert (show.colors == (colors * 255).astype(np.uint8)).all()
+        summary = show.summary()
+    assert summary["points"] == len(points) and summary["duration"] == pytest.approx(len(points) / 2)
+
+
+def test_problems_of_broken_files(tmp_path, shows):
+    _, _, paths = shows
+    with open(paths["v2"], 'rb') as f:
+        data = f.read()
+    (tmp_path / "short.bin").write_bytes(data[:-10])
+    (tmp_path / "other.bin").write_bytes(b"not a show")
+    with ShowFile(str(tmp_path / "short.bin")) as show:
+        assert any("shorter" in problem for problem in show.problems())
+    with ShowFile(str(tmp_path / "other.bin")) as show:
+        assert not show.is_show and show.problems()
+
+
+def test_diff_reports_changes(tmp_path, shows):
+    points, colors, paths = shows
+    moved = points.copy()
+    moved[50] += 1
+    (tmp_path / "moved.bin").write_bytes(bytes(pack_show(moved, colors, 2, 5, ORIGIN, 2)))
+    with ShowFile(paths["v2"]) as expected, ShowFile(paths["v3"]) as actual:
+        assert diff_shows(expected, actual) == ["Version 2 != 3"]
+    with ShowFile(paths["v2"]) as expected, ShowFile(str(tmp_path / "moved.bin")) as actual:
+        assert diff_shows(expected, actual) == ["1 positions differ from index 50, by up to 1"]
+
+
+def test_cli_exit_codes(tmp_path, shows, capsys):
+    _, _, paths = shows
+    assert show_reader.main(["--json", "summarize", paths["v2"], paths["compact"]]) == show_reader.EXIT_OK
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line["version"] for line in lines] == [2, 3]
+    (tmp_path / "other.bin").write_bytes(b"not a show")
+    assert show_reader.main(["validate", str(tmp_path)]) == show_reader.EXIT_PROBLEMS
+    assert show_reader.main(["diff", paths["v2"], paths["v2"]]) == show_reader.EXIT_OK
+    assert show_reader.main(["summarize", str(tmp_path / "missing.bin")]) == show_reader.EXIT_ERROR
@@ -0,0 +1,46 @@
+import transfer_tuner
+from transfer_tuner import TransferTuner, SEGMENT_SIZE, CHUNK_LIMITS, PACKET_PAYLOAD
+
+
+class FlakyFile:
+    """ File that appends part of the segment it fails on """
+
+    def __init__(self, fail_at):
+        self.content = b''
+        self.fail_at = fail_at
+
+    def writeImpl(self, data, chunkSize, burstSize, append, verify):
+        assert chunkSize <= CHUNK_LIMITS[1]
+        if not append:
+            self.content = b''
+        if self.fail_at is not None and len(self.content) + len(data) > self.fail_at:
+            self.content += data[:self.fail_at - len(self.content)]
+            self.fail_at = None
+            raise TimeoutError("chunk lost")
+        self.content += data
+
+
+def test_chunk_fits_packet_payload():
+    assert CHUNK_LIMITS[1] < PACKET_PAYLOAD
+    assert CHUNK_LIMITS[1] % transfer_tuner.CHUNK_STEP == 0
+
+
+def test_failed_write_resumes_from_confirmed_length(tmp_path):
+    data = bytes(range(256)) * (SEGMENT_SIZE * 3 // 256)
+    file = FlakyFile(SEGMENT_SIZE + 100)
+    resumed = []
+
+    def confirmed():
+        resumed.append(len(file.content))
+        return len(file.content)
+
+    TransferTuner(str(tmp_path / "transfer.json")).write(file, data, "key", confirmed=confirmed)
+    assert resumed == [SEGMENT_SIZE + 100]
+    assert file.content == data
+
+
+def test_failed_write_restarts_without_confirmation(tmp_path):
+    data = bytes(SEGMENT_SIZE * 2)
+    file = FlakyFile(SEGMENT_SIZE + 100)
+    TransferTuner(str(tmp_path / "transfer.json")).write(file, data, "key")
+    assert file.content == data
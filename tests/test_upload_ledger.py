@@ -0,0 +1,36 @@
+import zlib
+
+from upload_ledger import UploadLedger
+
+DATA = b"show" * 100
+
+
+def remote(data):
+    return len(data), zlib.crc32(data)
+
+
+def test_unconfirmed_file_is_written_in_full(tmp_path):
+    ledger = UploadLedger(str(tmp_path / "uploads.json"))
+    ledger.store("board", 1, DATA)
+    assert ledger.start_offset("board", 1, DATA) == 0
+    assert ledger.start_offset("board", 1, DATA, None) == 0
+
+
+def test_confirmed_file_is_skipped_or_appended(tmp_path):
+    ledger = UploadLedger(str(tmp_path / "uploads.json"))
+    ledger.store("board", 1, DATA)
+    assert ledger.start_offset("board", 1, DATA, remote(DATA)) == len(DATA)
+    assert ledger.start_offset("board", 1, DATA + b"tail", remote(DATA)) == len(DATA)
+    # Reloaded from disk
+    assert UploadLedger(ledger.path).start_offset("board", 1, DATA, remote(DATA)) == len(DATA)
+
+
+def test_rewritten_or_changed_file_is_written_in_full(tmp_path):
+    ledger = UploadLedger(str(tmp_path / "uploads.json"))
+    ledger.store("board", 1, DATA)
+    assert ledger.start_offset("board", 1, DATA, remote(b"other" + DATA)) == 0
+    assert ledger.start_offset("board", 1, DATA, (len(DATA), 0)) == 0
+    assert ledger.start_offset("board", 1, b"changed" + DATA, remote(DATA)) == 0
+    assert ledger.start_offset("other board", 1, DATA, remote(DATA)) == 0
+    ledger.forget("board", 1)
+    assert ledger.start_offset("board", 1, DATA, remote(DATA)) == 0
@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import threading
+import time
+
+CHUNK_STEP = 16
+# A chunk has to fit the payload of a single protocol packet, whose length field is one byte, together with
+# the component, file index and offset of the file write message, allowed for with one whole step
+PACKET_PAYLOAD = 255
+FILE_WRITE_HEADER = CHUNK_STEP
+CHUNK_LIMITS = (CHUNK_STEP, (PACKET_PAYLOAD - FILE_WRITE_HEADER) // CHUNK_STEP * CHUNK_STEP)
+BURST_LIMITS = (1, 32)
+DEFAULT_SETTINGS = (48, 4)
+# Data is written in segments, settings are adjusted between them
+SEGMENT_SIZE = 4096
+# Throughput drop against the best segment treated as congestion
+SLOWDOWN_RATIO = 0.8
+
+
+def increase(chunk, burst):
+    return min(chunk + CHUNK_STEP, CHUNK_LIMITS[1]), min(burst + 1, BURST_LIMITS[1])
+
+
+def decrease(chunk, burst):
+    return max(chunk // 2, CHUNK_LIMITS[0]), max(burst // 2, BURST_LIMITS[0])
+
+
+class TransferTuner:
+    """ AIMD tuning of chunk and burst sizes of LuaScript file transfers
+
+        Best settings are remembered per port, baudrate and autopilot firmware.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.links = {}
+        try:
+            with open(path, 'r') as f:
+                self.links = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(port, baudrate, firmware_version):
+        return "{}:{}:{}".format(port, baudrate, firmware_version)
+
+    def settings(self, key):
+        with self.lock:
+            link = self.links.get(key)
+        if link is None:
+            return DEFAULT_SETTINGS
+        return link["chunk"], link["burst"]
+
+    def remember(self, key, chunk, burst, rate, latency):
+        with self.lock:
+            self.links[key] = {"chunk": chunk, "burst": burst, "rate": round(rate), "latency": round(latency, 4)}
+            try:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(self.links, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print("Failed to save transfer settings: {}".format(e))
+
+    def forget(self, key):
+        with self.lock:
+            self.links.pop(key, None)
+
+    def write(self, file, data, key, verify=True, retries=3, start=0, confirmed=None):
+        """ Writes data with file.writeImpl in appended segments
+
+            start: length of data the file already holds, only the rest is appended
+            confirmed: function returning the length of data the board confirms to hold, 0 if it can not tell
+            A failed segment halves the settings and resumes from the confirmed length, or restarts the file
+            without one, as a partly appended segment can not be rewritten in place.
+        """
+        data = bytes(data)
+        chunk, burst = self.settings(key)
+        best = None
+        settled = False
+        failures = 0
+        offset = start
+        while True:
+            segment = data[offset:offset + SEGMENT_SIZE]
+            started = time.monotonic()
+            try:
+                file.writeImpl(data=segment, chunkSize=chunk, burstSize=burst, append=offset > 0, verify=verify)
+            except Exception as e:
+                failures += 1
+                if failures > retries:
+                    self.forget(key)
+                    raise
+                print("Transfer failed with chunk {} burst {}: {}".format(chunk, burst, e))
+                chunk, burst = decrease(chunk, burst)
+                best = None
+                settled = True
+                offset = confirmed() if confirmed is not None else 0
+                if offset:
+                    print("Transfer resumed at {} of {} bytes".format(offset, len(data)))
+                continue
+            elapsed = max(time.monotonic() - started, 1e-6)
+            offset += len(segment)
+            rate = len(segment) / elapsed
+            # Every burst waits for its acks once
+            latency = elapsed / max(math.ceil(len(segment) / (chunk * burst)), 1)
+            if len(segment) < SEGMENT_SIZE and best is not None:
+                # Short tail segment says little about throughput
+                break
+            if best is None or rate > best[0]:
+                best = (rate, latency, chunk, burst)
+            elif rate < best[0] * SLOWDOWN_RATIO:
+                settled = True
+                chunk, burst = best[2], best[3]
+            if not settled:
+                chunk, burst = increase(chunk, burst)
+            if offset >= len(data):
+                break
+        if best is not None:
+            rate, latency, best_chunk, best_burst = best
+            self.remember(key, best_chunk, best_burst, rate, latency)
@@ -0,0 +1,58 @@
+import json
+import os
+import threading
+import zlib
+
+
+class UploadLedger:
+    """ Size and CRC32 of LuaScript files last written to each board
+
+        Lets uploads skip files the board already holds, or append only the new tail,
+        when the board reports the same size and CRC32 for the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.boards = {}
+        try:
+            with open(path, 'r') as f:
+                self.boards = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def start_offset(self, board, index, data, remote=None):
+        """ Offset the upload of data has to start from, len(data) if the board holds it already
+
+            remote: (size, crc32) of the file reported by the board, without it the file is written in full
+        """
+        if remote is None:
+            return 0
+        with self.lock:
+            entry = self.boards.get(board, {}).get(str(index))
+        if entry is None or (entry["size"], entry["crc32"]) != tuple(remote):
+            return 0
+        size = entry["size"]
+        if size > len(data) or zlib.crc32(data[:size]) != entry["crc32"]:
+            return 0
+        return size
+
+    def forget(self, board, index):
+        with self.lock:
+            self.boards.get(board, {}).pop(str(index), None)
+        self.save()
+
+    def store(self, board, index, data):
+        with self.lock:
+            self.boards.setdefault(board, {})[str(index)] = {"size": len(data), "crc32": zlib.crc32(data)}
+        self.save()
+
+    def save(self):
+        with self.lock:
+            try:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(self.boards, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print("Failed to save upload ledger: {}".format(e))
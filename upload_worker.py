@@ -0,0 +1,109 @@
+import queue
+import threading
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+def require(result, message):
+    """ Loader uploads report failures by returning False """
+    if not result:
+        raise Exception(message)
+
+
+class UploadJob:
+    """ Named stages of an upload, run one after another by UploadWorker
+
+        stages: (name, function) pairs, a stage fails by raising
+        on_stage_done: called with the job and the stage name after every successful stage
+        on_finish: called with the job once it stops
+        Callbacks go through the worker scheduler, so they run on the thread owning bpy data.
+    """
+
+    def __init__(self, stages, on_stage_done=None, on_finish=None):
+        self.stages = list(stages)
+        self.on_stage_done = on_stage_done
+        self.on_finish = on_finish
+        self.stage = self.stages[0][0] if self.stages else None
+        self.stage_index = 0
+        self.error = None
+        self.finished = False
+        self._cancel = threading.Event()
+
+    @property
+    def total(self):
+        return len(self.stages)
+
+    @property
+    def succeeded(self):
+        return self.finished and self.error is None
+
+    def cancel(self):
+        """ Stops the job before its next stage, a running transfer is not interrupted """
+        self._cancel.set()
+
+    def run(self, schedule):
+        for index, (name, function) in enumerate(self.stages):
+            if self._cancel.is_set():
+                self.error = UploadCancelled("Upload cancelled")
+                break
+            self.stage, self.stage_index = name, index
+            try:
+                function()
+            except Exception as e:
+                self.error = e
+                break
+            if self.on_stage_done:
+                schedule(lambda stage=name: self.on_stage_done(self, stage))
+        self.finished = True
+        if self.on_finish:
+            schedule(lambda: self.on_finish(self))
+
+
+class UploadWorker:
+    """ Runs queued upload jobs of the connected board one at a time in a background thread
+
+        schedule: hands a callback over to the main thread, runs it in place by default
+    """
+
+    def __init__(self, schedule=None):
+        self.schedule = schedule or (lambda callback: callback())
+        self.jobs = queue.Queue()
+        self.current = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, job):
+        self.jobs.put(job)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return job
+
+    @property
+    def busy(self):
+        return self.current is not None or not self.jobs.empty()
+
+    def cancel(self):
+        """ Cancels the running job and drops the queued ones """
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            job.cancel()
+            job.run(self.schedule)
+        current = self.current
+        if current is not None:
+            current.cancel()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            self.current = job
+            try:
+                job.run(self.schedule)
+            finally:
+                self.current = None